@@ -0,0 +1,14 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# 作者：道相抖音@慈悲剪辑，技术问题点关注留言
+
+"""
+格式转换工具命令行入口：python -m format_converter，见cli.py
+"""
+
+import sys
+
+from .cli import main
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,432 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# 作者：道相抖音@慈悲剪辑，技术问题点关注留言
+
+"""
+批量格式转换
+对目录或通配符匹配到的所有文件执行同一种转换操作
+"""
+
+import os
+import glob
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Optional, Callable, Any
+
+from .utils import FormatConverter, ConversionResult, CancellationToken
+from .manifest import ConversionManifest
+
+# 支持线程预算参数(threads)的操作
+THREADED_OPERATIONS = ("convert_video_format",)
+
+# 支持批量执行的操作及其输入文件类型
+BATCH_OPERATIONS = {
+    "convert_image_format": "image",
+    "convert_audio_format": "audio",
+    "convert_video_format": "video",
+    "extract_audio_from_video": "video",
+}
+
+def default_image_workers() -> int:
+    """图片任务的进程数，与CPU核心数相同"""
+    return os.cpu_count() or 1
+
+def default_ffmpeg_workers() -> int:
+    """
+    FFmpeg任务的并发数
+    
+    FFmpeg本身会使用多个线程编码，同时运行太多进程只会互相争抢CPU，
+    因此只使用一半的核心数，且最多4个
+    """
+    return max(1, min(4, (os.cpu_count() or 1) // 2))
+
+def default_ffmpeg_threads(ffmpeg_workers: int) -> int:
+    """
+    每个FFmpeg任务的线程预算
+    
+    把CPU核心平均分给同时运行的任务，避免每个FFmpeg进程都按全部核心开线程
+    
+    Args:
+        ffmpeg_workers: FFmpeg任务并发数
+    
+    Returns:
+        int: 每个任务的线程数，只有一个任务并发时返回0（由FFmpeg决定）
+    """
+    if ffmpeg_workers <= 1:
+        return 0
+    return max(1, (os.cpu_count() or 1) // ffmpeg_workers)
+
+def is_batch_input(path: str) -> bool:
+    """
+    判断输入是否为批量输入（目录或通配符）
+    
+    Args:
+        path: 输入路径
+    
+    Returns:
+        bool: 是目录或包含通配符时返回True
+    """
+    return os.path.isdir(path) or glob.has_magic(path)
+
+def find_input_files(pattern: str, file_type: str = "", recursive: bool = False) -> List[str]:
+    """
+    查找批量输入文件
+    
+    Args:
+        pattern: 目录路径或通配符，例如"D:/videos/*.mkv"
+        file_type: 文件类型("video"/"audio"/"image")，输入为目录时按扩展名过滤
+        recursive: 输入为目录时是否包含子目录
+    
+    Returns:
+        list: 排序后的文件路径列表
+    """
+    if os.path.isdir(pattern):
+        extensions = {
+            "video": FormatConverter.get_supported_video_formats,
+            "audio": FormatConverter.get_supported_audio_formats,
+            "image": FormatConverter.get_supported_image_formats,
+        }.get(file_type, lambda: [])()
+        sub_pattern = os.path.join("**", "*") if recursive else "*"
+        files = glob.glob(os.path.join(pattern, sub_pattern), recursive=recursive)
+        if extensions:
+            files = [f for f in files if os.path.splitext(f)[1].lower() in extensions]
+    else:
+        files = glob.glob(pattern, recursive=True)
+    
+    return sorted(f for f in files if os.path.isfile(f))
+
+def _path_key(path: str) -> str:
+    """用于比较的规范化路径（不区分大小写的文件系统上忽略大小写）"""
+    return os.path.normcase(os.path.abspath(path))
+
+def plan_output_paths(input_files: List[str], input_root: str, output_dir: str, suffix: str) -> List[str]:
+    """
+    为一批输入文件生成互不冲突的输出路径，保留相对于输入根目录的子目录结构
+    
+    只按文件名（不含扩展名）生成输出路径时，同名不同扩展名的输入（例如a.png和a.jpg）会写入
+    同一个输出文件，甚至覆盖另一个输入文件；冲突时在输出文件名中保留源扩展名(a.png.jpg)，
+    仍然冲突时再加序号。输出路径不会与任何输入文件或其他输出相同
+    
+    Args:
+        input_files: 输入文件路径列表
+        input_root: 输入根目录
+        output_dir: 输出目录
+        suffix: 追加在文件名后的输出扩展名或后缀，例如".mp3"或"_frames"
+    
+    Returns:
+        list: 与input_files一一对应的输出路径
+    """
+    reserved = {_path_key(path) for path in input_files}
+    output_paths = []
+    for input_path in input_files:
+        stem, source_ext = os.path.splitext(os.path.abspath(input_path))
+        base = os.path.join(output_dir, os.path.relpath(stem, input_root))
+        output_path = base + suffix
+        index = 1
+        while _path_key(output_path) in reserved:
+            output_path = base + source_ext + (f"_{index}" if index > 1 else "") + suffix
+            index += 1
+        reserved.add(_path_key(output_path))
+        output_paths.append(output_path)
+    return output_paths
+
+class BatchResult:
+    """批量转换结果，记录每个文件的结果并汇总吞吐量"""
+    
+    def __init__(self):
+        """初始化批量转换结果"""
+        self.results = []
+        self.start_time = time.time()
+        self.end_time = None
+        # 图片任务按子进程号记录的吞吐量，见FormatConverter.convert_image_jobs
+        self.workers = {}
+        self._lock = threading.Lock()
+    
+    def add(self, input_path: str, output_path: str, result: ConversionResult, elapsed: float,
+            worker: Optional[int] = None, duration: float = 0.0):
+        """
+        记录单个文件的转换结果
+        
+        Args:
+            input_path: 输入文件路径
+            output_path: 输出文件路径
+            result: 转换结果
+            elapsed: 耗时（秒）
+            worker: 执行转换的子进程号
+            duration: 输入媒体的时长（秒），图片为0
+        
+        Returns:
+            dict: 记录的结果项
+        """
+        try:
+            size = os.path.getsize(input_path)
+        except OSError:
+            size = 0
+        
+        item = {
+            "input": input_path,
+            "output": output_path,
+            "success": bool(result),
+            "cancelled": result.cancelled,
+            "skipped": result.skipped,
+            "message": result.message,
+            "elapsed": elapsed,
+            "size": size,
+            "worker": worker,
+            "duration": duration,
+        }
+        with self._lock:
+            self.results.append(item)
+        return item
+    
+    def finish(self):
+        """标记批量转换结束"""
+        self.end_time = time.time()
+    
+    @property
+    def elapsed(self) -> float:
+        """总耗时（秒）"""
+        return (self.end_time or time.time()) - self.start_time
+    
+    @property
+    def succeeded(self) -> List[Dict[str, Any]]:
+        """成功的结果项"""
+        return [r for r in self.results if r["success"]]
+    
+    @property
+    def skipped(self) -> List[Dict[str, Any]]:
+        """因输出已是最新而跳过的结果项"""
+        return [r for r in self.results if r["skipped"]]
+    
+    @property
+    def failed(self) -> List[Dict[str, Any]]:
+        """失败的结果项（不含被取消的）"""
+        return [r for r in self.results if not r["success"] and not r["cancelled"]]
+    
+    @property
+    def cancelled(self) -> List[Dict[str, Any]]:
+        """被取消的结果项"""
+        return [r for r in self.results if r["cancelled"]]
+    
+    def throughput(self) -> Dict[str, float]:
+        """
+        计算总吞吐量（不含跳过的文件）
+        
+        Returns:
+            dict: files_per_second为每秒处理文件数，mb_per_second为每秒处理的输入数据量(MB)，
+                  media_seconds_per_second为每秒处理的音视频时长（秒）
+        """
+        elapsed = max(self.elapsed, 1e-6)
+        converted = [r for r in self.succeeded if not r["skipped"]]
+        total_size = sum(r["size"] for r in converted)
+        total_duration = sum(r["duration"] for r in converted)
+        return {
+            "files_per_second": len(converted) / elapsed,
+            "mb_per_second": total_size / (1024 * 1024) / elapsed,
+            "media_seconds_per_second": total_duration / elapsed,
+        }
+    
+    def summary(self) -> str:
+        """
+        生成结果摘要文本
+        
+        Returns:
+            str: 摘要，包括成功/失败数量、吞吐量和失败文件列表
+        """
+        throughput = self.throughput()
+        lines = [
+            f"共 {len(self.results)} 个文件：成功 {len(self.succeeded)}（跳过未变化的 {len(self.skipped)}），"
+            f"失败 {len(self.failed)}，取消 {len(self.cancelled)}",
+            f"耗时 {self.elapsed:.1f} 秒，{throughput['files_per_second']:.2f} 个文件/秒，"
+            f"{throughput['mb_per_second']:.2f} MB/秒",
+        ]
+        if throughput["media_seconds_per_second"] > 0:
+            lines[-1] += f"，每秒处理 {throughput['media_seconds_per_second']:.1f} 秒音视频"
+        if len(self.workers) > 1:
+            lines.append("各进程吞吐量：")
+            for worker, stats in sorted(self.workers.items()):
+                lines.append(
+                    f"  进程 {worker}：{stats['files']} 个文件，{stats['files_per_second']:.2f} 个文件/秒，"
+                    f"{stats['mb_per_second']:.2f} MB/秒"
+                )
+        if self.failed:
+            lines.append("失败的文件：")
+            for item in self.failed[:20]:
+                lines.append(f"  {item['input']}" + (f"（{item['message']}）" if item["message"] else ""))
+            if len(self.failed) > 20:
+                lines.append(f"  ... 另有 {len(self.failed) - 20} 个")
+        return "\n".join(lines)
+
+def get_input_root(input_pattern: str, input_files: List[str]) -> str:
+    """
+    获取批量输入的根目录，用于在输出目录中保留子目录结构
+    
+    Args:
+        input_pattern: 输入目录或通配符
+        input_files: 匹配到的输入文件
+    
+    Returns:
+        str: 输入为目录时为该目录，否则为所有输入文件所在目录的公共父目录
+    """
+    if os.path.isdir(input_pattern):
+        return os.path.abspath(input_pattern)
+    if not input_files:
+        return ""
+    return os.path.commonpath([os.path.dirname(os.path.abspath(f)) for f in input_files])
+
+class BatchConverter:
+    """批量转换器，使用有界的工作池并发执行转换"""
+    
+    def __init__(self, converter: Optional[FormatConverter] = None,
+                 image_workers: int = 0, ffmpeg_workers: int = 0, ffmpeg_threads: int = 0):
+        """
+        初始化批量转换器
+        
+        Args:
+            converter: 格式转换器实例，用于FFmpeg任务
+            image_workers: 图片任务进程数，0表示使用CPU核心数
+            ffmpeg_workers: FFmpeg任务并发数，0表示自动选择
+            ffmpeg_threads: 每个FFmpeg任务的线程预算，0表示按核心数和并发数自动分配
+        """
+        self.converter = converter or FormatConverter()
+        self.image_workers = image_workers or default_image_workers()
+        self.ffmpeg_workers = ffmpeg_workers or default_ffmpeg_workers()
+        self.ffmpeg_threads = ffmpeg_threads or default_ffmpeg_threads(self.ffmpeg_workers)
+    
+    def run(self, operation: str, input_pattern: str, output_dir: str, output_ext: str,
+            options: Optional[Dict[str, Any]] = None, recursive: bool = False,
+            file_callback: Callable[[Dict[str, Any], int, int], None] = None,
+            progress_callback: Callable[[str, float], None] = None,
+            cancel_token: Optional[CancellationToken] = None,
+            manifest: Optional[ConversionManifest] = None) -> BatchResult:
+        """
+        对所有匹配的文件执行转换
+        
+        Args:
+            operation: 操作名称，见BATCH_OPERATIONS
+            input_pattern: 输入目录或通配符
+            output_dir: 输出目录
+            output_ext: 输出扩展名，例如".mp3"
+            options: 传给转换方法的参数
+            recursive: 输入为目录时是否包含子目录
+            file_callback: 每完成一个文件调用一次，参数为(结果项, 已完成数, 总数)
+            progress_callback: FFmpeg任务的单个文件进度回调，参数为(输入路径, 进度)，进度为0-1的
+                               浮点数（转换过程中为FFmpegProgress），可能在多个线程中同时调用
+            cancel_token: 取消令牌，取消后不再启动新任务，并终止正在运行的FFmpeg任务
+            manifest: 转换清单，提供时跳过输入和参数都未变化且输出仍存在的文件，
+                      并记录本次成功的转换
+        
+        Returns:
+            BatchResult: 批量转换结果
+        """
+        if operation not in BATCH_OPERATIONS:
+            raise ValueError(f"不支持批量执行的操作: {operation}")
+        
+        options = dict(options or {})
+        input_files = find_input_files(input_pattern, BATCH_OPERATIONS[operation], recursive)
+        input_root = get_input_root(input_pattern, input_files)
+        
+        # 提交任务前一次性计算所有输出路径，避免输出之间或输出与输入冲突
+        if not output_ext.startswith("."):
+            output_ext = "." + output_ext
+        output_paths = plan_output_paths(input_files, input_root, output_dir, output_ext)
+        jobs = list(zip(input_files, output_paths))
+        for _, output_path in jobs:
+            os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        
+        batch_result = BatchResult()
+        total = len(jobs)
+        done = 0
+        
+        # 跳过输出已是最新的任务
+        if manifest is not None:
+            pending_jobs = []
+            for input_path, output_path in jobs:
+                if manifest.is_up_to_date(operation, input_path, output_path, options):
+                    item = batch_result.add(input_path, output_path, ConversionResult(True, skipped=True), 0.0)
+                    done += 1
+                    if file_callback:
+                        file_callback(item, done, total)
+                else:
+                    pending_jobs.append((input_path, output_path))
+            jobs = pending_jobs
+        
+        if operation == "convert_image_format":
+            # Pillow的解码和编码在子进程中执行，不受GIL限制；任务按块提交以减少进程间通信
+            def iter_image_outcomes():
+                items = self.converter.convert_image_jobs(
+                    jobs, options, workers=self.image_workers,
+                    cancel_token=cancel_token, worker_stats=batch_result.workers
+                )
+                try:
+                    for item in items:
+                        result = ConversionResult(item["success"], cancelled=item["cancelled"], message=item["message"])
+                        yield item["input"], item["output"], result, item["elapsed"], item["worker"], 0.0
+                finally:
+                    items.close()
+            
+            outcomes = iter_image_outcomes()
+            unregister = lambda: None
+            executor = None
+        else:
+            method = getattr(self.converter, operation)
+            # 线程预算只影响执行方式，不计入转换清单的参数摘要
+            run_options = dict(options)
+            if operation in THREADED_OPERATIONS and self.ffmpeg_threads:
+                run_options.setdefault("threads", self.ffmpeg_threads)
+            
+            def run_job(input_path, output_path):
+                start = time.time()
+                file_progress = (lambda progress: progress_callback(input_path, progress)) if progress_callback else None
+                result = method(input_path, output_path, progress_callback=file_progress,
+                                cancel_token=cancel_token, **run_options)
+                elapsed = time.time() - start
+                # 时长在计算进度时已经查询过，这里通常命中媒体信息缓存
+                duration = self.converter.get_media_info(input_path).get("duration", 0) if result else 0.0
+                return bool(result), result.cancelled, result.message, elapsed, duration
+            
+            executor = ThreadPoolExecutor(max_workers=self.ffmpeg_workers)
+            futures = {
+                executor.submit(run_job, input_path, output_path): (input_path, output_path)
+                for input_path, output_path in jobs
+            }
+            
+            unregister = cancel_token.register(
+                lambda: [future.cancel() for future in futures]
+            ) if cancel_token else (lambda: None)
+            
+            def iter_outcomes():
+                for future in as_completed(futures):
+                    input_path, output_path = futures[future]
+                    if future.cancelled():
+                        yield input_path, output_path, ConversionResult(False, cancelled=True, message="转换已取消"), 0.0, None, 0.0
+                        continue
+                    try:
+                        success, cancelled, message, elapsed, duration = future.result()
+                        result = ConversionResult(success, cancelled=cancelled, message=message)
+                    except Exception as e:
+                        result, elapsed, duration = ConversionResult(False, message=str(e)), 0.0, 0.0
+                    yield input_path, output_path, result, elapsed, None, duration
+            
+            outcomes = iter_outcomes()
+        
+        try:
+            for input_path, output_path, result, elapsed, worker, duration in outcomes:
+                if result and manifest is not None:
+                    manifest.record(operation, input_path, output_path, options)
+                
+                item = batch_result.add(input_path, output_path, result, elapsed, worker, duration)
+                done += 1
+                if file_callback:
+                    file_callback(item, done, total)
+        finally:
+            unregister()
+            outcomes.close()
+            if executor is not None:
+                executor.shutdown(wait=True)
+            if manifest is not None:
+                manifest.save()
+            batch_result.finish()
+        
+        return batch_result
@@ -0,0 +1,775 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# 作者：道相抖音@慈悲剪辑，技术问题点关注留言
+
+"""
+格式转换基准测试
+用FFmpeg的testsrc滤镜生成合成测试片段，测量各编码器在不同编码档位下的耗时和输出体积，
+以及分段并行转换相对普通转换的耗时；用固定随机种子生成的大图测量图片处理的耗时和峰值内存。
+suite模式在本地生成全部测试素材（testsrc视频、sine音频、固定种子的各尺寸图片），按参数矩阵
+测量FormatConverter的每种操作，输出可比较的JSON报告，并可与之前保存的基准报告比较找出退化
+
+用法：
+    python -m format_converter.benchmark
+    python -m format_converter.benchmark --duration 20 --size 1920x1080 --threads 4
+    python -m format_converter.benchmark --mode segments --duration 600 --segments 4
+    python -m format_converter.benchmark --mode images
+    python -m format_converter.benchmark --mode suite --report baseline.json
+    python -m format_converter.benchmark --mode suite --baseline baseline.json --report current.json
+    python -m format_converter.benchmark --mode suite --cases image,image_sizes --repeat 5
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import random
+import platform
+import itertools
+import statistics
+import subprocess
+import multiprocessing
+from typing import List, Dict, Tuple, Iterable, Any
+
+import PIL
+from PIL import Image
+
+from .utils import FormatConverter, VideoTimestampExtractor
+
+try:
+    import resource
+except ImportError:
+    # Windows没有resource模块，不统计峰值内存
+    resource = None
+
+# 默认参与测试的编码器
+DEFAULT_ENCODERS = ("libx264", "libx265", "libvpx-vp9")
+
+def generate_test_clip(converter: FormatConverter, output_path: str, duration: int = 10,
+                       size: str = "1280x720", rate: int = 30) -> bool:
+    """
+    生成合成测试片段（testsrc画面 + 正弦波音频）
+    
+    片段用高质量H.264保存，解码开销小，测量结果主要反映编码器本身
+    
+    Args:
+        converter: 格式转换器实例
+        output_path: 输出文件路径
+        duration: 时长（秒）
+        size: 分辨率，格式为"宽x高"
+        rate: 帧率
+    
+    Returns:
+        bool: 是否生成成功
+    """
+    cmd = [
+        converter.ffmpeg_path, "-y",
+        "-f", "lavfi", "-i", f"testsrc=duration={duration}:size={size}:rate={rate}",
+        "-f", "lavfi", "-i", f"sine=frequency=1000:duration={duration}",
+        "-c:v", "libx264", "-preset", "ultrafast", "-crf", "10", "-pix_fmt", "yuv420p",
+        "-c:a", "aac", "-shortest",
+        output_path
+    ]
+    process = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if process.returncode != 0:
+        print(f"生成测试片段失败: {process.stderr[-500:]}")
+        return False
+    return True
+
+def benchmark_profiles(converter: FormatConverter, clip_path: str, work_dir: str,
+                       encoders=DEFAULT_ENCODERS, profiles=FormatConverter.VIDEO_PROFILES,
+                       threads: int = 0) -> List[Dict[str, Any]]:
+    """
+    对每个编码器和档位的组合各执行一次转换
+    
+    Args:
+        converter: 格式转换器实例
+        clip_path: 测试片段路径
+        work_dir: 输出文件目录
+        encoders: 参与测试的编码器
+        profiles: 参与测试的档位
+        threads: 线程预算，0表示由FFmpeg决定
+    
+    Returns:
+        list: 每个组合的结果，包括耗时、输出体积和实时倍数
+    """
+    duration = converter.get_media_info(clip_path).get("duration", 0)
+    results = []
+    
+    for encoder in encoders:
+        extension = ".webm" if encoder.startswith("libvpx") else ".mp4"
+        for profile in profiles:
+            output_path = os.path.join(work_dir, f"{encoder}_{profile}{extension}")
+            start = time.perf_counter()
+            result = converter.convert_video_format(
+                clip_path, output_path, video_codec=encoder,
+                profile=profile, threads=threads, allow_stream_copy=False
+            )
+            elapsed = time.perf_counter() - start
+            
+            results.append({
+                "encoder": encoder,
+                "profile": profile,
+                "threads": threads,
+                "success": bool(result),
+                "seconds": round(elapsed, 3),
+                "size": os.path.getsize(output_path) if result else 0,
+                "realtime": round(duration / elapsed, 2) if result and elapsed > 0 else 0,
+            })
+    
+    return results
+
+def benchmark_segments(converter: FormatConverter, clip_path: str, work_dir: str,
+                       encoder: str = "libx264", profile: str = "balanced",
+                       segments: int = 0) -> List[Dict[str, Any]]:
+    """
+    比较普通转换和分段并行转换的耗时，并检查两者输出的时长是否一致
+    
+    Args:
+        converter: 格式转换器实例
+        clip_path: 测试片段路径
+        work_dir: 输出文件目录
+        encoder: 视频编码器
+        profile: 编码档位
+        segments: 分段并行的进程数，0表示CPU核心数
+    
+    Returns:
+        list: 普通转换和分段并行转换的结果
+    """
+    segments = segments or os.cpu_count() or 1
+    duration = converter.get_media_info(clip_path).get("duration", 0)
+    extension = ".webm" if encoder.startswith("libvpx") else ".mp4"
+    results = []
+    
+    for mode, parallel_segments in (("serial", 0), ("segmented", segments)):
+        output_path = os.path.join(work_dir, f"{mode}_{encoder}{extension}")
+        start = time.perf_counter()
+        result = converter.convert_video_format(
+            clip_path, output_path, video_codec=encoder, profile=profile,
+            allow_stream_copy=False, parallel_segments=parallel_segments
+        )
+        elapsed = time.perf_counter() - start
+        
+        output_info = converter.get_media_info(output_path) if result else {}
+        results.append({
+            "encoder": encoder,
+            "profile": mode,
+            "segments": result.details.get("segments", 0) if result else 0,
+            "success": bool(result),
+            "seconds": round(elapsed, 3),
+            "size": os.path.getsize(output_path) if result else 0,
+            "realtime": round(duration / elapsed, 2) if result and elapsed > 0 else 0,
+            "duration": output_info.get("duration", 0),
+            "streams": [stream.get("codec") for stream in output_info.get("streams", [])],
+        })
+    
+    return results
+
+def generate_test_image(output_path: str, size: Tuple[int, int] = (6000, 4000), seed: int = 0):
+    """
+    生成合成测试图片
+    
+    用固定种子生成小尺寸随机色块再放大，叠加渐变，内容可复现且压缩率接近照片
+    
+    Args:
+        output_path: 输出图片路径，按扩展名决定格式
+        size: 图片尺寸，默认6000x4000（2400万像素）
+        seed: 随机种子
+    """
+    rng = random.Random(seed)
+    small_size = (size[0] // 50, size[1] // 50)
+    data = bytes(rng.getrandbits(8) for _ in range(small_size[0] * small_size[1] * 3))
+    small = Image.frombytes("RGB", small_size, data)
+    image = small.resize(size, Image.BICUBIC)
+    gradient = Image.linear_gradient("L").resize(size).convert("RGB")
+    image = Image.blend(image, gradient, 0.3)
+    image.save(output_path, quality=92)
+
+def _legacy_image_pipeline(input_path: str, output_path: str, quality: int = 90,
+                           resize: Tuple[int, int] = None, rotate: int = 0,
+                           flip: bool = False, mirror: bool = False):
+    """优化前的图片处理流程：完整解码后缩放，旋转、翻转、镜像各做一次，用于对比"""
+    img = Image.open(input_path)
+    if resize:
+        img = img.resize(resize, Image.LANCZOS)
+    if rotate:
+        img = img.rotate(-rotate, expand=True)
+    if flip:
+        img = img.transpose(Image.FLIP_TOP_BOTTOM)
+    if mirror:
+        img = img.transpose(Image.FLIP_LEFT_RIGHT)
+    img.save(output_path, quality=quality, optimize=True)
+
+def _run_image_case(variant: str, input_path: str, output_path: str, options: Dict[str, Any]) -> Dict[str, float]:
+    """在独立子进程中执行一次图片处理，返回耗时和峰值内存"""
+    start_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else 0
+    start = time.perf_counter()
+    if variant == "legacy":
+        _legacy_image_pipeline(input_path, output_path, **options)
+    else:
+        FormatConverter(use_probe_cache=False).convert_image_format(input_path, output_path, **options)
+    elapsed = time.perf_counter() - start
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else 0
+    # Linux下ru_maxrss单位为KB，macOS下为字节
+    unit = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return {"seconds": elapsed, "peak_rss_mb": peak_rss / unit, "start_rss_mb": start_rss / unit}
+
+def benchmark_images(work_dir: str, repeat: int = 3, size: Tuple[int, int] = (6000, 4000)) -> List[Dict[str, Any]]:
+    """
+    比较优化前后的图片处理流程
+    
+    测试图片和每次测量都在新的子进程中执行：子进程会继承父进程的峰值内存(ru_maxrss)，
+    父进程不能处理大图；耗时取多次测量的中位数
+    
+    Args:
+        work_dir: 测试文件目录
+        repeat: 每个场景的测量次数
+        size: 测试图片尺寸
+    
+    Returns:
+        list: 每个场景和流程的结果
+    """
+    context = multiprocessing.get_context("spawn")
+    sources = {}
+    for extension in (".jpg", ".png"):
+        sources[extension] = os.path.join(work_dir, f"source_{size[0]}x{size[1]}{extension}")
+        with context.Pool(1) as pool:
+            pool.apply(generate_test_image, (sources[extension], size))
+    
+    cases = [
+        ("JPEG缩小到1/4", ".jpg", {"resize": (size[0] // 4, size[1] // 4)}),
+        ("JPEG缩略图+旋转镜像", ".jpg", {"resize": (size[0] // 10, size[1] // 10), "rotate": 90, "mirror": True}),
+        ("JPEG旋转翻转镜像", ".jpg", {"rotate": 270, "flip": True, "mirror": True}),
+        ("PNG缩小到1/4", ".png", {"resize": (size[0] // 4, size[1] // 4)}),
+    ]
+    
+    results = []
+    for name, extension, options in cases:
+        for variant in ("legacy", "optimized"):
+            runs = []
+            for i in range(repeat):
+                output_path = os.path.join(work_dir, f"{variant}_{i}.jpg")
+                with context.Pool(1) as pool:
+                    runs.append(pool.apply(_run_image_case, (variant, sources[extension], output_path, options)))
+            results.append({
+                "case": name,
+                "variant": variant,
+                "seconds": round(statistics.median(run["seconds"] for run in runs), 3),
+                "peak_rss_mb": round(max(run["peak_rss_mb"] for run in runs), 1),
+                "rss_growth_mb": round(max(run["peak_rss_mb"] - run["start_rss_mb"] for run in runs), 1),
+            })
+    return results
+
+def format_image_results(results: List[Dict[str, Any]]) -> str:
+    """
+    把图片基准测试结果格式化为文本表格
+    
+    Args:
+        results: benchmark_images返回的结果
+    
+    Returns:
+        str: 表格文本
+    """
+    lines = [f"{'场景':<16}{'流程':<12}{'耗时(秒)':>10}{'峰值内存(MB)':>14}{'内存增长(MB)':>14}"]
+    for item in results:
+        lines.append(
+            f"{item['case']:<16}{item['variant']:<12}{item['seconds']:>10.3f}"
+            f"{item['peak_rss_mb']:>14.1f}{item['rss_growth_mb']:>14.1f}"
+        )
+    return "\n".join(lines)
+
+def format_results(results: List[Dict[str, Any]]) -> str:
+    """
+    把结果格式化为文本表格
+    
+    Args:
+        results: benchmark_profiles返回的结果
+    
+    Returns:
+        str: 表格文本
+    """
+    lines = [f"{'编码器':<12}{'档位':<10}{'耗时(秒)':>10}{'体积(KB)':>12}{'实时倍数':>10}"]
+    for item in results:
+        if not item["success"]:
+            lines.append(f"{item['encoder']:<12}{item['profile']:<10}{'失败':>10}")
+            continue
+        lines.append(
+            f"{item['encoder']:<12}{item['profile']:<10}{item['seconds']:>10.2f}"
+            f"{item['size'] / 1024:>12.1f}{item['realtime']:>10.2f}"
+        )
+    return "\n".join(lines)
+
+def generate_test_audio(converter: FormatConverter, output_path: str, duration: int = 30) -> bool:
+    """
+    生成合成测试音频（两个声道分别为440Hz和660Hz的正弦波）
+    
+    Args:
+        converter: 格式转换器实例
+        output_path: 输出文件路径，按扩展名决定格式
+        duration: 时长（秒）
+    
+    Returns:
+        bool: 是否生成成功
+    """
+    cmd = [
+        converter.ffmpeg_path, "-y",
+        "-f", "lavfi", "-i", f"sine=frequency=440:duration={duration}:sample_rate=48000",
+        "-f", "lavfi", "-i", f"sine=frequency=660:duration={duration}:sample_rate=48000",
+        "-filter_complex", "[0:a][1:a]amerge=inputs=2",
+        output_path
+    ]
+    process = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if process.returncode != 0:
+        print(f"生成测试音频失败: {process.stderr[-500:]}")
+        return False
+    return True
+
+# 基准测试套件的测试素材：名称: (类型, 尺寸或分辨率)，视频和音频的时长由--duration决定
+SUITE_MEDIA = {
+    "clip_720p": ("video", "1280x720"),
+    "clip_360p": ("video", "640x360"),
+    "audio": ("audio", ""),
+    "image_640": ("image", (640, 480)),
+    "image_1080p": ("image", (1920, 1080)),
+    "image_4000": ("image", (4000, 3000)),
+    "image_1080p_png": ("image", (1920, 1080)),
+    "image_set": ("images", (640, 480)),
+}
+# image_set包含的图片数
+SUITE_IMAGE_SET_SIZE = 32
+
+# 基准测试套件的场景：名称: (操作, 输入素材, 输出方式, 输出扩展名, 参数矩阵, 固定参数)
+# 参数矩阵中各参数的取值做笛卡尔积，每个组合是一个测试项；输出方式同命令行工具：
+# "file"为输出文件，"dir"为输出目录（通过output_dir参数传入），None为不生成文件
+SUITE_CASES = {
+    "media_info": ("get_media_info", ("clip_720p", "audio"), None, "", {}, {}),
+    "gif": ("convert_mp4_to_gif", ("clip_360p",), "file", ".gif",
+            {"engine": ("pil", "ffmpeg"), "fps": (10, 15), "scale": (0.5, 1.0)}, {"duration": 5}),
+    "video": ("convert_video_format", ("clip_720p",), "file", ".mkv",
+              {"video_codec": ("libx264", "libvpx-vp9"), "profile": ("fastest", "balanced")},
+              {"allow_stream_copy": False}),
+    # 片段短于SEGMENT_MIN_SECONDS的两倍时不分段，比较分段并行需要--duration 60以上
+    "video_segments": ("convert_video_format", ("clip_720p",), "file", ".mp4",
+                       {"parallel_segments": (0, 4)},
+                       {"video_codec": "libx264", "profile": "balanced", "allow_stream_copy": False}),
+    "audio": ("convert_audio_format", ("audio",), "file", "",
+              {"ext": (".mp3", ".ogg", ".flac"), "normalize_loudness": (False, True)}, {}),
+    "extract_audio": ("extract_audio_from_video", ("clip_720p",), "file", "",
+                      {"ext": (".mp3", ".wav")}, {}),
+    "loudness": ("measure_loudness", ("audio",), None, "", {}, {}),
+    "image": ("convert_image_format", ("image_640", "image_1080p", "image_4000", "image_1080p_png"), "file", "",
+              {"ext": (".jpg", ".webp", ".png"), "quality": (75, 90), "resize": (None, (320, 240))}, {}),
+    "image_target_size": ("convert_image_format", ("image_1080p", "image_4000"), "file", "",
+                          {"ext": (".jpg", ".webp")}, {"target_size": 100 * 1024}),
+    "image_sizes": ("convert_image_sizes", ("image_4000",), "dir", "", {}, {}),
+    "image_batch": ("convert_images", ("image_set",), "dir", "",
+                    {"output_ext": (".jpg", ".webp"), "workers": (1, 0)}, {}),
+    "frames_at": ("extract_frames_at", ("clip_720p",), "dir", "", {},
+                  {"timestamps": [0.5, 2.5, 4.5, 6.5, 8.5]}),
+    "contact_sheet": ("create_contact_sheet", ("clip_720p",), "file", ".jpg",
+                      {"keyframes_only": (False, True)}, {}),
+}
+
+def generate_suite_media(converter: FormatConverter, work_dir: str, duration: int = 10,
+                         seed: int = 0) -> Dict[str, Dict[str, Any]]:
+    """
+    生成基准测试套件使用的全部素材，内容只取决于参数，每次生成的结果相同
+    
+    没有FFmpeg时只生成图片素材
+    
+    Args:
+        converter: 格式转换器实例
+        work_dir: 素材目录
+        duration: 视频和音频的时长（秒）
+        seed: 生成图片的随机种子
+    
+    Returns:
+        dict: 素材名称对应的{"path": 路径（image_set为路径列表）, "duration": 媒体时长}
+    """
+    media = {}
+    for index, (name, (kind, size)) in enumerate(sorted(SUITE_MEDIA.items())):
+        if kind == "video":
+            if not converter.is_ffmpeg_available():
+                continue
+            path = os.path.join(work_dir, f"{name}.mp4")
+            if generate_test_clip(converter, path, duration, size):
+                media[name] = {"path": path, "duration": float(duration)}
+        elif kind == "audio":
+            if not converter.is_ffmpeg_available():
+                continue
+            path = os.path.join(work_dir, f"{name}.wav")
+            if generate_test_audio(converter, path, duration):
+                media[name] = {"path": path, "duration": float(duration)}
+        elif kind == "image":
+            extension = ".png" if name.endswith("_png") else ".jpg"
+            path = os.path.join(work_dir, f"{name}{extension}")
+            generate_test_image(path, size, seed + index)
+            media[name] = {"path": path, "duration": 0.0}
+        else:
+            set_dir = os.path.join(work_dir, name)
+            os.makedirs(set_dir, exist_ok=True)
+            paths = []
+            for i in range(SUITE_IMAGE_SET_SIZE):
+                path = os.path.join(set_dir, f"{i:03d}.jpg")
+                generate_test_image(path, size, seed + 1000 + i)
+                paths.append(path)
+            media[name] = {"path": paths, "duration": 0.0}
+    return media
+
+def expand_matrix(matrix: Dict[str, Iterable[Any]]) -> List[Dict[str, Any]]:
+    """
+    展开参数矩阵，按参数名排序以保证顺序稳定
+    
+    Args:
+        matrix: 参数名对应的取值列表
+    
+    Returns:
+        list: 每个参数组合，矩阵为空时返回一个空组合
+    """
+    names = sorted(matrix)
+    return [dict(zip(names, values)) for values in itertools.product(*(matrix[name] for name in names))]
+
+def _format_param(value: Any) -> str:
+    """把参数值格式化为测试项编号的一部分"""
+    if isinstance(value, (tuple, list)):
+        return "x".join(str(v) for v in value)
+    return str(value)
+
+def _case_id(case: str, input_name: str, params: Dict[str, Any]) -> str:
+    """测试项编号，例如image/image_1080p[ext=.webp,quality=75,resize=None]，用于和基准报告对应"""
+    text = ",".join(f"{name}={_format_param(value)}" for name, value in sorted(params.items()))
+    return f"{case}/{input_name}[{text}]"
+
+def _output_size(path: str) -> int:
+    """输出文件的大小，目录时为其中所有文件的大小之和"""
+    if os.path.isdir(path):
+        return sum(
+            os.path.getsize(os.path.join(root, name))
+            for root, _, names in os.walk(path) for name in names
+        )
+    return os.path.getsize(path) if os.path.isfile(path) else 0
+
+def _run_suite_case(target, operation: str, input_path: Any, output_path: str,
+                    output_kind: str, options: Dict[str, Any]) -> bool:
+    """执行一次测试项，返回是否成功"""
+    method = getattr(target, operation)
+    if output_kind == "dir":
+        shutil.rmtree(output_path, ignore_errors=True)
+        os.makedirs(output_path)
+        options = dict(options, output_dir=output_path)
+    elif output_kind == "file":
+        options = dict(options, output_path=output_path)
+    
+    if operation == "convert_images":
+        items = list(method(input_path, **options))
+        return bool(items) and all(item["success"] for item in items)
+    return bool(method(input_path, **options))
+
+def run_suite(converter: FormatConverter, media: Dict[str, Dict[str, Any]], work_dir: str,
+              cases: Iterable[str] = None, repeat: int = 3) -> List[Dict[str, Any]]:
+    """
+    按参数矩阵执行基准测试套件
+    
+    每个测试项执行repeat次，耗时取中位数；子进程启动延迟、峰值内存和Python侧各阶段耗时
+    取自中位数那次执行的性能记录（见telemetry模块）。缺少素材的测试项（例如没有FFmpeg）跳过
+    
+    Args:
+        converter: 格式转换器实例
+        media: generate_suite_media返回的素材
+        work_dir: 输出文件目录
+        cases: 要执行的场景名称，默认为全部场景
+        repeat: 每个测试项的执行次数
+    
+    Returns:
+        list: 每个测试项的结果
+    """
+    extractor = VideoTimestampExtractor(converter)
+    records = []
+    converter.add_telemetry_sink(records.append)
+    output_root = os.path.join(work_dir, "output")
+    os.makedirs(output_root, exist_ok=True)
+    results = []
+    try:
+        for case in (cases or SUITE_CASES):
+            operation, input_names, output_kind, extension, matrix, fixed = SUITE_CASES[case]
+            target = converter if hasattr(converter, operation) else extractor
+            for input_name in input_names:
+                if input_name not in media:
+                    continue
+                for params in expand_matrix(matrix):
+                    case_id = _case_id(case, input_name, params)
+                    options = dict(fixed, **params)
+                    ext = options.pop("ext", extension)
+                    output_path = os.path.join(output_root, f"{len(results):04d}{ext}")
+                    
+                    runs = []
+                    for _ in range(repeat):
+                        del records[:]
+                        start = time.perf_counter()
+                        try:
+                            success = _run_suite_case(target, operation, media[input_name]["path"],
+                                                      output_path, output_kind, options)
+                        except Exception as e:
+                            print(f"{case_id} 出错: {str(e)}")
+                            success = False
+                        elapsed = time.perf_counter() - start
+                        top = [r for r in records if r["operation"] == operation and r["parent"] is None]
+                        runs.append((elapsed, success, top[-1] if top else {}))
+                        if not success:
+                            break
+                    
+                    seconds = statistics.median(run[0] for run in runs)
+                    median_run = sorted(runs, key=lambda run: run[0])[len(runs) // 2]
+                    record = median_run[2]
+                    success = all(run[1] for run in runs)
+                    duration = media[input_name]["duration"]
+                    if "duration" in options and duration:
+                        duration = min(duration, options["duration"])
+                    results.append({
+                        "id": case_id,
+                        "case": case,
+                        "operation": operation,
+                        "input": input_name,
+                        "params": params,
+                        "success": success,
+                        "runs": len(runs),
+                        "seconds": round(seconds, 4),
+                        "seconds_min": round(min(run[0] for run in runs), 4),
+                        "bytes_out": _output_size(output_path) if success and output_kind else 0,
+                        "realtime": round(duration / seconds, 2) if success and duration and output_kind and seconds > 0 else 0,
+                        "spawn_latency": record.get("spawn_latency"),
+                        "child_max_rss": record.get("child_max_rss"),
+                        "phases": record.get("phases", {}),
+                    })
+    finally:
+        converter.remove_telemetry_sink(records.append)
+    return results
+
+def collect_environment(converter: FormatConverter) -> Dict[str, Any]:
+    """
+    记录影响测试结果的运行环境，比较报告时环境不同会给出提示
+    
+    Returns:
+        dict: Python、Pillow、FFmpeg版本、平台和CPU核心数
+    """
+    ffmpeg_version = ""
+    if converter.is_ffmpeg_available():
+        try:
+            process = subprocess.run([converter.ffmpeg_path, "-version"],
+                                     stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+            ffmpeg_version = (process.stdout.splitlines() or [""])[0]
+        except OSError:
+            pass
+    return {
+        "python": platform.python_version(),
+        "pillow": PIL.__version__,
+        "ffmpeg": ffmpeg_version,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+def compare_reports(baseline: Dict[str, Any], report: Dict[str, Any], threshold: float = 0.1,
+                    min_seconds: float = 0.02) -> List[Dict[str, Any]]:
+    """
+    与基准报告比较，找出变慢、输出变大或不再成功的测试项
+    
+    Args:
+        baseline: 基准报告
+        report: 本次报告
+        threshold: 允许的相对变化，超过即视为退化
+        min_seconds: 耗时增加的绝对值低于该值时视为测量误差
+    
+    Returns:
+        list: 退化项，包括编号、指标、基准值、本次值和相对变化
+    """
+    baseline_results = {item["id"]: item for item in baseline.get("results", [])}
+    regressions = []
+    for item in report["results"]:
+        base = baseline_results.get(item["id"])
+        if base is None or not base["success"]:
+            continue
+        if not item["success"]:
+            regressions.append({"id": item["id"], "metric": "success", "baseline": True,
+                                "current": False, "change": None})
+            continue
+        for metric in ("seconds", "bytes_out"):
+            old, new = base.get(metric) or 0, item.get(metric) or 0
+            if old <= 0 or new <= old * (1 + threshold):
+                continue
+            if metric == "seconds" and new - old < min_seconds:
+                continue
+            regressions.append({"id": item["id"], "metric": metric, "baseline": old,
+                                "current": new, "change": round(new / old - 1, 4)})
+    return regressions
+
+def format_suite_results(results: List[Dict[str, Any]]) -> str:
+    """
+    把基准测试套件的结果格式化为文本表格
+    
+    Args:
+        results: run_suite返回的结果
+    
+    Returns:
+        str: 表格文本
+    """
+    lines = [f"{'测试项':<72}{'耗时(秒)':>10}{'输出(KB)':>12}{'实时倍数':>10}"]
+    for item in results:
+        if not item["success"]:
+            lines.append(f"{item['id']:<72}{'失败':>10}")
+            continue
+        lines.append(
+            f"{item['id']:<72}{item['seconds']:>10.3f}"
+            f"{item['bytes_out'] / 1024:>12.1f}{item['realtime'] or '':>10}"
+        )
+    return "\n".join(lines)
+
+def format_regressions(regressions: List[Dict[str, Any]]) -> str:
+    """
+    把退化项格式化为文本
+    
+    Args:
+        regressions: compare_reports返回的退化项
+    
+    Returns:
+        str: 每行一个退化项
+    """
+    lines = []
+    for item in regressions:
+        if item["metric"] == "success":
+            lines.append(f"{item['id']}: 基准中成功，本次失败")
+        else:
+            lines.append(f"{item['id']}: {item['metric']} {item['baseline']} -> {item['current']} "
+                         f"(+{item['change'] * 100:.1f}%)")
+    return "\n".join(lines)
+
+def run_suite_command(args: argparse.Namespace) -> int:
+    """执行基准测试套件，写出报告并与基准报告比较"""
+    cases = [c.strip() for c in args.cases.split(",") if c.strip()] if args.cases else list(SUITE_CASES)
+    unknown = [c for c in cases if c not in SUITE_CASES]
+    if unknown:
+        print(f"错误：未知的测试场景 {', '.join(unknown)}，可选: {', '.join(SUITE_CASES)}")
+        return 1
+    
+    converter = FormatConverter(use_probe_cache=False)
+    if not converter.is_ffmpeg_available():
+        print("提示：未找到FFmpeg，只执行图片相关的测试项。")
+    
+    work_dir = tempfile.mkdtemp(prefix="format_converter_benchmark_")
+    try:
+        media = generate_suite_media(converter, work_dir, args.duration, args.seed)
+        results = run_suite(converter, media, work_dir, cases, args.repeat)
+        report = {
+            "version": 1,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "environment": collect_environment(converter),
+            "settings": {"duration": args.duration, "seed": args.seed, "repeat": args.repeat, "cases": cases},
+            "results": results,
+        }
+        
+        if args.report:
+            with open(args.report, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+        if args.json:
+            print(json.dumps(report, ensure_ascii=False, indent=2))
+        else:
+            environment = report["environment"]
+            print(f"CPU核心数 {environment['cpu_count']}，Pillow {environment['pillow']}，"
+                  f"{environment['ffmpeg'] or '无FFmpeg'}")
+            print(format_suite_results(results))
+        
+        regressions = []
+        if args.baseline:
+            with open(args.baseline, "r", encoding="utf-8") as f:
+                baseline = json.load(f)
+            if baseline.get("environment") != report["environment"]:
+                print("提示：基准报告的运行环境与本次不同，耗时比较仅供参考。")
+            if baseline.get("settings") != report["settings"]:
+                print("提示：基准报告的测试设置与本次不同，只比较编号相同的测试项。")
+            regressions = compare_reports(baseline, report, args.threshold)
+            if regressions:
+                print(f"发现{len(regressions)}项退化（阈值{args.threshold * 100:.0f}%）：")
+                print(format_regressions(regressions))
+            else:
+                print("与基准报告相比没有退化。")
+        
+        return 0 if all(item["success"] for item in results) and not regressions else 1
+    finally:
+        if args.keep:
+            print(f"生成的文件保存在: {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+def main(argv: List[str] = None) -> int:
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="视频编码基准测试")
+    parser.add_argument("--mode", choices=("profiles", "segments", "images", "suite"), default="profiles",
+                        help="profiles比较编码档位，segments比较普通转换和分段并行转换，images比较图片处理流程，"
+                             "suite按参数矩阵测量全部操作")
+    parser.add_argument("--duration", type=int, default=10, help="测试片段时长（秒）")
+    parser.add_argument("--size", default="1280x720", help="测试片段分辨率")
+    parser.add_argument("--rate", type=int, default=30, help="测试片段帧率")
+    parser.add_argument("--encoders", default=",".join(DEFAULT_ENCODERS), help="逗号分隔的编码器列表")
+    parser.add_argument("--threads", type=int, default=0, help="每个任务的线程预算，0表示由FFmpeg决定")
+    parser.add_argument("--segments", type=int, default=0, help="分段并行的进程数，0表示CPU核心数")
+    parser.add_argument("--json", action="store_true", help="以JSON格式输出结果")
+    parser.add_argument("--repeat", type=int, default=3, help="图片基准测试和suite模式每个测试项的测量次数")
+    parser.add_argument("--keep", action="store_true", help="保留生成的文件")
+    parser.add_argument("--cases", default="", help=f"suite模式要执行的场景，逗号分隔，默认全部：{','.join(SUITE_CASES)}")
+    parser.add_argument("--seed", type=int, default=0, help="suite模式生成测试图片的随机种子")
+    parser.add_argument("--report", default="", help="suite模式把JSON报告写到该文件")
+    parser.add_argument("--baseline", default="", help="suite模式与该基准报告比较，有退化时返回1")
+    parser.add_argument("--threshold", type=float, default=0.1, help="耗时或输出体积增加超过该比例视为退化")
+    args = parser.parse_args(argv)
+    
+    if args.mode == "suite":
+        return run_suite_command(args)
+    
+    if args.mode == "images":
+        # 图片基准测试只需要Pillow
+        work_dir = tempfile.mkdtemp(prefix="format_converter_benchmark_")
+        try:
+            results = benchmark_images(work_dir, args.repeat)
+            if args.json:
+                print(json.dumps(results, ensure_ascii=False, indent=2))
+            else:
+                print(f"测试图片: 6000x4000，CPU核心数 {os.cpu_count()}")
+                print(format_image_results(results))
+            return 0
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    
+    converter = FormatConverter(use_probe_cache=False)
+    if not converter.is_ffmpeg_available():
+        print("错误：未找到FFmpeg。请确保FFmpeg已安装并添加到系统路径。")
+        return 1
+    
+    work_dir = tempfile.mkdtemp(prefix="format_converter_benchmark_")
+    try:
+        clip_path = os.path.join(work_dir, "testsrc.mp4")
+        if not generate_test_clip(converter, clip_path, args.duration, args.size, args.rate):
+            return 1
+        
+        encoders = [e.strip() for e in args.encoders.split(",") if e.strip()]
+        if args.mode == "segments":
+            results = []
+            for encoder in encoders:
+                results.extend(benchmark_segments(converter, clip_path, work_dir, encoder, segments=args.segments))
+        else:
+            results = benchmark_profiles(converter, clip_path, work_dir, encoders=encoders, threads=args.threads)
+        if args.json:
+            print(json.dumps(results, ensure_ascii=False, indent=2))
+        else:
+            print(f"测试片段: testsrc {args.size} {args.rate}fps {args.duration}秒，CPU核心数 {os.cpu_count()}")
+            print(format_results(results))
+        return 0 if all(item["success"] for item in results) else 1
+    finally:
+        if args.keep:
+            print(f"生成的文件保存在: {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    sys.exit(main())
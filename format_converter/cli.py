@@ -0,0 +1,589 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# 作者：道相抖音@慈悲剪辑，技术问题点关注留言
+
+"""
+格式转换命令行工具
+不导入tkinter，可以在服务器和计划任务中运行；每处理完一个文件向标准输出写一行JSON(NDJSON)，
+最后一行是汇总。转换过程中的提示和错误信息写到标准错误，不会混入JSON输出
+
+用法：
+    python -m format_converter audio "D:/music/*.flac" -o D:/mp3 --ext .mp3 --audio-bitrate 192k --jobs 4
+    python -m format_converter image photos -o thumbs --ext .webp --resize 640x480 --skip-unchanged
+    python -m format_converter video input.mkv -o output.mp4 --profile fastest
+    python -m format_converter info "videos/*.mp4"
+    python -m format_converter video "D:/videos/*.mkv" -o D:/mp4 --queue --priority 5
+    python -m format_converter queue-run --jobs 2 --wait
+    python -m format_converter queue-status --list failed
+
+退出码：0表示全部成功，1表示有文件失败，2表示参数错误，130表示被中断
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Tuple, Optional, Callable, Any
+
+from .utils import FormatConverter, VideoTimestampExtractor, ConversionResult, CancellationToken
+from .batch import (BatchConverter, BatchResult, default_ffmpeg_workers, is_batch_input,
+                    find_input_files, plan_output_paths, get_input_root)
+from .manifest import ConversionManifest
+from .job_queue import JobQueue, QueueWorker, JOB_STATUSES
+from .telemetry import JsonlTelemetrySink
+
+def _parse_size(value: str) -> Tuple[int, int]:
+    """解析"宽x高"格式的尺寸"""
+    try:
+        width, height = (int(v) for v in value.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"尺寸格式应为宽x高，例如640x480: {value}")
+    return width, height
+
+def _parse_floats(value: str) -> List[float]:
+    """解析逗号分隔的数字列表"""
+    try:
+        return [float(v) for v in value.split(",") if v.strip()]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"应为逗号分隔的数字: {value}")
+
+def _result_fields(result: ConversionResult) -> Dict[str, Any]:
+    """把转换结果转换为输出记录的字段"""
+    fields = {"success": bool(result), "cancelled": result.cancelled, "message": result.message}
+    if result.details:
+        fields["details"] = result.details
+    return fields
+
+# 各命令的处理函数，参数为(上下文, 输入路径, 输出路径)，返回输出记录的字段
+
+def _run_gif(ctx, input_path, output_path):
+    args = ctx.args
+    return _result_fields(ctx.converter.convert_mp4_to_gif(
+        input_path, output_path, fps=args.fps, quality=args.quality, scale=args.scale,
+        start_time=args.start, duration=args.duration, streaming=args.streaming,
+        engine=args.engine, cancel_token=ctx.cancel_token
+    ))
+
+def _run_image_sizes(ctx, input_path, output_dir):
+    args = ctx.args
+    return _result_fields(ctx.converter.convert_image_sizes(
+        input_path, output_dir, widths=args.widths, formats=args.formats.split(","),
+        quality=args.quality, cancel_token=ctx.cancel_token
+    ))
+
+def _run_info(ctx, input_path, output_path):
+    info = ctx.converter.get_media_info(input_path)
+    return {"success": bool(info), "cancelled": False, "message": "", "data": info}
+
+def _run_loudness(ctx, input_path, output_path):
+    measured = ctx.converter.measure_loudness(input_path, cancel_token=ctx.cancel_token)
+    cancelled = ctx.cancel_token.is_cancelled
+    return {"success": bool(measured), "cancelled": cancelled, "message": "", "data": measured}
+
+def _run_keyframes(ctx, input_path, output_path):
+    times = ctx.converter.get_keyframe_times(input_path)
+    return {"success": bool(times), "cancelled": False, "message": "", "data": times}
+
+def _run_frame(ctx, input_path, output_path):
+    success = ctx.extractor.extract_frame(input_path, output_path, ctx.args.time)
+    return {"success": success, "cancelled": False, "message": ""}
+
+def _run_frames_at(ctx, input_path, output_dir):
+    args = ctx.args
+    frames = ctx.extractor.extract_frames_at(
+        input_path, args.times, output_dir, output_format=args.format,
+        name_prefix=args.prefix, cancel_token=ctx.cancel_token
+    )
+    return {
+        "success": len(frames) == len(set(args.times)),
+        "cancelled": ctx.cancel_token.is_cancelled,
+        "message": "",
+        "data": {str(t): path for t, path in sorted(frames.items())},
+    }
+
+def _run_frames(ctx, input_path, output_dir):
+    args = ctx.args
+    files = ctx.extractor.extract_frames_sequence(
+        input_path, output_dir, start_time=args.start, duration=args.duration,
+        fps=args.fps, output_format=args.format
+    )
+    return {"success": bool(files), "cancelled": False, "message": "", "data": files}
+
+def _run_contact_sheet(ctx, input_path, output_path):
+    args = ctx.args
+    return _result_fields(ctx.extractor.create_contact_sheet(
+        input_path, output_path, columns=args.columns, rows=args.rows,
+        thumb_width=args.thumb_width, keyframes_only=args.keyframes_only,
+        quality=args.quality, cancel_token=ctx.cancel_token
+    ))
+
+# 可以交给BatchConverter执行的命令的参数，返回传给转换方法的参数
+
+def _video_options(args):
+    return {
+        "video_codec": args.video_codec, "audio_codec": args.audio_codec,
+        "video_bitrate": args.video_bitrate, "audio_bitrate": args.audio_bitrate,
+        "resolution": args.resolution, "fps": args.fps, "profile": args.profile,
+        "allow_stream_copy": not args.no_stream_copy, "parallel_segments": args.parallel_segments,
+    }
+
+def _audio_options(args):
+    return {
+        "audio_codec": args.audio_codec, "audio_bitrate": args.audio_bitrate,
+        "sample_rate": args.sample_rate, "channels": args.channels,
+        "normalize_loudness": args.loudnorm,
+    }
+
+def _image_options(args):
+    return {
+        "quality": args.quality, "resize": args.resize, "rotate": args.rotate,
+        "flip": args.flip, "mirror": args.mirror, "target_size": args.target_size,
+    }
+
+def _extract_audio_options(args):
+    return {
+        "audio_codec": args.audio_codec, "audio_bitrate": args.audio_bitrate,
+        "normalize_loudness": args.loudnorm,
+    }
+
+# 命令名: (输入文件类型, 输出方式, 默认扩展名或目录后缀, 批量转换操作或处理函数, 参数函数)
+# 输出方式："file"为每个输入一个输出文件；"dir"为每个输入一个输出目录，默认是输入文件名加目录后缀，
+# 后缀为空时使用输入文件所在的目录；None为不生成文件
+COMMANDS = {
+    "gif": ("video", "file", ".gif", _run_gif, None),
+    "video": ("video", "file", ".mp4", "convert_video_format", _video_options),
+    "audio": ("audio", "file", ".mp3", "convert_audio_format", _audio_options),
+    "image": ("image", "file", ".jpg", "convert_image_format", _image_options),
+    "extract-audio": ("video", "file", ".mp3", "extract_audio_from_video", _extract_audio_options),
+    "image-sizes": ("image", "dir", "", _run_image_sizes, None),
+    "info": ("", None, "", _run_info, None),
+    "loudness": ("", None, "", _run_loudness, None),
+    "keyframes": ("video", None, "", _run_keyframes, None),
+    "frame": ("video", "file", ".jpg", _run_frame, None),
+    "frames-at": ("video", "dir", "_frames", _run_frames_at, None),
+    "frames": ("video", "dir", "_frames", _run_frames, None),
+    "contact-sheet": ("video", "file", ".jpg", _run_contact_sheet, None),
+}
+
+def build_parser() -> argparse.ArgumentParser:
+    """
+    创建命令行参数解析器
+    
+    Returns:
+        argparse.ArgumentParser: 参数解析器
+    """
+    parser = argparse.ArgumentParser(
+        prog="python -m format_converter",
+        description="格式转换工具命令行版，结果以NDJSON格式输出到标准输出"
+    )
+    subparsers = parser.add_subparsers(dest="command", metavar="命令")
+    subparsers.required = True
+    
+    def add_command(name, help_text):
+        sub = subparsers.add_parser(name, help=help_text, description=help_text)
+        sub.add_argument("input", help="输入文件、目录或通配符（目录和通配符表示批量处理）")
+        output_kind = COMMANDS[name][1]
+        if output_kind == "file":
+            sub.add_argument("-o", "--output", default="",
+                             help="输出文件，批量处理时为输出目录（必须指定）；默认与输入文件放在同一目录")
+            sub.add_argument("--ext", default=COMMANDS[name][2],
+                             help=f"批量处理或未指定输出时的输出扩展名，默认{COMMANDS[name][2]}")
+        elif output_kind == "dir":
+            sub.add_argument("-o", "--output", default="",
+                             help="输出目录，批量处理时每个输入在其中建立同名子目录（必须指定）；默认与输入文件放在同一目录")
+        sub.add_argument("-j", "--jobs", type=int, default=0, help="并发任务数，0表示自动选择")
+        sub.add_argument("-r", "--recursive", action="store_true", help="输入为目录时包含子目录")
+        sub.add_argument("--telemetry", default="", metavar="FILE",
+                         help="把每次转换的性能记录（耗时、子进程启动延迟和峰值内存等）追加到JSONL文件")
+        if isinstance(COMMANDS[name][3], str):
+            sub.add_argument("--skip-unchanged", action="store_true",
+                             help="批量处理时跳过输入和参数都未变化的文件（清单保存在输出目录）")
+            sub.add_argument("--queue", nargs="?", const="", default=None, metavar="DB",
+                             help="不立即转换，而是提交到任务队列，由queue-run执行；DB默认为用户缓存目录下的jobs.sqlite3")
+            sub.add_argument("--priority", type=int, default=0, help="提交到任务队列时的优先级，数值大的先执行")
+        return sub
+    
+    sub = add_command("gif", "视频转GIF")
+    sub.add_argument("--fps", type=int, default=10, help="GIF帧率")
+    sub.add_argument("--quality", type=int, default=85, help="GIF质量(0-100)")
+    sub.add_argument("--scale", type=float, default=1.0, help="缩放比例")
+    sub.add_argument("--start", type=float, default=0, help="开始时间（秒）")
+    sub.add_argument("--duration", type=float, default=0, help="持续时间（秒），0表示到视频结束")
+    sub.add_argument("--engine", choices=FormatConverter.GIF_ENGINES, default="auto", help="GIF转换引擎")
+    sub.add_argument("--streaming", action="store_true", help="逐帧流式编码，内存占用恒定")
+    
+    sub = add_command("video", "视频格式转换")
+    sub.add_argument("--video-codec", default="", help="视频编码器，例如libx264")
+    sub.add_argument("--audio-codec", default="", help="音频编码器，例如aac")
+    sub.add_argument("--video-bitrate", default="", help="视频比特率，例如2M")
+    sub.add_argument("--audio-bitrate", default="", help="音频比特率，例如128k")
+    sub.add_argument("--resolution", default="", help="分辨率，例如1280x720")
+    sub.add_argument("--fps", type=int, default=0, help="帧率，0表示保持原帧率")
+    sub.add_argument("--profile", choices=("",) + FormatConverter.VIDEO_PROFILES, default="",
+                     help="编码性能档位")
+    sub.add_argument("--no-stream-copy", action="store_true", help="总是重新编码，不直接复制流")
+    sub.add_argument("--parallel-segments", type=int, default=0, help="分段并行转换的进程数，0表示不分段")
+    
+    sub = add_command("audio", "音频格式转换")
+    sub.add_argument("--audio-codec", default="", help="音频编码器，例如libmp3lame、libopus")
+    sub.add_argument("--audio-bitrate", default="", help="音频比特率，例如192k")
+    sub.add_argument("--sample-rate", type=int, default=0, help="采样率，0表示保持原采样率")
+    sub.add_argument("--channels", type=int, default=0, help="声道数，0表示保持原声道数")
+    sub.add_argument("--loudnorm", action="store_true", help="EBU R128响度标准化")
+    
+    sub = add_command("image", "图片格式转换")
+    sub.add_argument("--quality", type=int, default=90, help="图片质量(1-100)")
+    sub.add_argument("--resize", type=_parse_size, default=None, help="调整大小，例如640x480")
+    sub.add_argument("--rotate", type=int, default=0, help="顺时针旋转角度")
+    sub.add_argument("--flip", action="store_true", help="上下翻转")
+    sub.add_argument("--mirror", action="store_true", help="左右镜像")
+    sub.add_argument("--target-size", type=int, default=0, help="目标文件字节数（JPEG和WebP），0表示按质量保存")
+    
+    sub = add_command("extract-audio", "从视频中提取音频")
+    sub.add_argument("--audio-codec", default="", help="音频编码器")
+    sub.add_argument("--audio-bitrate", default="", help="音频比特率")
+    sub.add_argument("--loudnorm", action="store_true", help="EBU R128响度标准化")
+    
+    sub = add_command("image-sizes", "把图片输出为多个宽度和格式")
+    sub.add_argument("--widths", type=lambda v: [int(w) for w in _parse_floats(v)], default=[320, 640, 1280],
+                     help="逗号分隔的输出宽度，默认320,640,1280")
+    sub.add_argument("--formats", default=".webp,.jpg", help="逗号分隔的输出格式，默认.webp,.jpg")
+    sub.add_argument("--quality", type=int, default=90, help="图片质量(1-100)")
+    
+    add_command("info", "输出媒体文件信息")
+    add_command("loudness", "测量音频响度（EBU R128）")
+    add_command("keyframes", "输出视频关键帧时间")
+    
+    sub = add_command("frame", "提取视频中指定时间的一帧")
+    sub.add_argument("--time", type=float, default=0, help="时间点（秒）")
+    
+    sub = add_command("frames-at", "一次提取视频中多个时间点的帧")
+    sub.add_argument("--times", type=_parse_floats, required=True, help="逗号分隔的时间点（秒）")
+    sub.add_argument("--format", default="jpg", help="输出图片格式")
+    sub.add_argument("--prefix", default="frame", help="输出文件名前缀")
+    
+    sub = add_command("frames", "按固定帧率提取帧序列")
+    sub.add_argument("--fps", type=int, default=1, help="每秒提取的帧数")
+    sub.add_argument("--start", type=float, default=0, help="开始时间（秒）")
+    sub.add_argument("--duration", type=float, default=0, help="持续时间（秒），0表示到视频结束")
+    sub.add_argument("--format", default="jpg", help="输出图片格式")
+    
+    sub = add_command("contact-sheet", "生成视频缩略图")
+    sub.add_argument("--columns", type=int, default=4, help="列数")
+    sub.add_argument("--rows", type=int, default=4, help="行数")
+    sub.add_argument("--thumb-width", type=int, default=320, help="每张缩略图的宽度")
+    sub.add_argument("--keyframes-only", action="store_true", help="只使用关键帧，速度更快")
+    sub.add_argument("--quality", type=int, default=85, help="JPEG质量")
+    
+    sub = subparsers.add_parser("queue-run", help="执行任务队列中的任务", description="执行任务队列中的任务")
+    sub.add_argument("--queue", default="", metavar="DB", help="任务队列数据库，默认为用户缓存目录下的jobs.sqlite3")
+    sub.add_argument("-j", "--jobs", type=int, default=0, help="同时执行的任务数，0表示自动选择")
+    sub.add_argument("--wait", action="store_true", help="队列为空时继续等待新任务，否则执行完后退出")
+    sub.add_argument("--lease", type=float, default=60, help="任务租约时长（秒）")
+    sub.add_argument("--stall-timeout", type=float, default=300,
+                     help="任务的FFmpeg进程超过这么多秒没有输出进度时终止并稍后重试，0表示不检测")
+    sub.add_argument("--telemetry", default="", metavar="FILE",
+                     help="把每次转换的性能记录（耗时、子进程启动延迟和峰值内存等）追加到JSONL文件")
+    
+    sub = subparsers.add_parser("queue-status", help="查看任务队列", description="查看任务队列")
+    sub.add_argument("--queue", default="", metavar="DB", help="任务队列数据库，默认为用户缓存目录下的jobs.sqlite3")
+    sub.add_argument("--list", choices=JOB_STATUSES, default=None, help="列出该状态的任务")
+    sub.add_argument("--limit", type=int, default=100, help="最多列出的任务数")
+    sub.add_argument("--retry-failed", action="store_true", help="把失败的任务重新放回队列")
+    sub.add_argument("--purge-done", action="store_true", help="删除已完成的任务记录")
+    
+    return parser
+
+class _Context:
+    """命令执行上下文"""
+    
+    def __init__(self, args: argparse.Namespace, output_stream):
+        self.args = args
+        self.converter = FormatConverter()
+        self.extractor = VideoTimestampExtractor(self.converter)
+        self.cancel_token = CancellationToken()
+        self.batch_result = BatchResult()
+        self._output_stream = output_stream
+        self._output_closed = False
+        self._lock = threading.Lock()
+    
+    def emit(self, record: Dict[str, Any]):
+        """写出一行JSON记录"""
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self._lock:
+            if self._output_closed:
+                return
+            try:
+                self._output_stream.write(line + "\n")
+                self._output_stream.flush()
+            except BrokenPipeError:
+                # 读取端已关闭（例如通过管道交给head），不再有人需要结果
+                self._output_closed = True
+                self.cancel_token.cancel()
+    
+    def emit_file(self, item: Dict[str, Any], extra: Optional[Dict[str, Any]] = None):
+        """写出单个文件的结果"""
+        record = {"type": "file", "command": self.args.command}
+        record.update(item)
+        record["elapsed"] = round(item["elapsed"], 3)
+        if extra:
+            record.update(extra)
+        self.emit(record)
+
+def _default_output(input_path: str, ext: str) -> str:
+    """未指定输出时的输出文件路径：与输入文件放在同一目录"""
+    base = os.path.splitext(os.path.abspath(input_path))[0]
+    output_path = base + ext
+    if output_path == os.path.abspath(input_path):
+        output_path = base + "_converted" + ext
+    return output_path
+
+def _get_output_paths(args: argparse.Namespace, input_files: List[str], batch: bool) -> Dict[str, str]:
+    """
+    计算每个输入的输出路径
+    
+    批量输入的输出路径一次性计算，同名不同扩展名的输入不会写入同一个输出，也不会覆盖其他输入，
+    见plan_output_paths
+    
+    Args:
+        args: 命令行参数
+        input_files: 输入文件路径列表
+        batch: 是否为批量输入
+    
+    Returns:
+        dict: 输入文件路径到输出文件或目录路径的映射，不生成文件的命令对应空字符串
+    """
+    output_kind, default_ext = COMMANDS[args.command][1:3]
+    if output_kind is None:
+        return {input_path: "" for input_path in input_files}
+    
+    if not batch:
+        input_path = input_files[0]
+        if args.output:
+            return {input_path: args.output}
+        if output_kind == "file":
+            return {input_path: _default_output(input_path, args.ext)}
+        base = os.path.splitext(os.path.abspath(input_path))[0]
+        return {input_path: base + default_ext if default_ext else os.path.dirname(base)}
+    
+    input_root = get_input_root(args.input, input_files)
+    if output_kind == "dir" and not default_ext:
+        # 输出直接写入输出目录中对应的子目录，文件名由各命令自己决定
+        return {
+            input_path: os.path.dirname(os.path.join(
+                args.output, os.path.relpath(os.path.splitext(os.path.abspath(input_path))[0], input_root)
+            ))
+            for input_path in input_files
+        }
+    suffix = args.ext if output_kind == "file" else default_ext
+    if output_kind == "file" and not suffix.startswith("."):
+        suffix = "." + suffix
+    return dict(zip(input_files, plan_output_paths(input_files, input_root, args.output, suffix)))
+
+def _submit_to_queue(ctx: _Context, operation: str, options: Dict[str, Any],
+                     input_files: List[str], batch: bool) -> int:
+    """把转换任务提交到任务队列，由queue-run执行"""
+    args = ctx.args
+    output_paths = _get_output_paths(args, input_files, batch)
+    queue = JobQueue(args.queue)
+    try:
+        for input_path in input_files:
+            output_path = output_paths[input_path]
+            job_id = queue.submit(operation, input_path, output_path, options, priority=args.priority)
+            ctx.emit({"type": "queued", "command": args.command, "id": job_id,
+                      "input": os.path.abspath(input_path), "output": os.path.abspath(output_path),
+                      "priority": args.priority})
+        ctx.emit({"type": "summary", "command": args.command, "queued": len(input_files),
+                  "queue": queue.db_path, "counts": queue.counts()})
+    finally:
+        queue.close()
+    return 0
+
+def _run_queue(ctx: _Context) -> int:
+    """执行任务队列中的任务"""
+    args = ctx.args
+    queue = JobQueue(args.queue, lease_seconds=args.lease)
+    worker = QueueWorker(queue, ctx.converter, workers=args.jobs or default_ffmpeg_workers(),
+                         stall_timeout=args.stall_timeout)
+    
+    def on_job_done(job, result, elapsed):
+        item = ctx.batch_result.add(job["input"], job["output"], result, elapsed)
+        ctx.emit_file(item, {"id": job["id"], "operation": job["operation"], "attempt": job["attempts"]})
+    
+    try:
+        worker.run(cancel_token=ctx.cancel_token, stop_when_empty=not args.wait, job_callback=on_job_done)
+        ctx.batch_result.finish()
+        batch_result = ctx.batch_result
+        ctx.emit({
+            "type": "summary",
+            "command": args.command,
+            "total": len(batch_result.results),
+            "succeeded": len(batch_result.succeeded),
+            "failed": len(batch_result.failed),
+            "cancelled": len(batch_result.cancelled),
+            "elapsed": round(batch_result.elapsed, 3),
+            "queue": queue.db_path,
+            "counts": queue.counts(),
+        })
+    finally:
+        queue.close()
+    if ctx.cancel_token.is_cancelled:
+        return 130
+    return 1 if ctx.batch_result.failed else 0
+
+def _show_queue(ctx: _Context) -> int:
+    """查看和维护任务队列"""
+    args = ctx.args
+    queue = JobQueue(args.queue)
+    try:
+        if args.retry_failed:
+            ctx.emit({"type": "retried", "count": queue.retry_failed()})
+        if args.purge_done:
+            ctx.emit({"type": "purged", "count": queue.purge()})
+        if args.list:
+            for job in queue.jobs(args.list, args.limit):
+                record = {"type": "job"}
+                record.update(job)
+                ctx.emit(record)
+        ctx.emit({"type": "summary", "command": args.command, "queue": queue.db_path, "counts": queue.counts()})
+    finally:
+        queue.close()
+    return 0
+
+def _run_batch_operation(ctx: _Context, operation: str, options: Dict[str, Any]):
+    """用BatchConverter执行批量转换"""
+    args = ctx.args
+    manifest = ConversionManifest.for_output_dir(args.output) if args.skip_unchanged else None
+    batch_converter = BatchConverter(ctx.converter, image_workers=args.jobs, ffmpeg_workers=args.jobs)
+    ctx.batch_result = batch_converter.run(
+        operation, args.input, args.output, args.ext, options=options, recursive=args.recursive,
+        file_callback=lambda item, done, total: ctx.emit_file(item),
+        cancel_token=ctx.cancel_token, manifest=manifest
+    )
+
+def _run_each(ctx: _Context, handler: Callable, input_files: List[str], batch: bool):
+    """在线程池中对每个输入文件执行处理函数"""
+    args = ctx.args
+    output_kind = COMMANDS[args.command][1]
+    output_paths = _get_output_paths(args, input_files, batch)
+    
+    def run_one(input_path):
+        output_path = output_paths[input_path]
+        if ctx.cancel_token.is_cancelled:
+            result, elapsed, extra = ConversionResult(False, cancelled=True, message="转换已取消"), 0.0, {}
+        else:
+            start = time.time()
+            try:
+                if output_kind == "file":
+                    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+                elif output_kind == "dir":
+                    os.makedirs(output_path, exist_ok=True)
+                extra = handler(ctx, input_path, output_path)
+            except Exception as e:
+                extra = {"success": False, "cancelled": False, "message": str(e)}
+            elapsed = time.time() - start
+            result = ConversionResult(extra.pop("success"), cancelled=extra.pop("cancelled"),
+                                      message=extra.pop("message"))
+        item = ctx.batch_result.add(input_path, output_path, result, elapsed)
+        ctx.emit_file(item, extra)
+    
+    workers = args.jobs or default_ffmpeg_workers()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(run_one, input_files))
+    ctx.batch_result.finish()
+
+def main(argv: List[str] = None) -> int:
+    """命令行入口"""
+    args = build_parser().parse_args(argv)
+    
+    # FFmpeg和Pillow相关的提示都用print输出，为了让标准输出只包含JSON，
+    # 把文件描述符1重定向到标准错误（子进程也会继承），JSON写到原来的标准输出
+    sys.stdout.flush()
+    output_fd = os.dup(1)
+    os.dup2(2, 1)
+    output_stream = os.fdopen(output_fd, "w", encoding="utf-8")
+    
+    ctx = _Context(args, output_stream)
+    telemetry_sink = None
+    if getattr(args, "telemetry", ""):
+        telemetry_sink = JsonlTelemetrySink(args.telemetry)
+        ctx.converter.add_telemetry_sink(telemetry_sink)
+    
+    # Ctrl+C或SIGTERM时取消任务：不再启动新任务，终止正在运行的FFmpeg
+    def on_signal(signum, frame):
+        ctx.cancel_token.cancel()
+    
+    previous_handlers = {}
+    for signum in (signal.SIGINT, getattr(signal, "SIGTERM", None)):
+        if signum is not None:
+            previous_handlers[signum] = signal.signal(signum, on_signal)
+    
+    try:
+        if args.command == "queue-run":
+            return _run_queue(ctx)
+        if args.command == "queue-status":
+            return _show_queue(ctx)
+        
+        file_type, output_kind, default_ext, target, options_builder = COMMANDS[args.command]
+        batch = is_batch_input(args.input)
+        if batch:
+            input_files = find_input_files(args.input, file_type, args.recursive)
+        elif os.path.isfile(args.input):
+            input_files = [args.input]
+        else:
+            input_files = []
+        
+        if not input_files:
+            ctx.emit({"type": "error", "command": args.command, "message": f"没有找到输入文件: {args.input}"})
+            return 1
+        # 批量输出默认写到输入目录时，输出可能与其他输入同名，必须明确指定输出目录
+        if batch and output_kind is not None and not args.output:
+            ctx.emit({"type": "error", "command": args.command, "message": "批量处理时必须用-o指定输出目录"})
+            return 2
+        
+        if getattr(args, "queue", None) is not None:
+            return _submit_to_queue(ctx, target, options_builder(args), input_files, batch)
+        if isinstance(target, str) and batch:
+            _run_batch_operation(ctx, target, options_builder(args))
+        elif isinstance(target, str):
+            method = getattr(ctx.converter, target)
+            options = options_builder(args)
+            handler = lambda c, i, o: _result_fields(method(i, o, cancel_token=c.cancel_token, **options))
+            _run_each(ctx, handler, input_files, batch)
+        else:
+            _run_each(ctx, target, input_files, batch)
+        
+        batch_result = ctx.batch_result
+        throughput = batch_result.throughput()
+        ctx.emit({
+            "type": "summary",
+            "command": args.command,
+            "total": len(batch_result.results),
+            "succeeded": len(batch_result.succeeded),
+            "skipped": len(batch_result.skipped),
+            "failed": len(batch_result.failed),
+            "cancelled": len(batch_result.cancelled),
+            "elapsed": round(batch_result.elapsed, 3),
+            "files_per_second": round(throughput["files_per_second"], 3),
+            "mb_per_second": round(throughput["mb_per_second"], 3),
+            "media_seconds_per_second": round(throughput["media_seconds_per_second"], 3),
+        })
+        
+        if ctx.cancel_token.is_cancelled:
+            return 130
+        return 1 if batch_result.failed else 0
+    finally:
+        for signum, handler in previous_handlers.items():
+            signal.signal(signum, handler)
+        if telemetry_sink is not None:
+            telemetry_sink.close()
+        sys.stdout.flush()
+        os.dup2(output_stream.fileno(), 1)
+        try:
+            output_stream.close()
+        except BrokenPipeError:
+            pass
@@ -0,0 +1,500 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# 作者：道相抖音@慈悲剪辑，技术问题点关注留言
+
+"""
+持久化的转换任务队列
+任务保存在SQLite中，按优先级执行；工作线程领取任务时获得有时限的租约，
+转换过程中持续续约，进程崩溃或FFmpeg卡住不再续约时，租约到期后任务自动回到待执行状态，
+重启后从中断处继续，已完成的任务不会重新转换
+"""
+
+import os
+import json
+import time
+import socket
+import sqlite3
+import threading
+from typing import List, Dict, Tuple, Optional, Callable, Any
+
+from .utils import FormatConverter, ConversionResult, CancellationToken
+from .probe_cache import default_cache_path
+
+# 任务状态
+STATUS_PENDING = "pending"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+JOB_STATUSES = (STATUS_PENDING, STATUS_RUNNING, STATUS_DONE, STATUS_FAILED)
+
+# 可以放入队列的操作，参数都是(输入路径, 输出路径, **选项)
+QUEUE_OPERATIONS = (
+    "convert_mp4_to_gif",
+    "convert_video_format",
+    "convert_audio_format",
+    "convert_image_format",
+    "extract_audio_from_video",
+)
+
+def default_queue_path() -> str:
+    """
+    获取默认的任务队列数据库路径
+    
+    Returns:
+        str: 与媒体信息缓存位于同一目录
+    """
+    return os.path.join(os.path.dirname(default_cache_path()), "jobs.sqlite3")
+
+class JobQueue:
+    """
+    SQLite任务队列
+    
+    多个进程可以同时使用同一个数据库：领取任务在IMMEDIATE事务中完成，
+    同一个任务不会被两个工作线程同时领取
+    """
+    
+    def __init__(self, db_path: str = "", lease_seconds: float = 60):
+        """
+        初始化任务队列
+        
+        Args:
+            db_path: 数据库文件路径，默认使用default_queue_path()
+            lease_seconds: 租约时长（秒），工作线程需要在此时间内续约
+        """
+        self.db_path = db_path or default_queue_path()
+        self.lease_seconds = lease_seconds
+        self._lock = threading.Lock()
+        
+        if self.db_path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        # 自动提交模式，需要原子性的操作显式使用BEGIN IMMEDIATE
+        self._conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "operation TEXT NOT NULL, input TEXT NOT NULL, output TEXT NOT NULL, "
+            "options TEXT NOT NULL, priority INTEGER NOT NULL DEFAULT 0, "
+            "status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, "
+            "max_attempts INTEGER NOT NULL DEFAULT 3, "
+            "lease_owner TEXT, lease_expires REAL, "
+            "message TEXT NOT NULL DEFAULT '', elapsed REAL NOT NULL DEFAULT 0, "
+            "created REAL NOT NULL, updated REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_jobs_pending ON jobs (status, priority DESC, id)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_jobs_identity ON jobs (output, operation, input)"
+        )
+    
+    @staticmethod
+    def _row_to_job(row: sqlite3.Row) -> Dict[str, Any]:
+        """把数据库行转换为任务字典"""
+        job = dict(row)
+        job["options"] = json.loads(job["options"])
+        return job
+    
+    def submit(self, operation: str, input_path: str, output_path: str,
+               options: Optional[Dict[str, Any]] = None, priority: int = 0,
+               max_attempts: int = 3) -> int:
+        """
+        提交任务
+        
+        相同的任务（操作、输入、输出和参数都相同）已在队列中等待、执行或已完成时不会重复添加，
+        已失败的相同任务会重新回到待执行状态
+        
+        Args:
+            operation: 操作名称，见QUEUE_OPERATIONS
+            input_path: 输入文件路径
+            output_path: 输出文件路径
+            options: 传给转换方法的参数
+            priority: 优先级，数值大的先执行
+            max_attempts: 最多尝试次数（租约到期或卡住时会重试）
+        
+        Returns:
+            int: 任务编号
+        """
+        if operation not in QUEUE_OPERATIONS:
+            raise ValueError(f"不支持放入队列的操作: {operation}")
+        
+        input_path = os.path.abspath(input_path)
+        output_path = os.path.abspath(output_path)
+        options_text = json.dumps(options or {}, sort_keys=True)
+        now = time.time()
+        
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT id, status FROM jobs WHERE output = ? AND operation = ? AND input = ? AND options = ? "
+                    "ORDER BY id DESC LIMIT 1",
+                    (output_path, operation, input_path, options_text)
+                ).fetchone()
+                if row is not None and row["status"] != STATUS_FAILED:
+                    job_id = row["id"]
+                elif row is not None:
+                    job_id = row["id"]
+                    self._conn.execute(
+                        "UPDATE jobs SET status = ?, attempts = 0, priority = ?, max_attempts = ?, "
+                        "message = '', updated = ? WHERE id = ?",
+                        (STATUS_PENDING, priority, max_attempts, now, job_id)
+                    )
+                else:
+                    job_id = self._conn.execute(
+                        "INSERT INTO jobs (operation, input, output, options, priority, status, max_attempts, "
+                        "created, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (operation, input_path, output_path, options_text, priority, STATUS_PENDING,
+                         max_attempts, now, now)
+                    ).lastrowid
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return job_id
+    
+    def claim(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        """
+        领取优先级最高的待执行任务
+        
+        领取前先回收租约已到期的任务：未超过尝试次数的回到待执行状态，否则标记为失败
+        
+        Args:
+            worker_id: 工作线程标识
+        
+        Returns:
+            dict: 任务，没有待执行任务时返回None
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "UPDATE jobs SET status = CASE WHEN attempts >= max_attempts THEN ? ELSE ? END, "
+                    "message = '租约到期，任务可能已卡住或工作进程已退出', "
+                    "lease_owner = NULL, lease_expires = NULL, updated = ? "
+                    "WHERE status = ? AND lease_expires < ?",
+                    (STATUS_FAILED, STATUS_PENDING, now, STATUS_RUNNING, now)
+                )
+                row = self._conn.execute(
+                    "SELECT id FROM jobs WHERE status = ? ORDER BY priority DESC, id LIMIT 1",
+                    (STATUS_PENDING,)
+                ).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+                
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, attempts = attempts + 1, lease_owner = ?, "
+                    "lease_expires = ?, updated = ? WHERE id = ?",
+                    (STATUS_RUNNING, worker_id, now + self.lease_seconds, now, row["id"])
+                )
+                job = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone()
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return self._row_to_job(job)
+    
+    def _update_owned(self, job_id: int, worker_id: str, sql: str, params: tuple) -> bool:
+        """只在租约仍属于该工作线程时更新任务"""
+        with self._lock:
+            cursor = self._conn.execute(
+                sql + " WHERE id = ? AND status = ? AND lease_owner = ?",
+                params + (job_id, STATUS_RUNNING, worker_id)
+            )
+        return cursor.rowcount == 1
+    
+    def heartbeat(self, job_id: int, worker_id: str) -> bool:
+        """
+        续约
+        
+        Args:
+            job_id: 任务编号
+            worker_id: 工作线程标识
+        
+        Returns:
+            bool: 租约已被回收时返回False，工作线程应停止该任务
+        """
+        now = time.time()
+        return self._update_owned(
+            job_id, worker_id, "UPDATE jobs SET lease_expires = ?, updated = ?",
+            (now + self.lease_seconds, now)
+        )
+    
+    def finish(self, job_id: int, worker_id: str, success: bool, message: str = "",
+               elapsed: float = 0.0) -> bool:
+        """
+        记录任务结果
+        
+        Args:
+            job_id: 任务编号
+            worker_id: 工作线程标识
+            success: 是否成功
+            message: 说明
+            elapsed: 耗时（秒）
+        
+        Returns:
+            bool: 租约已被回收时返回False
+        """
+        return self._update_owned(
+            job_id, worker_id,
+            "UPDATE jobs SET status = ?, message = ?, elapsed = ?, lease_owner = NULL, "
+            "lease_expires = NULL, updated = ?",
+            (STATUS_DONE if success else STATUS_FAILED, message, elapsed, time.time())
+        )
+    
+    def retry(self, job_id: int, worker_id: str, message: str = "") -> bool:
+        """
+        放弃本次尝试，未超过尝试次数时任务回到待执行状态，否则标记为失败
+        
+        Args:
+            job_id: 任务编号
+            worker_id: 工作线程标识
+            message: 说明
+        
+        Returns:
+            bool: 租约已被回收时返回False
+        """
+        return self._update_owned(
+            job_id, worker_id,
+            "UPDATE jobs SET status = CASE WHEN attempts >= max_attempts THEN ? ELSE ? END, "
+            "message = ?, lease_owner = NULL, lease_expires = NULL, updated = ?",
+            (STATUS_FAILED, STATUS_PENDING, message, time.time())
+        )
+    
+    def release(self, job_id: int, worker_id: str) -> bool:
+        """
+        归还任务（例如工作进程正常退出），不计入尝试次数
+        
+        Args:
+            job_id: 任务编号
+            worker_id: 工作线程标识
+        
+        Returns:
+            bool: 租约已被回收时返回False
+        """
+        return self._update_owned(
+            job_id, worker_id,
+            "UPDATE jobs SET status = ?, attempts = MAX(0, attempts - 1), lease_owner = NULL, "
+            "lease_expires = NULL, updated = ?",
+            (STATUS_PENDING, time.time())
+        )
+    
+    def retry_failed(self) -> int:
+        """
+        把所有失败的任务重新放回队列
+        
+        Returns:
+            int: 重新放回的任务数
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, attempts = 0, message = '', updated = ? WHERE status = ?",
+                (STATUS_PENDING, time.time(), STATUS_FAILED)
+            )
+        return cursor.rowcount
+    
+    def purge(self, status: str = STATUS_DONE) -> int:
+        """
+        删除指定状态的任务记录
+        
+        Args:
+            status: 任务状态
+        
+        Returns:
+            int: 删除的任务数
+        """
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM jobs WHERE status = ?", (status,))
+        return cursor.rowcount
+    
+    def get(self, job_id: int) -> Optional[Dict[str, Any]]:
+        """
+        查询任务
+        
+        Args:
+            job_id: 任务编号
+        
+        Returns:
+            dict: 任务，不存在时返回None
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row) if row is not None else None
+    
+    def jobs(self, status: str = "", limit: int = 100) -> List[Dict[str, Any]]:
+        """
+        列出任务
+        
+        Args:
+            status: 只列出该状态的任务，为空时列出全部
+            limit: 最多返回的任务数
+        
+        Returns:
+            list: 按优先级和提交顺序排列的任务
+        """
+        sql = "SELECT * FROM jobs"
+        params = ()
+        if status:
+            sql += " WHERE status = ?"
+            params = (status,)
+        sql += " ORDER BY priority DESC, id LIMIT ?"
+        with self._lock:
+            rows = self._conn.execute(sql, params + (limit,)).fetchall()
+        return [self._row_to_job(row) for row in rows]
+    
+    def counts(self) -> Dict[str, int]:
+        """
+        统计各状态的任务数
+        
+        Returns:
+            dict: 状态到任务数的映射
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        counts = {status: 0 for status in JOB_STATUSES}
+        counts.update({row[0]: row[1] for row in rows})
+        return counts
+    
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+class QueueWorker:
+    """从任务队列领取并执行转换任务的工作线程组"""
+    
+    def __init__(self, queue: JobQueue, converter: Optional[FormatConverter] = None,
+                 workers: int = 1, worker_id: str = "", stall_timeout: float = 300):
+        """
+        初始化工作线程组
+        
+        Args:
+            queue: 任务队列
+            converter: 格式转换器实例
+            workers: 同时执行的任务数
+            worker_id: 工作进程标识，默认为"主机名:进程号"
+            stall_timeout: 任务的FFmpeg进程超过这么多秒没有输出进度时视为卡住，终止FFmpeg并稍后重试，
+                           0表示不检测；FFmpeg之外的处理步骤（例如合成GIF）不检测
+        """
+        self.queue = queue
+        self.converter = converter or FormatConverter()
+        self.workers = max(1, workers)
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.stall_timeout = stall_timeout
+    
+    def run(self, cancel_token: Optional[CancellationToken] = None, stop_when_empty: bool = True,
+            poll_interval: float = 2.0,
+            job_callback: Callable[[Dict[str, Any], ConversionResult, float], None] = None) -> int:
+        """
+        执行队列中的任务
+        
+        Args:
+            cancel_token: 取消令牌，取消后终止正在执行的任务并把它们归还队列
+            stop_when_empty: 队列为空时是否退出，否则持续等待新任务
+            poll_interval: 队列为空时检查新任务的间隔（秒）
+            job_callback: 每个任务结束时调用，参数为(任务, 转换结果, 耗时)，可能在多个线程中同时调用
+        
+        Returns:
+            int: 本次执行的任务数
+        """
+        cancel_token = cancel_token or CancellationToken()
+        executed = [0]
+        lock = threading.Lock()
+        
+        def worker_loop(index):
+            worker_id = f"{self.worker_id}#{index}"
+            while not cancel_token.is_cancelled:
+                job = self.queue.claim(worker_id)
+                if job is None:
+                    if stop_when_empty:
+                        return
+                    time.sleep(poll_interval)
+                    continue
+                
+                result, elapsed = self._execute(job, worker_id, cancel_token)
+                with lock:
+                    executed[0] += 1
+                if job_callback:
+                    job_callback(job, result, elapsed)
+        
+        threads = [
+            threading.Thread(target=worker_loop, args=(index,), daemon=True)
+            for index in range(self.workers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return executed[0]
+    
+    def _execute(self, job: Dict[str, Any], worker_id: str,
+                 cancel_token: CancellationToken) -> Tuple[ConversionResult, float]:
+        """
+        执行单个任务，转换期间由后台线程续约
+        
+        Returns:
+            tuple: (转换结果, 耗时)
+        """
+        job_token = CancellationToken()
+        unregister = cancel_token.register(job_token.cancel)
+        state = {"last_progress": time.time(), "ffmpeg_running": False, "stalled": False, "lost": False}
+        finished = threading.Event()
+        
+        def on_progress(progress):
+            # FFmpeg运行期间每组-progress输出都会报告一次（时长未知时也会），作为心跳；
+            # 其他处理步骤报告的普通进度值没有running属性，不检测卡住
+            state["last_progress"] = time.time()
+            state["ffmpeg_running"] = getattr(progress, "running", False)
+        
+        def keep_lease():
+            # 每1/3个租约时长续约一次；FFmpeg长时间没有心跳时停止续约并终止任务
+            while not finished.wait(self.queue.lease_seconds / 3):
+                if (self.stall_timeout and state["ffmpeg_running"] and
+                        time.time() - state["last_progress"] > self.stall_timeout):
+                    state["stalled"] = True
+                    job_token.cancel()
+                    return
+                if not self.queue.heartbeat(job["id"], worker_id):
+                    state["lost"] = True
+                    job_token.cancel()
+                    return
+        
+        heartbeat_thread = threading.Thread(target=keep_lease, daemon=True)
+        heartbeat_thread.start()
+        
+        start = time.time()
+        try:
+            output_dir = os.path.dirname(job["output"])
+            if output_dir:
+                os.makedirs(output_dir, exist_ok=True)
+            method = getattr(self.converter, job["operation"])
+            result = method(job["input"], job["output"], progress_callback=on_progress,
+                            cancel_token=job_token, **job["options"])
+        except Exception as e:
+            result = ConversionResult(False, message=str(e))
+        finally:
+            finished.set()
+            heartbeat_thread.join()
+            unregister()
+        elapsed = time.time() - start
+        
+        # 租约已被回收时任务由其他工作线程负责，不再更新
+        if state["lost"]:
+            return result, elapsed
+        
+        if state["stalled"]:
+            message = f"超过{self.stall_timeout:g}秒没有进度，已终止"
+            self.queue.retry(job["id"], worker_id, message)
+            result = ConversionResult(False, message=message)
+        elif result.cancelled or (cancel_token.is_cancelled and not result):
+            # 只归还被取消的任务；取消前已经完成的任务照常记录，不会被重新转换
+            self.queue.release(job["id"], worker_id)
+        else:
+            self.queue.finish(job["id"], worker_id, bool(result), result.message, elapsed)
+        return result, elapsed
@@ -17,11 +17,21 @@ import time
 from typing import Dict, List, Any, Callable, Optional, Union, Tuple
 
 # 导入工具类
-from .utils import FormatConverter, VideoTimestampExtractor
+from .utils import FormatConverter, VideoTimestampExtractor, CancellationToken, ConversionResult
+from .batch import BatchConverter, BATCH_OPERATIONS, is_batch_input, find_input_files
+from .manifest import ConversionManifest
 
 class FormatConverterApp:
     """格式转换工具主应用程序类"""
     
+    # 支持批量转换的选项卡及对应的转换操作
+    BATCH_TAB_OPERATIONS = {
+        1: "convert_video_format",
+        2: "convert_audio_format",
+        3: "convert_image_format",
+        4: "extract_audio_from_video",
+    }
+    
     def __init__(self, root: tk.Tk):
         """
         初始化格式转换工具应用程序
@@ -45,11 +55,13 @@ class FormatConverterApp:
         # 初始化格式转换器
         self.converter = FormatConverter()
         self.timestamp_extractor = VideoTimestampExtractor(self.converter)
+        self.batch_converter = BatchConverter(self.converter)
         
         # 一些状态变量
         self.current_tab = None
         self.conversion_thread = None
         self.is_converting = False
+        self.cancel_token = None
         
         # 输入和输出文件路径
         self.input_file = tk.StringVar()
@@ -79,6 +91,8 @@ class FormatConverterApp:
         self.input_entry.grid(row=0, column=1, padx=5, pady=5, sticky=tk.EW)
         self.browse_input_btn = ttk.Button(self.top_frame, text="浏览...", command=self._browse_input_file)
         self.browse_input_btn.grid(row=0, column=2, padx=5, pady=5)
+        self.browse_input_dir_btn = ttk.Button(self.top_frame, text="批量目录...", command=self._browse_input_dir)
+        self.browse_input_dir_btn.grid(row=0, column=3, padx=5, pady=5)
         
         # 输出文件选择
         ttk.Label(self.top_frame, text="输出文件:").grid(row=1, column=0, padx=5, pady=5, sticky=tk.W)
@@ -209,6 +223,17 @@ class FormatConverterApp:
         duration_spinbox = ttk.Spinbox(frame, from_=0, to=9999, increment=0.5, textvariable=self.duration_var, width=10)
         duration_spinbox.grid(row=4, column=1, padx=5, pady=5, sticky=tk.W)
         
+        # 流式处理
+        self.gif_streaming_var = tk.BooleanVar(value=False)
+        streaming_check = ttk.Checkbutton(frame, text="流式处理 (低内存，不生成临时帧文件)", variable=self.gif_streaming_var)
+        streaming_check.grid(row=5, column=0, columnspan=2, padx=5, pady=5, sticky=tk.W)
+        
+        # 转换引擎
+        ttk.Label(frame, text="转换引擎:").grid(row=6, column=0, padx=5, pady=5, sticky=tk.W)
+        self.gif_engine_var = tk.StringVar(value="auto")
+        engine_combobox = ttk.Combobox(frame, textvariable=self.gif_engine_var, values=["auto", "pil", "ffmpeg"], state="readonly", width=10)
+        engine_combobox.grid(row=6, column=1, padx=5, pady=5, sticky=tk.W)
+        
         # 配置列权重
         frame.columnconfigure(1, weight=1)
     
@@ -264,6 +289,14 @@ class FormatConverterApp:
         fps_spinbox.grid(row=5, column=1, padx=5, pady=5, sticky=tk.W)
         ttk.Label(frame, text="(0 = 保持原始帧率)").grid(row=5, column=2, padx=5, pady=5, sticky=tk.W)
         
+        # 编码档位
+        ttk.Label(frame, text="编码档位:").grid(row=6, column=0, padx=5, pady=5, sticky=tk.W)
+        self.video_profile_var = tk.StringVar()
+        profile_combobox = ttk.Combobox(frame, textvariable=self.video_profile_var, width=15, state="readonly")
+        profile_combobox['values'] = [""] + list(FormatConverter.VIDEO_PROFILES)
+        profile_combobox.grid(row=6, column=1, padx=5, pady=5, sticky=tk.W)
+        ttk.Label(frame, text="(fastest最快 / balanced均衡 / smallest体积最小，留空使用默认参数)").grid(row=6, column=2, padx=5, pady=5, sticky=tk.W)
+        
         # 配置列权重
         frame.columnconfigure(2, weight=1)
     
@@ -304,6 +337,11 @@ class FormatConverterApp:
         channels_combobox.grid(row=3, column=1, padx=5, pady=5, sticky=tk.W)
         ttk.Label(frame, text="(0 = 保持原始声道数, 1 = 单声道, 2 = 立体声)").grid(row=3, column=2, padx=5, pady=5, sticky=tk.W)
         
+        # 响度标准化
+        self.audio_loudnorm_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(frame, text="响度标准化 (EBU R128)", variable=self.audio_loudnorm_var).grid(row=4, column=1, padx=5, pady=5, sticky=tk.W)
+        ttk.Label(frame, text="(首次需要额外一遍分析，结果会被缓存)").grid(row=4, column=2, padx=5, pady=5, sticky=tk.W)
+        
         # 配置列权重
         frame.columnconfigure(2, weight=1)
     
@@ -379,8 +417,12 @@ class FormatConverterApp:
         audio_bitrate_combobox.grid(row=1, column=1, padx=5, pady=5, sticky=tk.W)
         ttk.Label(frame, text="(留空使用默认比特率)").grid(row=1, column=2, padx=5, pady=5, sticky=tk.W)
         
+        # 响度标准化
+        self.extract_loudnorm_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(frame, text="响度标准化 (EBU R128)", variable=self.extract_loudnorm_var).grid(row=2, column=1, padx=5, pady=5, sticky=tk.W)
+        
         # 提示信息
-        ttk.Label(frame, text="将从视频文件中提取音频轨道，不包含视频内容").grid(row=2, column=0, columnspan=3, padx=5, pady=5, sticky=tk.W)
+        ttk.Label(frame, text="将从视频文件中提取音频轨道，不包含视频内容").grid(row=3, column=0, columnspan=3, padx=5, pady=5, sticky=tk.W)
         
         # 配置列权重
         frame.columnconfigure(2, weight=1)
@@ -405,6 +447,8 @@ class FormatConverterApp:
         extract_mode_radio1.grid(row=1, column=1, padx=5, pady=5, sticky=tk.W)
         extract_mode_radio2 = ttk.Radiobutton(frame, text="多帧序列", variable=self.extract_mode_var, value="多帧序列", command=self._update_extract_frames_ui)
         extract_mode_radio2.grid(row=1, column=2, padx=5, pady=5, sticky=tk.W)
+        extract_mode_radio3 = ttk.Radiobutton(frame, text="缩略图", variable=self.extract_mode_var, value="缩略图", command=self._update_extract_frames_ui)
+        extract_mode_radio3.grid(row=1, column=3, padx=5, pady=5, sticky=tk.W)
         
         # 单帧参数框架
         self.single_frame_frame = ttk.LabelFrame(frame, text="单帧参数")
@@ -445,6 +489,32 @@ class FormatConverterApp:
         output_format_combobox['values'] = ["jpg", "png", "bmp", "webp"]
         output_format_combobox.grid(row=3, column=1, padx=5, pady=5, sticky=tk.W)
         
+        # 缩略图参数框架
+        self.contact_sheet_frame = ttk.LabelFrame(frame, text="缩略图参数")
+        self.contact_sheet_frame.grid(row=4, column=0, columnspan=3, padx=5, pady=5, sticky=tk.NSEW)
+        
+        # 列数和行数
+        ttk.Label(self.contact_sheet_frame, text="列数:").grid(row=0, column=0, padx=5, pady=5, sticky=tk.W)
+        self.sheet_columns_var = tk.IntVar(value=4)
+        sheet_columns_spinbox = ttk.Spinbox(self.contact_sheet_frame, from_=1, to=20, textvariable=self.sheet_columns_var, width=10)
+        sheet_columns_spinbox.grid(row=0, column=1, padx=5, pady=5, sticky=tk.W)
+        
+        ttk.Label(self.contact_sheet_frame, text="行数:").grid(row=1, column=0, padx=5, pady=5, sticky=tk.W)
+        self.sheet_rows_var = tk.IntVar(value=4)
+        sheet_rows_spinbox = ttk.Spinbox(self.contact_sheet_frame, from_=1, to=20, textvariable=self.sheet_rows_var, width=10)
+        sheet_rows_spinbox.grid(row=1, column=1, padx=5, pady=5, sticky=tk.W)
+        
+        # 单个缩略图宽度
+        ttk.Label(self.contact_sheet_frame, text="缩略图宽度:").grid(row=2, column=0, padx=5, pady=5, sticky=tk.W)
+        self.sheet_thumb_width_var = tk.IntVar(value=320)
+        sheet_thumb_width_spinbox = ttk.Spinbox(self.contact_sheet_frame, from_=32, to=1920, increment=16, textvariable=self.sheet_thumb_width_var, width=10)
+        sheet_thumb_width_spinbox.grid(row=2, column=1, padx=5, pady=5, sticky=tk.W)
+        
+        # 只解码关键帧
+        self.sheet_keyframes_var = tk.BooleanVar(value=False)
+        sheet_keyframes_check = ttk.Checkbutton(self.contact_sheet_frame, text="只使用关键帧（更快）", variable=self.sheet_keyframes_var)
+        sheet_keyframes_check.grid(row=3, column=0, columnspan=2, padx=5, pady=5, sticky=tk.W)
+        
         # 初始化UI状态
         self._update_extract_frames_ui()
         
@@ -458,9 +528,15 @@ class FormatConverterApp:
         if mode == "单帧":
             self.single_frame_frame.grid()
             self.multi_frame_frame.grid_remove()
+            self.contact_sheet_frame.grid_remove()
+        elif mode == "缩略图":
+            self.single_frame_frame.grid_remove()
+            self.multi_frame_frame.grid_remove()
+            self.contact_sheet_frame.grid()
         else:  # 多帧序列
             self.single_frame_frame.grid_remove()
             self.multi_frame_frame.grid()
+            self.contact_sheet_frame.grid_remove()
     
     def _browse_input_file(self):
         """浏览并选择输入文件"""
@@ -492,6 +568,16 @@ class FormatConverterApp:
             # 根据输入文件自动生成输出文件路径
             self._suggest_output_file(filepath)
     
+    def _browse_input_dir(self):
+        """浏览并选择批量转换的输入目录"""
+        directory = filedialog.askdirectory(
+            title="选择批量转换的输入目录（也可以在输入框中填写通配符，例如 D:/videos/*.mkv）"
+        )
+        
+        if directory:
+            self.input_file.set(directory)
+            self._suggest_output_file(directory)
+    
     def _browse_output_file(self):
         """浏览并选择输出文件"""
         current_tab = self.notebook.index(self.notebook.select())
@@ -571,6 +657,13 @@ class FormatConverterApp:
         
         current_tab = self.notebook.index(self.notebook.select())
         
+        # 批量输入时，输出为"输出目录/*.扩展名"形式的模板
+        if current_tab in self.BATCH_TAB_OPERATIONS and is_batch_input(input_filepath):
+            input_dir = input_filepath if os.path.isdir(input_filepath) else os.path.dirname(input_filepath)
+            output_ext = {1: ".mp4", 2: ".mp3", 3: ".jpg", 4: ".mp3"}[current_tab]
+            self.output_file.set(os.path.join(input_dir, "converted", "*" + output_ext))
+            return
+        
         # 获取输入文件的目录和基本名称（不含扩展名）
         dirname = os.path.dirname(input_filepath)
         basename = os.path.splitext(os.path.basename(input_filepath))[0]
@@ -627,15 +720,16 @@ class FormatConverterApp:
 
     def _start_conversion(self):
         """开始转换"""
-        # 检查输入文件是否存在
+        # 获取当前选中的选项卡
+        current_tab = self.notebook.index(self.notebook.select())
+        
+        # 检查输入文件是否存在，支持批量转换的选项卡也可以输入目录或通配符
         input_file = self.input_file.get()
-        if not input_file or not os.path.isfile(input_file):
+        batch_mode = bool(input_file) and current_tab in self.BATCH_TAB_OPERATIONS and is_batch_input(input_file)
+        if not input_file or not (os.path.isfile(input_file) or batch_mode):
             messagebox.showerror("错误", "请选择有效的输入文件")
             return
         
-        # 获取当前选中的选项卡
-        current_tab = self.notebook.index(self.notebook.select())
-        
         # 提取视频帧需要检查输出目录
         if current_tab == 5:  # 提取视频帧
             output_dir = self.output_dir_var.get()
@@ -652,6 +746,11 @@ class FormatConverterApp:
                 messagebox.showerror("错误", "请指定输出文件")
                 return
                 
+            # 批量转换时输出文件名只用于确定扩展名
+            if batch_mode and not os.path.splitext(output_file)[1]:
+                messagebox.showerror("错误", "批量转换请按\"输出目录/*.扩展名\"的形式指定输出")
+                return
+            
             # 确保输出目录存在
             output_dir = os.path.dirname(output_file)
             if output_dir and not os.path.exists(output_dir):
@@ -667,11 +766,24 @@ class FormatConverterApp:
         
         # 设置状态和进度条
         self.is_converting = True
+        self.cancel_token = CancellationToken()
         self.progress_var.set(0)
         self.status_label.config(text="正在转换...")
         
         # 根据不同选项卡启动不同的转换任务
-        if current_tab == 0:  # 视频转GIF
+        if batch_mode:
+            output_file = self.output_file.get()
+            self.conversion_thread = threading.Thread(
+                target=self._batch_conversion_task,
+                args=(
+                    self.BATCH_TAB_OPERATIONS[current_tab],
+                    input_file,
+                    os.path.dirname(output_file),
+                    os.path.splitext(output_file)[1],
+                    self._get_operation_options(current_tab)
+                )
+            )
+        elif current_tab == 0:  # 视频转GIF
             self.conversion_thread = threading.Thread(
                 target=self._convert_video_to_gif_task, 
                 args=(input_file, self.output_file.get())
@@ -703,6 +815,11 @@ class FormatConverterApp:
                     target=self._extract_single_frame_task, 
                     args=(input_file, self.output_dir_var.get())
                 )
+            elif mode == "缩略图":
+                self.conversion_thread = threading.Thread(
+                    target=self._contact_sheet_task, 
+                    args=(input_file, self.output_dir_var.get())
+                )
             else:  # 多帧序列
                 self.conversion_thread = threading.Thread(
                     target=self._extract_frames_sequence_task, 
@@ -719,9 +836,9 @@ class FormatConverterApp:
             self.is_converting = False
             self.status_label.config(text="已取消转换")
             
-            # 由于我们直接结束线程可能会导致资源泄漏，我们通过标志位来控制
-            # 让转换任务自己检查标志位并正常退出
-            # 线程会在下一个检查点通过self.is_converting检测到取消信号
+            # 通过取消令牌终止正在运行的FFmpeg进程，转换任务会删除未完成的输出并返回
+            if self.cancel_token:
+                self.cancel_token.cancel()
             
             # 禁用取消按钮，启用转换按钮
             self.cancel_btn.config(state=tk.DISABLED)
@@ -732,6 +849,12 @@ class FormatConverterApp:
         if not self.is_converting:
             return
         
+        # FFmpeg任务的进度附带编码速度和剩余时间
+        speed = getattr(progress, "speed", 0)
+        eta = getattr(progress, "eta", None)
+        if speed > 0 and eta is not None:
+            self.status_label.config(text=f"正在转换... 速度 {speed:.2f}x，剩余约 {int(eta)} 秒")
+        
         # 更新进度条，确保进度值在0-1之间
         progress = max(0, min(1, progress))
         self.progress_var.set(progress * 100)
@@ -739,8 +862,12 @@ class FormatConverterApp:
         # 更新UI
         self.root.update_idletasks()
     
-    def _conversion_completed(self, success=True, error_message=""):
+    def _conversion_completed(self, success=True, error_message="", info_message=""):
         """转换完成后的处理"""
+        # 已取消的任务由_cancel_conversion更新界面
+        if isinstance(success, ConversionResult) and success.cancelled:
+            return
+        
         self.is_converting = False
         
         # 启用转换按钮，禁用取消按钮
@@ -751,11 +878,115 @@ class FormatConverterApp:
         if success:
             self.status_label.config(text="转换完成")
             self.progress_var.set(100)
-            messagebox.showinfo("完成", "转换成功完成")
+            messagebox.showinfo("完成", info_message or "转换成功完成")
         else:
             self.status_label.config(text="转换失败")
             messagebox.showerror("错误", f"转换失败: {error_message}")
     
+    def _get_operation_options(self, tab):
+        """
+        读取选项卡中的转换参数
+        
+        Args:
+            tab: 选项卡索引
+            
+        Returns:
+            dict: 传给对应转换方法的参数
+        """
+        if tab == 1:  # 视频格式转换
+            return {
+                "video_codec": self.video_codec_var.get(),
+                "audio_codec": self.audio_codec_var.get(),
+                "video_bitrate": self.video_bitrate_var.get(),
+                "audio_bitrate": self.audio_bitrate_var.get(),
+                "resolution": self.resolution_var.get(),
+                "fps": self.video_fps_var.get(),
+                "profile": self.video_profile_var.get(),
+            }
+        elif tab == 2:  # 音频格式转换
+            return {
+                "audio_codec": self.audio_only_codec_var.get(),
+                "audio_bitrate": self.audio_only_bitrate_var.get(),
+                "sample_rate": self.sample_rate_var.get(),
+                "channels": self.channels_var.get(),
+                "normalize_loudness": self.audio_loudnorm_var.get(),
+            }
+        elif tab == 3:  # 图片格式转换
+            resize = None
+            width = self.width_var.get()
+            height = self.height_var.get()
+            if width > 0 and height > 0:
+                resize = (width, height)
+            return {
+                "quality": self.image_quality_var.get(),
+                "resize": resize,
+                "rotate": self.rotation_var.get(),
+                "flip": self.flip_var.get(),
+                "mirror": self.mirror_var.get(),
+            }
+        elif tab == 4:  # 提取音频
+            return {
+                "audio_codec": self.extract_audio_codec_var.get(),
+                "audio_bitrate": self.extract_audio_bitrate_var.get(),
+                "normalize_loudness": self.extract_loudnorm_var.get(),
+            }
+        return {}
+    
+    def _batch_conversion_task(self, operation, input_pattern, output_dir, output_ext, options):
+        """批量转换任务"""
+        try:
+            # 总进度 = (已完成文件数 + 正在转换的文件各自的进度) / 总数
+            total_files = len(find_input_files(input_pattern, BATCH_OPERATIONS[operation]))
+            state = {"done": 0, "total": total_files, "running": {}}
+            state_lock = threading.Lock()
+            
+            def report_progress():
+                with state_lock:
+                    if not state["total"]:
+                        return
+                    progress = (state["done"] + sum(state["running"].values())) / state["total"]
+                self._update_progress(min(1.0, progress))
+            
+            def on_file_progress(input_path, progress):
+                with state_lock:
+                    state["running"][input_path] = float(progress)
+                report_progress()
+            
+            def on_file_done(item, done, total):
+                with state_lock:
+                    state["done"], state["total"] = done, total
+                    state["running"].pop(item["input"], None)
+                self.root.after(0, self.status_label.config, {"text": f"批量转换中... {done}/{total}"})
+                report_progress()
+            
+            batch_result = self.batch_converter.run(
+                operation,
+                input_pattern,
+                output_dir,
+                output_ext,
+                options=options,
+                file_callback=on_file_done,
+                progress_callback=on_file_progress,
+                cancel_token=self.cancel_token,
+                manifest=ConversionManifest.for_output_dir(output_dir)
+            )
+            
+            if self.cancel_token.is_cancelled:
+                return
+            
+            # 在主线程中执行UI更新
+            summary = batch_result.summary()
+            if not batch_result.results:
+                self.root.after(100, self._conversion_completed, False, "没有找到匹配的输入文件")
+            elif batch_result.failed:
+                self.root.after(100, self._conversion_completed, False, summary)
+            else:
+                self.root.after(100, self._conversion_completed, True, "", summary)
+            
+        except Exception as e:
+            # 在主线程中执行UI更新
+            self.root.after(100, self._conversion_completed, False, str(e))
+    
     def _convert_video_to_gif_task(self, input_file, output_file):
         """视频转GIF任务"""
         try:
@@ -767,7 +998,10 @@ class FormatConverterApp:
                 scale=self.scale_var.get(),
                 start_time=self.start_time_var.get(),
                 duration=self.duration_var.get(),
-                progress_callback=self._update_progress
+                progress_callback=self._update_progress,
+                streaming=self.gif_streaming_var.get(),
+                engine=self.gif_engine_var.get(),
+                cancel_token=self.cancel_token
             )
             
             # 在主线程中执行UI更新
@@ -789,11 +1023,14 @@ class FormatConverterApp:
                 audio_bitrate=self.audio_bitrate_var.get(),
                 resolution=self.resolution_var.get(),
                 fps=self.video_fps_var.get(),
-                progress_callback=self._update_progress
+                profile=self.video_profile_var.get(),
+                progress_callback=self._update_progress,
+                cancel_token=self.cancel_token
             )
             
             # 在主线程中执行UI更新
-            self.root.after(100, self._conversion_completed, result, "" if result else "转换失败，请检查输入文件格式和参数")
+            info_message = f"转换成功完成\n{result.message}" if result and result.message else ""
+            self.root.after(100, self._conversion_completed, result, "" if result else "转换失败，请检查输入文件格式和参数", info_message)
             
         except Exception as e:
             # 在主线程中执行UI更新
@@ -809,7 +1046,9 @@ class FormatConverterApp:
                 audio_bitrate=self.audio_only_bitrate_var.get(),
                 sample_rate=self.sample_rate_var.get(),
                 channels=self.channels_var.get(),
-                progress_callback=self._update_progress
+                normalize_loudness=self.audio_loudnorm_var.get(),
+                progress_callback=self._update_progress,
+                cancel_token=self.cancel_token
             )
             
             # 在主线程中执行UI更新
@@ -837,7 +1076,8 @@ class FormatConverterApp:
                 rotate=self.rotation_var.get(),
                 flip=self.flip_var.get(),
                 mirror=self.mirror_var.get(),
-                progress_callback=self._update_progress
+                progress_callback=self._update_progress,
+                cancel_token=self.cancel_token
             )
             
             # 在主线程中执行UI更新
@@ -855,7 +1095,9 @@ class FormatConverterApp:
                 output_file,
                 audio_codec=self.extract_audio_codec_var.get(),
                 audio_bitrate=self.extract_audio_bitrate_var.get(),
-                progress_callback=self._update_progress
+                normalize_loudness=self.extract_loudnorm_var.get(),
+                progress_callback=self._update_progress,
+                cancel_token=self.cancel_token
             )
             
             # 在主线程中执行UI更新
@@ -908,6 +1150,32 @@ class FormatConverterApp:
             # 在主线程中执行UI更新
             self.root.after(100, self._conversion_completed, False, str(e))
 
+    def _contact_sheet_task(self, input_file, output_dir):
+        """生成视频缩略图任务"""
+        try:
+            # 确定输出文件路径
+            basename = os.path.splitext(os.path.basename(input_file))[0]
+            output_file = os.path.join(output_dir, f"{basename}_contact_sheet.jpg")
+            
+            # 生成缩略图
+            result = self.timestamp_extractor.create_contact_sheet(
+                input_file,
+                output_file,
+                columns=self.sheet_columns_var.get(),
+                rows=self.sheet_rows_var.get(),
+                thumb_width=self.sheet_thumb_width_var.get(),
+                keyframes_only=self.sheet_keyframes_var.get(),
+                progress_callback=self._update_progress,
+                cancel_token=self.cancel_token
+            )
+            
+            # 在主线程中执行UI更新
+            self.root.after(100, self._conversion_completed, result, "" if result else "生成缩略图失败，请检查输入文件格式和参数")
+            
+        except Exception as e:
+            # 在主线程中执行UI更新
+            self.root.after(100, self._conversion_completed, False, str(e))
+
 def main():
     """格式转换工具主函数"""
     root = tk.Tk()
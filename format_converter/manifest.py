@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# 作者：道相抖音@慈悲剪辑，技术问题点关注留言
+
+"""
+转换清单
+记录每个成功转换任务的输入文件标识、转换参数和输出文件，
+重新运行时跳过输入和参数都没有变化且输出仍然存在的任务
+"""
+
+import os
+import json
+import hashlib
+import tempfile
+import threading
+from typing import Dict, Any
+
+# 清单文件默认保存在输出目录中
+MANIFEST_FILENAME = ".format_converter_manifest.json"
+
+def hash_file(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+    """
+    计算文件内容的哈希值
+    
+    Args:
+        file_path: 文件路径
+        chunk_size: 每次读取的字节数
+    
+    Returns:
+        str: blake2b哈希的十六进制字符串
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def hash_options(operation: str, options: Dict[str, Any]) -> str:
+    """
+    计算转换操作和参数的摘要
+    
+    Args:
+        operation: 操作名称
+        options: 转换参数
+    
+    Returns:
+        str: 摘要字符串
+    """
+    text = json.dumps([operation, options], sort_keys=True, default=str)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+class ConversionManifest:
+    """转换清单，以输出文件的绝对路径为键保存转换记录"""
+    
+    def __init__(self, path: str, use_hash: bool = False, autosave_every: int = 50):
+        """
+        初始化转换清单
+        
+        Args:
+            path: 清单文件路径，文件不存在时创建新的清单
+            use_hash: 输入文件的大小或修改时间变化时，是否再比较内容哈希，
+                      适合文件被复制或touch但内容不变的场景
+            autosave_every: 每记录多少个任务自动保存一次
+        """
+        self.path = path
+        self.use_hash = use_hash
+        self.autosave_every = autosave_every
+        self.entries = {}
+        self._dirty = 0
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        
+        if os.path.isfile(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.entries = json.load(f).get("entries", {})
+            except (OSError, ValueError) as e:
+                print(f"读取转换清单失败，将重新记录: {str(e)}")
+                self.entries = {}
+    
+    @classmethod
+    def for_output_dir(cls, output_dir: str, **kwargs) -> "ConversionManifest":
+        """
+        创建保存在输出目录中的清单
+        
+        Args:
+            output_dir: 输出目录
+            **kwargs: 其他传给构造函数的参数
+        
+        Returns:
+            ConversionManifest: 转换清单
+        """
+        return cls(os.path.join(output_dir, MANIFEST_FILENAME), **kwargs)
+    
+    def is_up_to_date(self, operation: str, input_path: str, output_path: str,
+                      options: Dict[str, Any]) -> bool:
+        """
+        判断任务是否可以跳过
+        
+        Args:
+            operation: 操作名称
+            input_path: 输入文件路径
+            output_path: 输出文件路径
+            options: 转换参数
+        
+        Returns:
+            bool: 输入文件、转换参数都未变化且输出文件仍然存在时返回True
+        """
+        with self._lock:
+            entry = self.entries.get(os.path.abspath(output_path))
+        if not entry:
+            return False
+        
+        if entry["input"] != os.path.abspath(input_path) or entry["options"] != hash_options(operation, options):
+            return False
+        
+        try:
+            input_stat = os.stat(input_path)
+            output_stat = os.stat(output_path)
+        except OSError:
+            return False
+        
+        # 输出文件被删除、替换或截断时需要重新转换
+        if output_stat.st_size != entry["output_size"] or output_stat.st_mtime_ns != entry["output_mtime_ns"]:
+            return False
+        
+        if input_stat.st_size == entry["size"] and input_stat.st_mtime_ns == entry["mtime_ns"]:
+            return True
+        
+        if not self.use_hash or not entry.get("hash") or input_stat.st_size != entry["size"]:
+            return False
+        
+        try:
+            unchanged = hash_file(input_path) == entry["hash"]
+        except OSError:
+            return False
+        
+        if unchanged:
+            # 内容未变，更新修改时间以免下次再计算哈希
+            with self._lock:
+                entry["mtime_ns"] = input_stat.st_mtime_ns
+                self._dirty += 1
+        return unchanged
+    
+    def record(self, operation: str, input_path: str, output_path: str, options: Dict[str, Any]):
+        """
+        记录一个成功的转换任务
+        
+        Args:
+            operation: 操作名称
+            input_path: 输入文件路径
+            output_path: 输出文件路径
+            options: 转换参数
+        """
+        try:
+            input_stat = os.stat(input_path)
+            output_stat = os.stat(output_path)
+            file_hash = hash_file(input_path) if self.use_hash else ""
+        except OSError:
+            return
+        
+        entry = {
+            "input": os.path.abspath(input_path),
+            "size": input_stat.st_size,
+            "mtime_ns": input_stat.st_mtime_ns,
+            "hash": file_hash,
+            "operation": operation,
+            "options": hash_options(operation, options),
+            "output_size": output_stat.st_size,
+            "output_mtime_ns": output_stat.st_mtime_ns,
+        }
+        
+        with self._lock:
+            self.entries[os.path.abspath(output_path)] = entry
+            self._dirty += 1
+            should_save = self._dirty >= self.autosave_every
+        
+        if should_save:
+            self.save()
+    
+    def save(self):
+        """把清单写入文件（先写临时文件再替换，避免中断时损坏清单）"""
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty and os.path.isfile(self.path):
+                    return
+                data = json.dumps({"version": 1, "entries": self.entries}, ensure_ascii=False, indent=1)
+                self._dirty = 0
+            
+            directory = os.path.dirname(os.path.abspath(self.path))
+            temp_path = None
+            try:
+                os.makedirs(directory, exist_ok=True)
+                fd, temp_path = tempfile.mkstemp(prefix=".manifest_", dir=directory)
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    f.write(data)
+                os.replace(temp_path, self.path)
+            except OSError as e:
+                print(f"保存转换清单失败: {str(e)}")
+                if temp_path and os.path.exists(temp_path):
+                    os.remove(temp_path)
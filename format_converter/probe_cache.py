@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# 作者：道相抖音@慈悲剪辑，技术问题点关注留言
+
+"""
+媒体信息缓存
+按文件绝对路径、大小和修改时间缓存ffprobe的解析结果，避免重复启动ffprobe进程
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Any, Tuple
+
+def default_cache_path() -> str:
+    """
+    获取默认的缓存数据库路径
+    
+    Returns:
+        str: Windows下位于%LOCALAPPDATA%，其他系统位于~/.cache
+    """
+    if os.name == 'nt':
+        base_dir = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    else:
+        base_dir = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base_dir, "mytools", "format_converter", "probe_cache.sqlite3")
+
+class ProbeCache:
+    """
+    持久化的媒体信息缓存
+    
+    数据保存在SQLite中，按最近访问时间淘汰超出上限的条目；
+    进程内另有一层小的LRU缓存，重复查询只需一次stat调用
+    """
+    
+    def __init__(self, db_path: str = "", max_entries: int = 50000, memory_entries: int = 1024):
+        """
+        初始化缓存
+        
+        Args:
+            db_path: 数据库文件路径，默认使用default_cache_path()，":memory:"表示不持久化
+            max_entries: 数据库中最多保存的条目数
+            memory_entries: 进程内缓存的条目数
+        """
+        self.db_path = db_path or default_cache_path()
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._count = 0
+        
+        try:
+            if self.db_path != ":memory:":
+                os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, timeout=5, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "path TEXT NOT NULL, tag TEXT NOT NULL, size INTEGER NOT NULL, "
+                "mtime_ns INTEGER NOT NULL, data TEXT NOT NULL, last_access REAL NOT NULL, "
+                "PRIMARY KEY (path, tag))"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON entries (last_access)")
+            self._conn.commit()
+            self._count = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        except (sqlite3.Error, OSError) as e:
+            # 数据库不可用时只使用进程内缓存
+            print(f"媒体信息缓存不可用: {str(e)}")
+            self._conn = None
+    
+    @staticmethod
+    def _file_identity(file_path: str) -> Optional[Tuple[str, int, int]]:
+        """
+        获取文件标识
+        
+        Returns:
+            tuple: (绝对路径, 大小, 修改时间纳秒)，文件不存在时返回None
+        """
+        try:
+            path = os.path.abspath(file_path)
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return path, stat.st_size, stat.st_mtime_ns
+    
+    def get(self, file_path: str, tag: str = "") -> Optional[Dict[str, Any]]:
+        """
+        查询缓存
+        
+        Args:
+            file_path: 媒体文件路径
+            tag: 附加的缓存键，用于区分同一文件的不同分析结果，默认为ffprobe信息
+        
+        Returns:
+            dict: 缓存的数据，文件已变化或未缓存时返回None
+        """
+        identity = self._file_identity(file_path)
+        if identity is None:
+            return None
+        path, size, mtime_ns = identity
+        key = (path, tag)
+        
+        with self._lock:
+            cached = self._memory.get(key)
+            if cached is not None and cached[0] == size and cached[1] == mtime_ns:
+                self._memory.move_to_end(key)
+                return json.loads(cached[2])
+            
+            if self._conn is None:
+                return None
+            
+            try:
+                row = self._conn.execute(
+                    "SELECT size, mtime_ns, data FROM entries WHERE path = ? AND tag = ?", key
+                ).fetchone()
+                if row is None or row[0] != size or row[1] != mtime_ns:
+                    return None
+                self._conn.execute(
+                    "UPDATE entries SET last_access = ? WHERE path = ? AND tag = ?",
+                    (time.time(), path, tag)
+                )
+                self._conn.commit()
+            except sqlite3.Error:
+                return None
+            
+            self._remember(key, size, mtime_ns, row[2])
+            return json.loads(row[2])
+    
+    def put(self, file_path: str, data: Dict[str, Any], tag: str = ""):
+        """
+        写入缓存
+        
+        Args:
+            file_path: 媒体文件路径
+            data: 要缓存的数据，必须可以序列化为JSON
+            tag: 附加的缓存键
+        """
+        identity = self._file_identity(file_path)
+        if identity is None:
+            return
+        path, size, mtime_ns = identity
+        text = json.dumps(data, ensure_ascii=False)
+        
+        with self._lock:
+            self._remember((path, tag), size, mtime_ns, text)
+            
+            if self._conn is None:
+                return
+            
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO entries (path, tag, size, mtime_ns, data, last_access) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (path, tag, size, mtime_ns, text, time.time())
+                )
+                # 替换已有条目时也会计数，超出上限时_evict会重新统计
+                self._count += 1
+                if self._count > self.max_entries:
+                    self._evict()
+                self._conn.commit()
+            except sqlite3.Error:
+                pass
+    
+    def _remember(self, key: Tuple[str, str], size: int, mtime_ns: int, text: str):
+        """写入进程内LRU缓存"""
+        self._memory[key] = (size, mtime_ns, text)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+    
+    def _evict(self):
+        """淘汰最久未访问的条目，一次删除到上限的90%以减少淘汰次数"""
+        self._count = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        if self._count <= self.max_entries:
+            return
+        
+        keep = int(self.max_entries * 0.9)
+        self._conn.execute(
+            "DELETE FROM entries WHERE rowid IN ("
+            "SELECT rowid FROM entries ORDER BY last_access ASC LIMIT ?)",
+            (max(0, self._count - keep),)
+        )
+        self._count = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+    
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._memory.clear()
+            if self._conn is not None:
+                try:
+                    self._conn.execute("DELETE FROM entries")
+                    self._conn.commit()
+                    self._count = 0
+                except sqlite3.Error:
+                    pass
+    
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,441 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# 作者：道相抖音@慈悲剪辑，技术问题点关注留言
+
+"""
+转换任务的性能记录
+FormatConverter的每次convert_*、extract_*和get_media_info调用结束后生成一条记录（字典），包括：
+总耗时、每个子进程的启动延迟/首次输出时间/运行时间/CPU时间/峰值内存、Python侧各阶段耗时
+（例如PIL合成GIF）、输入输出字节数和实时倍率（媒体时长/处理耗时）。
+记录交给通过FormatConverter.add_telemetry_sink注册的接收函数，例如JsonlTelemetrySink写入JSONL文件。
+没有注册接收函数时不做任何统计
+"""
+
+import os
+import sys
+import json
+import time
+import inspect
+import functools
+import threading
+import subprocess
+from contextlib import contextmanager
+from typing import List, Dict, Optional, Callable, Any
+
+# 接收函数的类型，参数为一条记录
+TelemetrySink = Callable[[Dict[str, Any]], None]
+
+# 识别被装饰方法的输入、输出参数
+_INPUT_PARAMETERS = ("input_path", "video_path", "file_path")
+_OUTPUT_PARAMETERS = ("output_path", "output_dir")
+
+# 每个线程当前正在记录的调用，嵌套调用时后进先出
+_local = threading.local()
+
+class _Span:
+    """一次被记录的调用"""
+    
+    def __init__(self, operation: str, input_path: str = "", output_path: str = "",
+                 parent: Optional["_Span"] = None):
+        self.operation = operation
+        self.input_path = input_path
+        self.output_path = output_path
+        self.parent = parent
+        self.started = time.time()
+        self.media_duration = 0.0
+        self.processes = []
+        self.phases = {}
+        self._lock = threading.Lock()
+    
+    def add_process(self, stats: Dict[str, Any]):
+        """添加一个已结束的子进程的统计"""
+        with self._lock:
+            self.processes.append(stats)
+    
+    def add_phase(self, name: str, seconds: float):
+        """累加Python侧某个阶段的耗时"""
+        with self._lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+    
+    def to_record(self, elapsed: float, success: bool, cancelled: bool = False,
+                  message: str = "") -> Dict[str, Any]:
+        """
+        生成记录
+        
+        Args:
+            elapsed: 调用耗时（秒）
+            success: 是否成功
+            cancelled: 是否被取消
+            message: 结果说明
+        
+        Returns:
+            dict: 性能记录
+        """
+        with self._lock:
+            processes = list(self.processes)
+            phases = {name: round(seconds, 6) for name, seconds in self.phases.items()}
+        
+        rss_values = [p["max_rss"] for p in processes if p.get("max_rss") is not None]
+        peak_values = [p["peak_rss"] for p in processes if p.get("peak_rss") is not None]
+        cpu_values = [p["user"] + p["system"] for p in processes if p.get("user") is not None]
+        return {
+            "operation": self.operation,
+            "parent": self.parent.operation if self.parent else None,
+            "input": self.input_path,
+            "output": self.output_path,
+            "started": self.started,
+            "elapsed": round(elapsed, 6),
+            "success": success,
+            "cancelled": cancelled,
+            "message": message,
+            "bytes_in": _path_size(self.input_path),
+            "bytes_out": _path_size(self.output_path, self.started),
+            "media_duration": self.media_duration,
+            "realtime_factor": round(self.media_duration / elapsed, 3) if self.media_duration and elapsed > 0 else None,
+            "process_count": len(processes),
+            "spawn_latency": round(sum(p["spawn"] for p in processes), 6),
+            "process_time": round(sum(p["wall"] for p in processes), 6),
+            "child_cpu_time": round(sum(cpu_values), 6) if cpu_values else None,
+            "child_max_rss": max(rss_values) if rss_values else None,
+            "child_peak_rss": max(peak_values) if peak_values else None,
+            "phases": phases,
+            "processes": processes,
+        }
+
+def _path_size(path: str, modified_after: float = 0) -> Optional[int]:
+    """
+    获取文件大小；目录时为其中（modified_after之后修改的）文件大小之和
+    
+    Returns:
+        int: 字节数，路径不存在时返回None
+    """
+    if not path:
+        return None
+    try:
+        if os.path.isdir(path):
+            total = 0
+            for entry in os.scandir(path):
+                if entry.is_file():
+                    stat = entry.stat()
+                    if stat.st_mtime >= modified_after:
+                        total += stat.st_size
+            return total
+        return os.path.getsize(path)
+    except OSError:
+        return None
+
+def current_span() -> Optional[_Span]:
+    """当前线程正在记录的调用，没有时返回None"""
+    stack = getattr(_local, "stack", None)
+    return stack[-1] if stack else None
+
+@contextmanager
+def _activate(span: _Span):
+    """在当前线程中把span设为正在记录的调用"""
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    stack.append(span)
+    try:
+        yield span
+    finally:
+        stack.pop()
+
+def bind(func: Callable) -> Callable:
+    """
+    让函数在其他线程中运行时也记录到当前调用，用于提交到线程池的任务
+    
+    Args:
+        func: 要在其他线程中运行的函数
+    
+    Returns:
+        Callable: 包装后的函数，当前没有正在记录的调用时返回原函数
+    """
+    span = current_span()
+    if span is None:
+        return func
+    
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with _activate(span):
+            return func(*args, **kwargs)
+    
+    return wrapper
+
+@contextmanager
+def phase(name: str):
+    """
+    统计Python侧某个阶段的耗时，同名阶段多次进入时累加
+    
+    Args:
+        name: 阶段名称，例如"gif_assembly"
+    """
+    span = current_span()
+    if span is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        span.add_phase(name, time.perf_counter() - start)
+
+def emit(sinks: List[TelemetrySink], record: Dict[str, Any]):
+    """把记录交给所有接收函数，接收函数出错不影响转换"""
+    for sink in list(sinks):
+        try:
+            sink(record)
+        except Exception as e:
+            print(f"性能记录输出出错: {str(e)}")
+
+def track_process(process: subprocess.Popen, cmd: List[str], spawn_latency: float):
+    """
+    开始统计刚启动的子进程，结束时由wait_process记录到当前调用
+    
+    Args:
+        process: 子进程
+        cmd: 命令参数
+        spawn_latency: 从调用Popen到进程启动完成的耗时（秒）
+    """
+    span = current_span()
+    if span is None:
+        return
+    process.telemetry = {
+        "span": span,
+        "program": os.path.basename(str(cmd[0])),
+        "spawn": spawn_latency,
+        "start": time.perf_counter(),
+        "first_output": None,
+        "peak_rss": None,
+        "last_sample": 0.0,
+    }
+
+def mark_first_output(process: subprocess.Popen):
+    """记录子进程第一次输出数据的时间，即FFmpeg完成打开输入、初始化编解码器所用的时间"""
+    stats = getattr(process, "telemetry", None)
+    if stats is not None and stats["first_output"] is None:
+        stats["first_output"] = time.perf_counter() - stats["start"]
+
+def _exit_code(status: int) -> int:
+    """把waitpid的状态转换为与Popen.returncode相同的返回码"""
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+def _read_peak_rss(pid: int) -> Optional[int]:
+    """
+    读取Linux进程exec之后的峰值内存（/proc/<pid>/status中的VmHWM）
+    
+    Returns:
+        int: 字节数，进程已经退出（僵尸进程没有VmHWM）或读取失败时返回None
+    """
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+def sample_peak_rss(process: subprocess.Popen, interval: float = 0.1):
+    """
+    在子进程运行期间采样它的峰值内存（仅Linux），由读取子进程输出的循环调用
+    
+    ru_maxrss包含exec之前从父进程复制来的内存，父进程内存较大时偏大，因此另外记录VmHWM；
+    只在进程尚未被回收时读取/proc，回收后进程号可能已经属于其他进程
+    
+    Args:
+        process: 子进程
+        interval: 两次采样的最小间隔（秒）
+    """
+    stats = getattr(process, "telemetry", None)
+    if stats is None or not sys.platform.startswith("linux"):
+        return
+    now = time.perf_counter()
+    if now - stats["last_sample"] < interval:
+        return
+    stats["last_sample"] = now
+    
+    # 持有Popen内部的锁期间其他线程不能回收进程，returncode为None说明进程号仍属于它
+    lock = getattr(process, "_waitpid_lock", None)
+    if lock is None or not lock.acquire(False):
+        return
+    try:
+        if process.returncode is None:
+            peak_rss = _read_peak_rss(process.pid)
+            if peak_rss is not None:
+                stats["peak_rss"] = max(peak_rss, stats["peak_rss"] or 0)
+    finally:
+        lock.release()
+
+def wait_process(process: subprocess.Popen) -> int:
+    """
+    等待子进程结束；正在统计时用wait4取得该进程自己的CPU时间和峰值内存
+    
+    Args:
+        process: 子进程
+    
+    Returns:
+        int: 返回码
+    """
+    stats = getattr(process, "telemetry", None)
+    if stats is None:
+        return process.wait()
+    process.telemetry = None
+    
+    rusage = None
+    if hasattr(os, "wait4"):
+        # 持有Popen内部的锁，避免取消时其他线程的wait/poll同时回收进程
+        lock = getattr(process, "_waitpid_lock", None) or threading.Lock()
+        with lock:
+            if process.returncode is None:
+                try:
+                    _, status, rusage = os.wait4(process.pid, 0)
+                    process.returncode = _exit_code(status)
+                except ChildProcessError:
+                    pass
+    process.wait()
+    
+    record = {
+        "program": stats["program"],
+        "spawn": round(stats["spawn"], 6),
+        "first_output": round(stats["first_output"], 6) if stats["first_output"] is not None else None,
+        "wall": round(time.perf_counter() - stats["start"], 6),
+        "user": None,
+        "system": None,
+        "max_rss": None,
+        "peak_rss": stats["peak_rss"],
+        "returncode": process.returncode,
+    }
+    if rusage is not None:
+        record["user"] = round(rusage.ru_utime, 6)
+        record["system"] = round(rusage.ru_stime, 6)
+        # Linux的ru_maxrss单位是KB，macOS是字节
+        record["max_rss"] = rusage.ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+    stats["span"].add_process(record)
+    return process.returncode
+
+def _get_sinks(owner) -> List[TelemetrySink]:
+    """FormatConverter或VideoTimestampExtractor的接收函数列表"""
+    converter = getattr(owner, "converter", owner)
+    return getattr(converter, "telemetry_sinks", None) or []
+
+def _lookup_media_duration(owner, path: str) -> float:
+    """从媒体信息缓存中查找时长，不调用ffprobe"""
+    converter = getattr(owner, "converter", owner)
+    cache = getattr(converter, "probe_cache", None)
+    if cache is None or not path or not os.path.isfile(path):
+        return 0.0
+    try:
+        cached = cache.get(path)
+    except Exception:
+        return 0.0
+    return (cached or {}).get("duration", 0.0) or 0.0
+
+def _clip_duration(total: float, arguments: Dict[str, Any]) -> float:
+    """按调用参数中的start_time和duration计算实际处理的媒体时长"""
+    start_time = arguments.get("start_time") or 0
+    duration = arguments.get("duration") or 0
+    if total > 0:
+        total = max(0.0, total - start_time)
+    if duration > 0 and (total <= 0 or duration < total):
+        total = duration
+    return total
+
+def instrumented(func: Callable) -> Callable:
+    """
+    装饰转换、提取和get_media_info方法，每次调用结束后生成一条性能记录
+    
+    没有注册接收函数时直接调用原方法
+    
+    Args:
+        func: 被装饰的方法，第一个参数为输入路径，名为output_path或output_dir的参数为输出路径
+    
+    Returns:
+        Callable: 包装后的方法
+    """
+    signature = inspect.signature(func)
+    names = list(signature.parameters)
+    input_name = next((n for n in names if n in _INPUT_PARAMETERS), None)
+    output_name = next((n for n in names if n in _OUTPUT_PARAMETERS), None)
+    
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        sinks = _get_sinks(self)
+        if not sinks:
+            return func(self, *args, **kwargs)
+        
+        arguments = signature.bind_partial(self, *args, **kwargs).arguments
+        input_path = str(arguments.get(input_name, "") or "")
+        output_path = str(arguments.get(output_name, "") or "")
+        parent = current_span()
+        span = _Span(func.__name__, input_path, output_path, parent)
+        
+        start = time.perf_counter()
+        result = None
+        try:
+            with _activate(span):
+                result = func(self, *args, **kwargs)
+            return result
+        finally:
+            elapsed = time.perf_counter() - start
+            if isinstance(result, dict):
+                # 转换过程中查询输入文件的媒体信息时，顺便得到转换的媒体时长
+                if parent is not None and parent.input_path == input_path and not parent.media_duration:
+                    parent.media_duration = result.get("duration", 0.0) or 0.0
+            elif result:
+                total = span.media_duration or _lookup_media_duration(self, input_path)
+                span.media_duration = _clip_duration(total, arguments)
+            
+            emit(sinks, span.to_record(
+                elapsed, success=bool(result),
+                cancelled=bool(getattr(result, "cancelled", False)),
+                message=getattr(result, "message", "") or ""
+            ))
+    
+    return wrapper
+
+def record_item(sinks: List[TelemetrySink], operation: str, item: Dict[str, Any],
+                worker: Optional[int] = None):
+    """
+    为在子进程中完成的单个文件生成记录（子进程中无法统计各阶段，只有耗时和字节数）
+    
+    Args:
+        sinks: 接收函数列表
+        operation: 操作名称
+        item: 结果字典，包括input、output、success、cancelled、message和elapsed
+        worker: 完成该文件的子进程编号
+    """
+    span = _Span(operation, item["input"], item["output"], current_span())
+    span.started = time.time() - item["elapsed"]
+    record = span.to_record(item["elapsed"], item["success"], item["cancelled"], item["message"])
+    record["worker"] = worker
+    emit(sinks, record)
+
+class JsonlTelemetrySink:
+    """把性能记录逐行追加到JSONL文件的接收函数，可以在多个线程中同时使用"""
+    
+    def __init__(self, path: str):
+        """
+        Args:
+            path: JSONL文件路径，不存在时创建
+        """
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+    
+    def __call__(self, record: Dict[str, Any]):
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self._lock:
+            if self._file.closed:
+                return
+            self._file.write(line + "\n")
+            self._file.flush()
+    
+    def close(self):
+        """关闭文件"""
+        with self._lock:
+            self._file.close()
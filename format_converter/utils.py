@@ -8,21 +8,591 @@
 """
 
 import os
+import io
+import json
 import sys
+import signal
+import time
+import struct
+import itertools
 import threading
 import tempfile
 import shutil
 import subprocess
-from typing import List, Dict, Tuple, Optional, Union, Callable, Any
-from PIL import Image
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from typing import List, Dict, Tuple, Optional, Union, Callable, Any, Iterator, Iterable
+from PIL import Image, ImageChops, ImageStat
+
+from .probe_cache import ProbeCache
+from . import telemetry
+from .telemetry import instrumented, TelemetrySink
+
+def _split_gif_frame(data: bytes) -> Tuple[bytes, Optional[int], bytes, bytes]:
+    """
+    拆分PIL写出的单帧GIF数据
+    
+    Args:
+        data: 单帧GIF文件内容
+    
+    Returns:
+        tuple: (颜色表, 透明色索引或None, 图像描述符(不含颜色表), LZW图像数据)
+    """
+    packed = data[10]
+    pos = 13
+    color_table = b""
+    if packed & 0x80:
+        table_size = 3 * (2 ** ((packed & 0x07) + 1))
+        color_table = data[pos:pos + table_size]
+        pos += table_size
+    
+    transparency = None
+    while pos < len(data):
+        block = data[pos]
+        if block == 0x21:  # 扩展块
+            label = data[pos + 1]
+            if label == 0xF9 and data[pos + 3] & 0x01:
+                transparency = data[pos + 6]
+            pos += 2
+            while data[pos]:
+                pos += data[pos] + 1
+            pos += 1
+        elif block == 0x2C:  # 图像描述符
+            descriptor = data[pos:pos + 10]
+            pos += 10
+            if descriptor[9] & 0x80:
+                table_size = 3 * (2 ** ((descriptor[9] & 0x07) + 1))
+                color_table = data[pos:pos + table_size]
+                pos += table_size
+            # LZW最小码长 + 数据子块 + 块终止符
+            start = pos
+            pos += 1
+            while data[pos]:
+                pos += data[pos] + 1
+            pos += 1
+            return color_table, transparency, descriptor, data[start:pos]
+        else:
+            break
+    
+    raise ValueError("无效的GIF帧数据")
+
+class _GifStreamWriter:
+    """
+    逐帧写入GIF文件，内存中只保留当前帧和当前画面
+    
+    第一帧生成全局调色板，之后的帧映射到全局调色板，映射误差过大（例如场景切换、出现
+    全局调色板中没有的颜色）时才为变化区域单独生成局部调色板；每帧只写出比当前画面更接近
+    源画面的矩形区域，区域内未变化的像素设为透明，没有变化的帧合并到上一帧的延迟中。
+    编码耗时与帧数成正比
+    """
+    
+    # 透明色索引，调色板的其余255个索引用于颜色
+    TRANSPARENT_INDEX = 255
+    # 映射到全局调色板后变化区域的平均误差（各通道差的最大值）超过该值时使用局部调色板
+    LOCAL_PALETTE_ERROR = 8.0
+    # 当前画面和全局调色板都与源画面相差超过该值的像素用局部调色板写出
+    MISMATCH_THRESHOLD = 16
+    # 这样的像素在其所在矩形中的占比或占整个画面的比例超过以下值时才使用局部调色板
+    UNREPRESENTED_DENSITY = 0.25
+    UNREPRESENTED_AREA = 0.005
+    # 变化区域中与当前画面相同的像素占比达到该值时才设为透明
+    TRANSPARENT_MIN_RATIO = 0.5
+    
+    def __init__(self, output_path: str, loop: int = 0):
+        """
+        初始化GIF流式写入器
+        
+        Args:
+            output_path: 输出GIF文件路径
+            loop: 循环次数，0表示无限循环
+        """
+        self.output_path = output_path
+        self.loop = loop
+        self.frame_count = 0
+        self._file = open(output_path, "wb")
+        self._size = None
+        self._elapsed_ms = 0.0
+        self._written_cs = 0
+        # 全局调色板（映射用的P模式图像）、全局颜色表和当前画面（RGB）
+        self._palette_image = None
+        self._global_table = b""
+        self._canvas = None
+        # 已编码但尚未写入的帧：(是否有透明像素, 图像描述符及数据)，以及它的持续时间
+        self._pending = None
+        self._pending_ms = 0.0
+    
+    @staticmethod
+    def _max_channel_difference(a: Image.Image, b: Image.Image) -> Image.Image:
+        """两幅RGB图像逐像素各通道差的最大值（L模式）"""
+        r, g, b = ImageChops.difference(a, b).split()
+        return ImageChops.lighter(ImageChops.lighter(r, g), b)
+    
+    @staticmethod
+    def _color_table(palette: List[int]) -> bytes:
+        """把调色板补齐为256色的颜色表"""
+        return bytes(palette[:765]).ljust(768, b"\x00")
+    
+    def _write_header(self, size: Tuple[int, int], color_table: bytes):
+        """写入文件头、逻辑屏幕描述符、全局颜色表和循环扩展"""
+        self._size = size
+        self._file.write(b"GIF89a" + struct.pack("<HH", *size) + b"\xF7\x00\x00" + color_table)
+        self._file.write(
+            b"\x21\xFF\x0BNETSCAPE2.0\x03\x01" + struct.pack("<H", self.loop) + b"\x00"
+        )
+    
+    def _next_delay(self, duration_ms: float) -> int:
+        """计算下一帧的延迟（百分之一秒），累计误差避免帧率漂移"""
+        self._elapsed_ms += duration_ms
+        delay = int(round(self._elapsed_ms / 10)) - self._written_cs
+        self._written_cs += delay
+        return delay
+    
+    def add_frame(self, image: Image.Image, duration_ms: float):
+        """
+        写入一帧
+        
+        Args:
+            image: 帧图像，调用返回后不再引用
+            duration_ms: 帧持续时间（毫秒）
+        """
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        self.frame_count += 1
+        
+        if self._size is None:
+            indexed = image.quantize(colors=255)
+            palette = indexed.getpalette()[:765]
+            self._palette_image = Image.new("P", (1, 1))
+            self._palette_image.putpalette(palette)
+            self._global_table = self._color_table(palette)
+            self._write_header(image.size, self._global_table)
+            self._canvas = indexed.convert("RGB")
+            self._queue_frame(indexed, (0, 0), None, False, duration_ms)
+            return
+        
+        indexed = image.quantize(palette=self._palette_image, dither=Image.NONE)
+        shown = indexed.convert("RGB")
+        # 变化的像素：映射到全局调色板后比当前画面更接近源画面的像素，以及当前画面和全局调色板
+        # 都与源画面相差过大的像素（例如全局调色板中没有的新颜色），后者只能用局部调色板表示
+        threshold = self.MISMATCH_THRESHOLD
+        canvas_error = self._max_channel_difference(image, self._canvas)
+        shown_error = self._max_channel_difference(image, shown)
+        improved = ImageChops.subtract(canvas_error, shown_error).getbbox()
+        mask = ImageChops.darker(canvas_error, shown_error).point(lambda value: 255 if value > threshold else 0)
+        unrepresented = mask.getbbox()
+        if unrepresented:
+            count = mask.histogram()[255]
+            box_area = (unrepresented[2] - unrepresented[0]) * (unrepresented[3] - unrepresented[1])
+            if (count < box_area * self.UNREPRESENTED_DENSITY and
+                    count < image.width * image.height * self.UNREPRESENTED_AREA):
+                # 零星的噪点用全局调色板中最接近的颜色表示
+                unrepresented = None
+        boxes = [b for b in (improved, unrepresented) if b]
+        if not boxes:
+            # 画面没有变化，延长上一帧的显示时间
+            self._pending_ms += duration_ms
+            return
+        box = (min(b[0] for b in boxes), min(b[1] for b in boxes), max(b[2] for b in boxes), max(b[3] for b in boxes))
+        
+        region = indexed.crop(box)
+        shown_region = shown.crop(box)
+        color_table = None
+        error = ImageStat.Stat(shown_error.crop(box)).mean[0]
+        if unrepresented or error > self.LOCAL_PALETTE_ERROR:
+            region = image.crop(box).quantize(colors=255)
+            color_table = self._color_table(region.getpalette())
+            shown_region = region.convert("RGB")
+        
+        # 与当前画面相同的像素设为透明，解码时保留上一帧的像素；这样的像素太少时零散的透明像素
+        # 反而打断LZW编码中重复的序列，不使用透明
+        changed = self._max_channel_difference(shown_region, self._canvas.crop(box))
+        unchanged = changed.point(lambda value: 255 if value == 0 else 0)
+        transparent = unchanged.histogram()[255] >= region.width * region.height * self.TRANSPARENT_MIN_RATIO
+        if transparent:
+            region.paste(self.TRANSPARENT_INDEX, mask=unchanged)
+        
+        self._canvas.paste(shown_region, box)
+        self._queue_frame(region, box[:2], color_table, transparent, duration_ms)
+    
+    def _queue_frame(self, indexed: Image.Image, offset: Tuple[int, int], color_table: Optional[bytes],
+                     transparent: bool, duration_ms: float):
+        """
+        编码一帧并暂存，写入上一帧；暂存是为了把之后相同的帧合并到这一帧的延迟中
+        
+        Args:
+            indexed: 帧区域的P模式图像，索引对应全局颜色表或color_table
+            offset: 区域在画面中的位置
+            color_table: 局部颜色表，None表示使用全局颜色表
+            transparent: 区域中是否有透明像素
+            duration_ms: 帧持续时间（毫秒）
+        """
+        self._flush_pending()
+        
+        # 调色板补齐256色，LZW最小码长为8位，透明色索引255可以编码；
+        # optimize=False时Pillow不重新排列索引，写出的图像数据与indexed的索引一致
+        indexed.putpalette(list(color_table or self._global_table))
+        buffer = io.BytesIO()
+        indexed.save(buffer, format="GIF", interlace=False, optimize=False)
+        image_data = _split_gif_frame(buffer.getvalue())[3]
+        
+        packed = 0x87 if color_table else 0x00
+        descriptor = b"\x2C" + struct.pack("<HHHH", offset[0], offset[1], *indexed.size) + bytes([packed])
+        self._pending = (transparent, descriptor + (color_table or b"") + image_data)
+        self._pending_ms = duration_ms
+    
+    def _flush_pending(self):
+        """写入暂存的帧"""
+        if self._pending is None:
+            return
+        transparent, data = self._pending
+        self._pending = None
+        
+        # 图形控制扩展：处置方法1（保留画面，下一帧叠加在上面）、延迟时间和透明色
+        flags = 0x04 | (0x01 if transparent else 0x00)
+        self._file.write(
+            b"\x21\xF9\x04" + bytes([flags]) +
+            struct.pack("<H", self._next_delay(self._pending_ms)) +
+            bytes([self.TRANSPARENT_INDEX if transparent else 0]) + b"\x00"
+        )
+        self._file.write(data)
+    
+    def close(self):
+        """写入最后一帧和文件尾并关闭文件"""
+        if not self._file.closed:
+            self._flush_pending()
+            self._file.write(b"\x3B")
+            self._file.close()
+
+# 旋转、翻转和镜像都属于二面体群D4，可以合并为一次transpose；
+# 表中为各transpose操作对像素坐标(以图像中心为原点，y轴向下)的变换矩阵，None表示不变
+_TRANSPOSE_MATRICES = {
+    None: ((1, 0), (0, 1)),
+    Image.FLIP_LEFT_RIGHT: ((-1, 0), (0, 1)),
+    Image.FLIP_TOP_BOTTOM: ((1, 0), (0, -1)),
+    Image.ROTATE_90: ((0, 1), (-1, 0)),
+    Image.ROTATE_180: ((-1, 0), (0, -1)),
+    Image.ROTATE_270: ((0, -1), (1, 0)),
+    Image.TRANSPOSE: ((0, 1), (1, 0)),
+    Image.TRANSVERSE: ((0, -1), (-1, 0)),
+}
+_TRANSPOSE_BY_MATRIX = {matrix: method for method, matrix in _TRANSPOSE_MATRICES.items()}
+
+def _merge_transposes(rotate: int, flip: bool, mirror: bool) -> Tuple[bool, Optional[int]]:
+    """
+    把顺时针旋转、上下翻转和左右镜像（按此顺序执行）合并为一次transpose
+    
+    Args:
+        rotate: 顺时针旋转角度
+        flip: 是否上下翻转
+        mirror: 是否左右镜像
+    
+    Returns:
+        tuple: (能否合并, transpose方法)，旋转角度不是90的倍数时不能合并；方法为None表示图像不变
+    """
+    if rotate % 90 != 0:
+        return False, None
+    
+    def multiply(a, b):
+        return tuple(tuple(a[i][0] * b[0][j] + a[i][1] * b[1][j] for j in range(2)) for i in range(2))
+    
+    matrix = _TRANSPOSE_MATRICES[None]
+    for _ in range((rotate // 90) % 4):
+        matrix = multiply(_TRANSPOSE_MATRICES[Image.ROTATE_270], matrix)  # ROTATE_270即顺时针90度
+    if flip:
+        matrix = multiply(_TRANSPOSE_MATRICES[Image.FLIP_TOP_BOTTOM], matrix)
+    if mirror:
+        matrix = multiply(_TRANSPOSE_MATRICES[Image.FLIP_LEFT_RIGHT], matrix)
+    return True, _TRANSPOSE_BY_MATRIX[matrix]
+
+# rawvideo管道支持的像素格式：FFmpeg像素格式 -> (PIL模式, 每像素字节数)
+RAWVIDEO_PIXEL_FORMATS = {
+    "rgb24": ("RGB", 3),
+    "rgba": ("RGBA", 4),
+    "gray": ("L", 1),
+}
+
+class VideoFrame:
+    """
+    从rawvideo管道读取的一帧
+    
+    data是复用缓冲区上的memoryview，读取下一帧时会被覆盖；
+    需要保留帧内容时使用bytes(frame.data)或frame.to_image().copy()
+    """
+    
+    __slots__ = ("index", "timestamp", "width", "height", "mode", "data")
+    
+    def __init__(self, index: int, timestamp: Optional[float], width: int, height: int,
+                 mode: str, data: memoryview):
+        """
+        初始化视频帧
+        
+        Args:
+            index: 帧序号，从0开始
+            timestamp: 帧时间（秒），未知时为None
+            width: 帧宽度
+            height: 帧高度
+            mode: PIL图像模式
+            data: 像素数据
+        """
+        self.index = index
+        self.timestamp = timestamp
+        self.width = width
+        self.height = height
+        self.mode = mode
+        self.data = data
+    
+    def to_image(self) -> Image.Image:
+        """
+        转换为PIL图像
+        
+        RGBA和L模式的图像直接引用缓冲区（不复制），RGB模式由Pillow复制一次
+        
+        Returns:
+            Image.Image: 帧图像
+        """
+        return Image.frombuffer(self.mode, (self.width, self.height), self.data, "raw", self.mode, 0, 1)
+    
+    def __repr__(self) -> str:
+        return f"VideoFrame(index={self.index}, timestamp={self.timestamp}, size={self.width}x{self.height})"
+
+class FFmpegProgress(float):
+    """
+    FFmpeg转换进度
+    
+    本身是0-1之间的浮点数，可直接当作进度值使用，同时附带编码速度和预计剩余时间；
+    FFmpeg运行期间每组-progress输出都会报告一次（时长未知、进度不变时也会），可以当作心跳
+    """
+    
+    def __new__(cls, value: float, speed: float = 0.0, eta: Optional[float] = None,
+                out_time: float = 0.0, running: bool = True):
+        """
+        创建进度对象
+        
+        Args:
+            value: 进度，0-1之间的浮点数
+            speed: 编码速度，相对实时播放的倍数，未知时为0
+            eta: 预计剩余时间（秒），未知时为None
+            out_time: 已处理的媒体时长（秒）
+            running: FFmpeg是否仍在运行，进程退出后报告一次False
+        """
+        progress = super().__new__(cls, value)
+        progress.speed = speed
+        progress.eta = eta
+        progress.out_time = out_time
+        progress.running = running
+        return progress
+
+class ConversionResult:
+    """
+    转换结果
+    
+    可以直接当作bool使用（成功为真），与原先返回True/False的用法兼容
+    """
+    
+    def __init__(self, success: bool, cancelled: bool = False, message: str = "",
+                 skipped: bool = False, details: Optional[Dict[str, Any]] = None):
+        """
+        初始化转换结果
+        
+        Args:
+            success: 是否成功
+            cancelled: 是否被取消
+            message: 附加说明
+            skipped: 输出已是最新而跳过了转换（视为成功）
+            details: 转换过程的附加信息，例如视频转换选择的策略
+        """
+        self.success = success
+        self.cancelled = cancelled
+        self.message = message
+        self.skipped = skipped
+        self.details = details or {}
+    
+    def __bool__(self) -> bool:
+        return self.success
+    
+    def __repr__(self) -> str:
+        if self.skipped:
+            status = "skipped"
+        elif self.success:
+            status = "success"
+        else:
+            status = "cancelled" if self.cancelled else "failed"
+        return f"ConversionResult({status})"
+
+class CancellationToken:
+    """取消令牌，在其他线程中调用cancel()可以终止正在进行的转换"""
+    
+    def __init__(self):
+        """初始化取消令牌"""
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+    
+    @property
+    def is_cancelled(self) -> bool:
+        """是否已经取消"""
+        return self._event.is_set()
+    
+    def cancel(self):
+        """取消转换，立即执行所有已注册的回调（例如终止FFmpeg进程）"""
+        with self._lock:
+            self._event.set()
+            callbacks = list(self._callbacks)
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+    
+    def register(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """
+        注册取消时执行的回调，如果已经取消则立即执行
+        
+        Args:
+            callback: 回调函数
+            
+        Returns:
+            Callable: 注销该回调的函数
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                registered = True
+            else:
+                registered = False
+        if not registered:
+            callback()
+        
+        def unregister():
+            with self._lock:
+                if callback in self._callbacks:
+                    self._callbacks.remove(callback)
+        
+        return unregister
 
 class FormatConverter:
     """格式转换工具类，提供各种格式转换功能"""
     
-    def __init__(self):
-        """初始化格式转换工具"""
+    # GIF转换引擎
+    GIF_ENGINES = ("pil", "ffmpeg", "auto")
+    # auto策略：帧数和单帧像素数都不超过阈值时使用PIL，否则使用FFmpeg调色板滤镜
+    GIF_AUTO_PIL_MAX_FRAMES = 150
+    GIF_AUTO_PIL_MAX_PIXELS = 640 * 480
+    
+    # 视频转换策略：直接复制全部流、只复制视频流、只复制音频流、全部重新编码
+    VIDEO_STRATEGIES = ("copy", "copy_video", "copy_audio", "transcode")
+    # 编码器名称对应的编码格式（ffprobe的codec_name），未列出的按原名处理
+    ENCODER_CODECS = {
+        "libx264": "h264", "h264_nvenc": "h264", "h264_qsv": "h264", "h264_amf": "h264",
+        "libx265": "hevc", "hevc_nvenc": "hevc", "hevc_qsv": "hevc", "hevc_amf": "hevc",
+        "libvpx": "vp8", "libvpx-vp9": "vp9", "libaom-av1": "av1", "libsvtav1": "av1",
+        "libfdk_aac": "aac", "libmp3lame": "mp3", "libvorbis": "vorbis", "libopus": "opus",
+    }
+    # 各容器可以直接写入的(视频编码, 音频编码)，None表示不限制
+    CONTAINER_CODECS = {
+        ".mp4": ({"h264", "hevc", "mpeg4", "av1", "vp9"}, {"aac", "mp3", "ac3", "eac3", "alac", "opus", "flac"}),
+        ".m4v": ({"h264", "hevc", "mpeg4", "av1"}, {"aac", "mp3", "ac3", "eac3", "alac"}),
+        ".mov": ({"h264", "hevc", "mpeg4", "prores", "mjpeg"}, {"aac", "mp3", "ac3", "eac3", "alac", "pcm_s16le", "pcm_s24le"}),
+        ".mkv": (None, None),
+        ".webm": ({"vp8", "vp9", "av1"}, {"vorbis", "opus"}),
+        ".avi": ({"mpeg4", "h264", "mjpeg", "msmpeg4v2", "msmpeg4v3"}, {"mp3", "ac3", "pcm_s16le"}),
+        ".flv": ({"h264", "flv1"}, {"aac", "mp3"}),
+        ".wmv": ({"wmv1", "wmv2", "wmv3"}, {"wmav1", "wmav2"}),
+        ".3gp": ({"h264", "h263", "mpeg4"}, {"aac", "amr_nb"}),
+        ".ts": ({"h264", "hevc", "mpeg2video"}, {"aac", "mp3", "mp2", "ac3", "eac3"}),
+        ".mts": ({"h264", "hevc", "mpeg2video"}, {"aac", "mp3", "mp2", "ac3", "eac3"}),
+        ".m2ts": ({"h264", "hevc", "mpeg2video"}, {"aac", "mp3", "mp2", "ac3", "eac3"}),
+        ".mpeg": ({"mpeg1video", "mpeg2video"}, {"mp2", "mp3", "ac3"}),
+        ".mpg": ({"mpeg1video", "mpeg2video"}, {"mp2", "mp3", "ac3"}),
+        ".vob": ({"mpeg2video"}, {"mp2", "ac3"}),
+    }
+    
+    # 视频编码性能档位：fastest速度优先，balanced兼顾速度和体积，smallest体积优先
+    VIDEO_PROFILES = ("fastest", "balanced", "smallest")
+    # 各编码器在不同档位下的速度参数；同一编码器的质量参数(CRF)不随档位变化，
+    # 档位只在编码速度和文件体积之间取舍
+    PROFILE_SPEED_ARGS = {
+        "libx264": {
+            "fastest": ["-preset", "veryfast"],
+            "balanced": ["-preset", "medium"],
+            "smallest": ["-preset", "slower"],
+        },
+        "libx265": {
+            "fastest": ["-preset", "superfast"],
+            "balanced": ["-preset", "medium"],
+            "smallest": ["-preset", "slower"],
+        },
+        "libvpx-vp9": {
+            "fastest": ["-deadline", "realtime", "-cpu-used", "8"],
+            "balanced": ["-deadline", "good", "-cpu-used", "4"],
+            "smallest": ["-deadline", "good", "-cpu-used", "1"],
+        },
+        "libvpx": {
+            "fastest": ["-deadline", "realtime", "-cpu-used", "8"],
+            "balanced": ["-deadline", "good", "-cpu-used", "2"],
+            "smallest": ["-deadline", "good", "-cpu-used", "0"],
+        },
+    }
+    # 未指定视频比特率时使用的恒定质量参数
+    PROFILE_CRF = {"libx264": 23, "libx265": 28, "libvpx-vp9": 32}
+    # 分段并行转换时每段的最短时长（秒），太短的分段启动开销大于并行收益
+    SEGMENT_MIN_SECONDS = 20
+    
+    # 缩小JPEG时按目标尺寸的倍数请求DCT缩放解码（与Pillow的thumbnail相同）
+    IMAGE_DRAFT_GAP = 2.0
+    # 缩小图片时先用reduce按整数倍缩小到目标尺寸的倍数，再用LANCZOS精确缩放；
+    # 不小于3.0时结果与直接LANCZOS缩放几乎没有区别
+    IMAGE_REDUCING_GAP = 3.0
+    # 批量转换图片时每个子进程任务最多包含的图片数，按块提交以减少进程间通信次数，
+    # 块太大则各进程负载不均、取消响应变慢
+    IMAGE_CHUNK_MAX = 32
+    # 按目标文件大小编码时支持的格式、质量下限和每轮同时尝试的质量数
+    IMAGE_TARGET_SIZE_FORMATS = (".jpg", ".jpeg", ".webp")
+    IMAGE_TARGET_MIN_QUALITY = 5
+    IMAGE_TARGET_SIZE_PROBES = 4
+    
+    # 响度标准化目标（EBU R128）：综合响度(LUFS)、真峰值(dBTP)、响度范围(LU)
+    LOUDNORM_TARGET = {"I": -23.0, "TP": -1.0, "LRA": 7.0}
+    # 第一遍测量得到的、第二遍需要传回loudnorm的参数
+    LOUDNORM_MEASURED_KEYS = ("input_i", "input_tp", "input_lra", "input_thresh", "target_offset")
+    
+    def __init__(self, probe_cache: Optional[ProbeCache] = None, use_probe_cache: bool = True):
+        """
+        初始化格式转换工具
+        
+        Args:
+            probe_cache: 媒体信息缓存，默认使用用户缓存目录下的缓存数据库
+            use_probe_cache: 是否缓存get_media_info的结果
+        """
         self.ffmpeg_path = self._find_ffmpeg()
         self.temp_dir = tempfile.mkdtemp(prefix="format_converter_")
+        if probe_cache is None and use_probe_cache:
+            probe_cache = ProbeCache()
+        self.probe_cache = probe_cache
+        # 性能记录的接收函数，见telemetry模块
+        self.telemetry_sinks = []
+    
+    def add_telemetry_sink(self, sink: TelemetrySink):
+        """
+        注册性能记录的接收函数
+        
+        注册后每次convert_*、extract_*和get_media_info调用结束时，以一条记录（字典）调用接收函数，
+        可能在多个线程中同时调用
+        
+        Args:
+            sink: 接收函数，例如telemetry.JsonlTelemetrySink或list.append
+        """
+        self.telemetry_sinks.append(sink)
+    
+    def remove_telemetry_sink(self, sink: TelemetrySink):
+        """
+        注销性能记录的接收函数
+        
+        Args:
+            sink: 之前注册的接收函数
+        """
+        if sink in self.telemetry_sinks:
+            self.telemetry_sinks.remove(sink)
     
     def __del__(self):
         """清理临时文件"""
@@ -74,10 +644,13 @@ class FormatConverter:
         """
         return bool(self.ffmpeg_path)
     
+    @instrumented
     def convert_mp4_to_gif(self, input_path: str, output_path: str, 
                           fps: int = 10, quality: int = 85, scale: float = 1.0,
                           start_time: float = 0, duration: float = 0,
-                          progress_callback: Callable[[float], None] = None) -> bool:
+                          progress_callback: Callable[[float], None] = None,
+                          streaming: bool = False, engine: str = "pil",
+                          cancel_token: Optional[CancellationToken] = None) -> ConversionResult:
         """
         将MP4视频转换为GIF动画
         
@@ -85,27 +658,54 @@ class FormatConverter:
             input_path: 输入MP4文件路径
             output_path: 输出GIF文件路径
             fps: 输出GIF帧率，默认10帧/秒
-            quality: 输出GIF质量，0-100之间的整数，默认85
+            quality: 输出GIF质量，0-100之间的整数，默认85（FFmpeg引擎使用，决定调色板颜色数和抖动算法）
             scale: 输出GIF缩放比例，默认1.0(原始大小)
             start_time: 开始时间（秒），默认0
             duration: 持续时间（秒），默认0表示转换整个视频
             progress_callback: 进度回调函数，参数为0-1之间的浮点数表示进度
+            streaming: 是否使用流式模式，从FFmpeg管道逐帧读取原始画面并直接写入GIF，
+                       不生成临时PNG文件（仅PIL引擎；PIL引擎两种模式都逐帧写入，内存占用与视频长度无关）
+            engine: 转换引擎，"pil"使用PIL合成GIF，"ffmpeg"使用FFmpeg的palettegen/paletteuse
+                    滤镜直接输出GIF，"auto"根据视频时长和分辨率自动选择
+            cancel_token: 取消令牌，取消后终止FFmpeg进程并删除未完成的输出
             
         Returns:
-            bool: 转换成功返回True，失败返回False
+            ConversionResult: 转换结果，成功时为真值，被取消时cancelled为True
         """
         if not self.is_ffmpeg_available():
             print("错误：未找到FFmpeg。请确保FFmpeg已安装并添加到系统路径。")
-            return False
+            return ConversionResult(False)
         
         if not os.path.isfile(input_path):
             print(f"错误：输入文件 {input_path} 不存在。")
-            return False
+            return ConversionResult(False)
+        
+        if engine not in self.GIF_ENGINES:
+            print(f"错误：不支持的GIF转换引擎 {engine}。")
+            return ConversionResult(False)
+        
+        if engine == "auto":
+            engine = self._choose_gif_engine(input_path, fps, scale, start_time, duration)
+        
+        if engine == "ffmpeg":
+            return self._convert_mp4_to_gif_ffmpeg(
+                input_path, output_path, fps=fps, quality=quality, scale=scale,
+                start_time=start_time, duration=duration,
+                progress_callback=progress_callback, cancel_token=cancel_token
+            )
+        
+        if streaming:
+            return self._convert_mp4_to_gif_streaming(
+                input_path, output_path, fps=fps, scale=scale,
+                start_time=start_time, duration=duration,
+                progress_callback=progress_callback, cancel_token=cancel_token
+            )
         
+        frames_dir = None
+        writer = None
         try:
-            # 创建临时目录
-            frames_dir = os.path.join(self.temp_dir, "frames")
-            os.makedirs(frames_dir, exist_ok=True)
+            # 创建临时目录，每次转换使用独立目录以支持并发转换
+            frames_dir = tempfile.mkdtemp(prefix="frames_", dir=self.temp_dir)
             
             # 构建FFmpeg命令参数
             cmd = [self.ffmpeg_path, "-y"]
@@ -135,22 +735,18 @@ class FormatConverter:
             frames_path = os.path.join(frames_dir, "frame_%04d.png")
             cmd.append(frames_path)
             
-            # 执行FFmpeg
-            process = subprocess.Popen(
-                cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True
+            # 执行FFmpeg，提取帧阶段占总进度的60%
+            returncode, stderr = self._run_ffmpeg(
+                cmd, self._get_clip_duration(input_path, start_time, duration, progress_callback),
+                progress_callback, progress_range=(0.0, 0.6), cancel_token=cancel_token
             )
             
-            # 读取输出以更新进度
-            if progress_callback:
-                progress_callback(0.1)  # 初始进度10%
-            
-            # 等待命令完成
-            process.wait()
+            if cancel_token and cancel_token.is_cancelled:
+                return self._cancelled_result()
             
-            if process.returncode != 0:
-                stderr = process.stderr.read()
+            if returncode != 0:
                 print(f"FFmpeg错误: {stderr}")
-                return False
+                return ConversionResult(False)
             
             # 获取所有帧
             frame_files = sorted([
@@ -160,224 +756,1177 @@ class FormatConverter:
             
             if not frame_files:
                 print("错误：未能生成帧序列。")
-                return False
+                return ConversionResult(False)
             
             # 更新进度
             if progress_callback:
                 progress_callback(0.6)  # 进度60%
             
-            # 使用PIL创建GIF
-            frames = []
+            # 使用PIL逐帧合成GIF，每帧只写出与上一帧不同的区域，内存占用与帧数无关
+            writer = _GifStreamWriter(output_path)
             for i, file in enumerate(frame_files):
-                img = Image.open(file)
-                frames.append(img)
+                if cancel_token and cancel_token.is_cancelled:
+                    writer.close()
+                    return self._cancelled_result(output_path)
+                
+                with telemetry.phase("gif_assembly"):
+                    with Image.open(file) as img:
+                        writer.add_frame(img, 1000 / fps)
                 
                 # 更新进度
                 if progress_callback and i % 10 == 0:
                     progress = 0.6 + 0.3 * (i / len(frame_files))
                     progress_callback(progress)
-            
-            # 保存GIF
-            frames[0].save(
-                output_path,
-                format="GIF",
-                append_images=frames[1:],
-                save_all=True,
-                duration=1000/fps,
-                loop=0,
-                optimize=True,
-                quality=quality
-            )
+            writer.close()
             
             # 完成
             if progress_callback:
                 progress_callback(1.0)
             
-            return True
+            return ConversionResult(True)
             
         except Exception as e:
             print(f"转换MP4到GIF出错: {str(e)}")
-            return False
+            if writer is not None:
+                writer.close()
+                if os.path.exists(output_path):
+                    os.remove(output_path)
+            return ConversionResult(False)
         finally:
             # 清理临时文件
-            frames_dir = os.path.join(self.temp_dir, "frames")
-            if os.path.exists(frames_dir):
+            if frames_dir and os.path.exists(frames_dir):
                 shutil.rmtree(frames_dir)
     
-    def convert_video_format(self, input_path: str, output_path: str,
-                           video_codec: str = "", audio_codec: str = "",
-                           video_bitrate: str = "", audio_bitrate: str = "",
-                           resolution: str = "", fps: int = 0,
-                           progress_callback: Callable[[float], None] = None) -> bool:
+    def _choose_gif_engine(self, input_path: str, fps: int, scale: float,
+                           start_time: float, duration: float) -> str:
         """
-        转换视频格式
+        根据片段时长和分辨率选择GIF转换引擎
+        
+        短小的片段用PIL转换，长片段或高分辨率片段用FFmpeg多线程转换，
+        避免PIL单线程量化和优化成为瓶颈
+        
+        Returns:
+            str: "pil"或"ffmpeg"
+        """
+        media_info = self.get_media_info(input_path)
+        video_stream = self._get_video_stream(media_info)
+        if not video_stream:
+            return "ffmpeg"
+        
+        clip_duration = duration if duration > 0 else media_info.get("duration", 0) - start_time
+        frame_rate = fps if fps > 0 else video_stream.get("frame_rate", 0)
+        frame_count = clip_duration * frame_rate
+        
+        width, height = self._get_display_size(video_stream)
+        pixels = width * height * scale * scale
+        
+        if frame_count <= self.GIF_AUTO_PIL_MAX_FRAMES and pixels <= self.GIF_AUTO_PIL_MAX_PIXELS:
+            return "pil"
+        return "ffmpeg"
+    
+    def _convert_mp4_to_gif_ffmpeg(self, input_path: str, output_path: str,
+                                   fps: int = 10, quality: int = 85, scale: float = 1.0,
+                                   start_time: float = 0, duration: float = 0,
+                                   progress_callback: Callable[[float], None] = None,
+                                   cancel_token: Optional[CancellationToken] = None) -> ConversionResult:
+        """
+        使用FFmpeg的palettegen/paletteuse滤镜直接生成GIF，帧数据不经过Python
         
         Args:
             input_path: 输入视频文件路径
-            output_path: 输出视频文件路径
-            video_codec: 视频编码器，默认使用输出格式的默认编码器
-            audio_codec: 音频编码器，默认使用输出格式的默认编码器
-            video_bitrate: 视频比特率，例如"1M"
-            audio_bitrate: 音频比特率，例如"128k"
-            resolution: 分辨率，格式为"宽x高"，例如"1280x720"
-            fps: 帧率，默认0表示保持原帧率
+            output_path: 输出GIF文件路径
+            fps: 输出GIF帧率，0表示使用源视频帧率
+            quality: 输出质量，决定调色板颜色数和抖动算法
+            scale: 输出GIF缩放比例
+            start_time: 开始时间（秒）
+            duration: 持续时间（秒），0表示到视频结束
             progress_callback: 进度回调函数
             
         Returns:
-            bool: 转换成功返回True，失败返回False
+            ConversionResult: 转换结果，成功时为真值，被取消时cancelled为True
         """
-        if not self.is_ffmpeg_available():
-            print("错误：未找到FFmpeg。请确保FFmpeg已安装并添加到系统路径。")
-            return False
-        
-        if not os.path.isfile(input_path):
-            print(f"错误：输入文件 {input_path} 不存在。")
-            return False
-        
         try:
-            # 构建FFmpeg命令参数
-            cmd = [self.ffmpeg_path, "-y", "-i", input_path]
-            
-            # 添加视频编码参数
-            if video_codec:
-                cmd.extend(["-c:v", video_codec])
-            
-            # 添加音频编码参数
-            if audio_codec:
-                cmd.extend(["-c:a", audio_codec])
-            
-            # 添加视频比特率
-            if video_bitrate:
-                cmd.extend(["-b:v", video_bitrate])
-            
-            # 添加音频比特率
-            if audio_bitrate:
-                cmd.extend(["-b:a", audio_bitrate])
+            cmd = [self.ffmpeg_path, "-y"]
+            if start_time > 0:
+                cmd.extend(["-ss", str(start_time)])
+            cmd.extend(["-i", input_path])
+            if duration > 0:
+                cmd.extend(["-t", str(duration)])
             
-            # 添加分辨率和帧率滤镜
             filters = []
-            if resolution:
-                filters.append(f"scale={resolution.replace('x', ':')}")
             if fps > 0:
                 filters.append(f"fps={fps}")
+            if scale != 1.0:
+                filters.append(f"scale=iw*{scale}:ih*{scale}:flags=lanczos")
             
-            if filters:
-                cmd.extend(["-vf", ",".join(filters)])
+            # 质量决定调色板大小，高质量使用误差扩散抖动，低质量使用有序抖动
+            quality = max(1, min(100, quality))
+            max_colors = max(2, min(256, int(256 * quality / 100)))
+            if quality >= 80:
+                dither = "sierra2_4a"
+            else:
+                dither = f"bayer:bayer_scale={max(1, min(5, 5 - quality // 20))}"
             
-            # 输出文件
-            cmd.append(output_path)
+            # 同一滤镜图中分两路：一路生成调色板，一路使用调色板输出
+            graph = "[0:v]" + "".join(f + "," for f in filters)
+            graph += (
+                f"split[a][b];[a]palettegen=max_colors={max_colors}[p];"
+                f"[b][p]paletteuse=dither={dither}"
+            )
+            cmd.extend(["-filter_complex", graph, "-an", "-loop", "0", output_path])
             
-            # 执行FFmpeg
-            process = subprocess.Popen(
-                cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True
+            returncode, stderr = self._run_ffmpeg(
+                cmd, self._get_clip_duration(input_path, start_time, duration, progress_callback),
+                progress_callback, cancel_token=cancel_token
             )
             
-            # 读取输出以更新进度
-            if progress_callback:
-                progress_callback(0.1)  # 初始进度10%
+            if cancel_token and cancel_token.is_cancelled:
+                return self._cancelled_result(output_path)
             
-            # 等待命令完成
-            process.wait()
+            if returncode != 0:
+                print(f"FFmpeg错误: {stderr}")
+                return ConversionResult(False)
             
-            # 完成
             if progress_callback:
                 progress_callback(1.0)
             
-            if process.returncode != 0:
-                stderr = process.stderr.read()
-                print(f"FFmpeg错误: {stderr}")
-                return False
-            
-            return True
+            return ConversionResult(True)
             
         except Exception as e:
-            print(f"视频格式转换出错: {str(e)}")
-            return False
+            print(f"转换MP4到GIF出错: {str(e)}")
+            return ConversionResult(False)
     
-    def convert_audio_format(self, input_path: str, output_path: str,
-                           audio_codec: str = "", audio_bitrate: str = "",
-                           sample_rate: int = 0, channels: int = 0,
-                           progress_callback: Callable[[float], None] = None) -> bool:
+    def _convert_mp4_to_gif_streaming(self, input_path: str, output_path: str,
+                                      fps: int = 10, scale: float = 1.0,
+                                      start_time: float = 0, duration: float = 0,
+                                      progress_callback: Callable[[float], None] = None,
+                                      cancel_token: Optional[CancellationToken] = None) -> ConversionResult:
         """
-        转换音频格式
+        流式将视频转换为GIF：FFmpeg输出rawvideo到管道，逐帧量化后写入GIF
         
         Args:
-            input_path: 输入音频文件路径
-            output_path: 输出音频文件路径
-            audio_codec: 音频编码器，默认使用输出格式的默认编码器
-            audio_bitrate: 音频比特率，例如"128k"
-            sample_rate: 采样率，例如44100
-            channels: 声道数，例如2表示立体声
+            input_path: 输入视频文件路径
+            output_path: 输出GIF文件路径
+            fps: 输出GIF帧率，0表示使用源视频帧率
+            scale: 输出GIF缩放比例
+            start_time: 开始时间（秒）
+            duration: 持续时间（秒），0表示到视频结束
             progress_callback: 进度回调函数
+            cancel_token: 取消令牌
             
         Returns:
-            bool: 转换成功返回True，失败返回False
+            ConversionResult: 转换结果，成功时为真值，被取消时cancelled为True
         """
-        if not self.is_ffmpeg_available():
-            print("错误：未找到FFmpeg。请确保FFmpeg已安装并添加到系统路径。")
-            return False
-        
-        if not os.path.isfile(input_path):
-            print(f"错误：输入文件 {input_path} 不存在。")
-            return False
-        
+        writer = None
         try:
-            # 构建FFmpeg命令参数
-            cmd = [self.ffmpeg_path, "-y", "-i", input_path]
+            media_info = self.get_media_info(input_path)
+            video_stream = self._get_video_stream(media_info)
+            if not video_stream:
+                print(f"错误：无法读取 {input_path} 的视频流信息。")
+                return ConversionResult(False)
             
-            # 添加音频编码参数
-            if audio_codec:
-                cmd.extend(["-c:a", audio_codec])
+            # rawvideo没有帧头，必须预先确定输出尺寸
+            source_width, source_height = self._get_display_size(video_stream)
+            width = max(1, int(source_width * scale))
+            height = max(1, int(source_height * scale))
             
-            # 添加音频比特率
-            if audio_bitrate:
-                cmd.extend(["-b:a", audio_bitrate])
+            if fps <= 0:
+                fps = video_stream.get("frame_rate") or 10
             
-            # 添加采样率
-            if sample_rate > 0:
-                cmd.extend(["-ar", str(sample_rate)])
+            cmd = [self.ffmpeg_path, "-v", "error"]
+            if start_time > 0:
+                cmd.extend(["-ss", str(start_time)])
+            cmd.extend(["-i", input_path])
+            if duration > 0:
+                cmd.extend(["-t", str(duration)])
+            cmd.extend([
+                "-vf", f"fps={fps},scale={width}:{height}",
+                "-an", "-f", "rawvideo", "-pix_fmt", "rgb24", "pipe:1"
+            ])
             
-            # 添加声道数
-            if channels > 0:
-                cmd.extend(["-ac", str(channels)])
+            # 估算总帧数用于进度显示
+            total_duration = duration if duration > 0 else media_info.get("duration", 0) - start_time
+            expected_frames = max(1, int(total_duration * fps))
             
-            # 输出文件
-            cmd.append(output_path)
+            if progress_callback:
+                progress_callback(0.0)
             
-            # 执行FFmpeg
-            process = subprocess.Popen(
-                cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True
-            )
+            writer = _GifStreamWriter(output_path)
+            for frame in self._iter_rawvideo_frames(cmd, width, height, cancel_token):
+                with telemetry.phase("gif_assembly"):
+                    writer.add_frame(frame.to_image(), 1000 / fps)
+                
+                if progress_callback and writer.frame_count % 10 == 0:
+                    progress_callback(min(0.99, writer.frame_count / expected_frames))
+            writer.close()
             
-            # 读取输出以更新进度
-            if progress_callback:
-                progress_callback(0.1)  # 初始进度10%
+            if cancel_token and cancel_token.is_cancelled:
+                return self._cancelled_result(output_path)
             
-            # 等待命令完成
-            process.wait()
+            if writer.frame_count == 0:
+                print("错误：未能读取到视频帧。")
+                os.remove(output_path)
+                return ConversionResult(False)
             
-            # 完成
             if progress_callback:
                 progress_callback(1.0)
             
-            if process.returncode != 0:
-                stderr = process.stderr.read()
-                print(f"FFmpeg错误: {stderr}")
-                return False
+            return ConversionResult(True)
             
-            return True
+        except Exception as e:
+            print(f"转换MP4到GIF出错: {str(e)}")
+            if writer is not None:
+                writer.close()
+                if os.path.exists(output_path):
+                    os.remove(output_path)
+            return ConversionResult(False)
+    
+    def _iter_rawvideo_frames(self, cmd: List[str], width: int, height: int,
+                              cancel_token: Optional[CancellationToken] = None,
+                              pixel_format: str = "rgb24", frame_rate: float = 0,
+                              start_time: float = 0, showinfo: bool = False) -> Iterator[VideoFrame]:
+        """
+        运行输出rawvideo到标准输出的FFmpeg命令，逐帧生成VideoFrame
+        
+        所有帧共用一个预先分配的缓冲区，readinto直接把管道数据读入缓冲区，
+        稳定运行时每帧几乎没有内存分配
+        
+        Args:
+            cmd: FFmpeg命令参数
+            width: 帧宽度
+            height: 帧高度
+            cancel_token: 取消令牌，取消后终止FFmpeg并结束迭代
+            pixel_format: 命令中-pix_fmt指定的像素格式，见RAWVIDEO_PIXEL_FORMATS
+            frame_rate: 输出帧率，没有showinfo或取不到showinfo时间时用于按帧序号计算时间
+            start_time: 加到帧时间上的起始偏移（秒）
+            showinfo: 命令的滤镜链末尾是否有showinfo，有则从stderr解析每帧的pts_time
+            
+        Yields:
+            VideoFrame: 视频帧，其数据在下一次迭代时被覆盖
+        """
+        mode, bytes_per_pixel = RAWVIDEO_PIXEL_FORMATS[pixel_format]
+        frame_size = width * height * bytes_per_pixel
+        buffer = bytearray(frame_size)
+        view = memoryview(buffer)
+        
+        frame_times = deque()
+        times_ready = threading.Condition()
+        
+        def parse_showinfo(line):
+            if "Parsed_showinfo" in line and "pts_time:" in line:
+                try:
+                    pts_time = float(line.partition("pts_time:")[2].split()[0])
+                except (ValueError, IndexError):
+                    return
+                with times_ready:
+                    frame_times.append(pts_time)
+                    times_ready.notify()
+                # 已解析的行不进入stderr尾部缓冲，出错时保留真正的错误信息
+                return True
+        
+        process = self._popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        unregister = self._register_cancel(process, cancel_token)
+        
+        stderr_lines = deque(maxlen=50)
+        stderr_thread = self._start_stderr_reader(process, stderr_lines, parse_showinfo if showinfo else None)
+        
+        try:
+            index = 0
+            showinfo_lost = False
+            while True:
+                filled = 0
+                while filled < frame_size:
+                    count = process.stdout.readinto(view[filled:])
+                    if not count:
+                        break
+                    filled += count
+                if filled < frame_size:
+                    break
+                telemetry.mark_first_output(process)
+                telemetry.sample_peak_rss(process)
+                
+                timestamp = None
+                if showinfo and not showinfo_lost:
+                    # showinfo在帧写入管道之前输出，正常情况下很快就能取到；
+                    # 一旦超时说明有行缺失或无法解析，后续时间已无法与帧对应，不再等待
+                    with times_ready:
+                        if times_ready.wait_for(lambda: frame_times, timeout=2):
+                            timestamp = start_time + frame_times.popleft()
+                        else:
+                            showinfo_lost = True
+                if timestamp is None and frame_rate > 0:
+                    timestamp = start_time + index / frame_rate
+                
+                yield VideoFrame(index, timestamp, width, height, mode, view)
+                index += 1
+            
+            telemetry.wait_process(process)
+            stderr_thread.join()
+            if process.returncode != 0 and not (cancel_token and cancel_token.is_cancelled):
+                raise RuntimeError(f"FFmpeg错误: {''.join(stderr_lines)}")
+        finally:
+            unregister()
+            if process.poll() is None:
+                self._kill_process(process)
+            telemetry.wait_process(process)
+            process.stdout.close()
+    
+    @staticmethod
+    def _popen(cmd: List[str], **kwargs) -> subprocess.Popen:
+        """
+        在独立的进程组中启动子进程，取消时可以连同其子进程一起终止
+        
+        Args:
+            cmd: 命令参数
+            **kwargs: 传给subprocess.Popen的其他参数
+            
+        Returns:
+            subprocess.Popen: 子进程
+        """
+        if os.name == 'nt':
+            kwargs.setdefault("creationflags", subprocess.CREATE_NEW_PROCESS_GROUP)
+        else:
+            kwargs.setdefault("start_new_session", True)
+        start = time.perf_counter()
+        process = subprocess.Popen(cmd, **kwargs)
+        telemetry.track_process(process, cmd, time.perf_counter() - start)
+        return process
+    
+    def _run_process(self, cmd: List[str]) -> subprocess.CompletedProcess:
+        """
+        运行命令并读取全部标准输出和标准错误（代替subprocess.run，以便统计子进程）
+        
+        Args:
+            cmd: 命令参数
+        
+        Returns:
+            subprocess.CompletedProcess: 返回码和输出文本
+        """
+        process = self._popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                              universal_newlines=True, encoding="utf-8", errors="replace")
+        stderr_lines = deque()
+        stderr_thread = self._start_stderr_reader(process, stderr_lines)
+        try:
+            stdout = process.stdout.read()
+        finally:
+            telemetry.wait_process(process)
+            stderr_thread.join()
+            process.stdout.close()
+        return subprocess.CompletedProcess(cmd, process.returncode, stdout, "".join(stderr_lines))
+    
+    @staticmethod
+    def _kill_process(process: subprocess.Popen, timeout: float = 0.3):
+        """
+        终止子进程组：先发送终止信号，超时后强制结束
+        
+        Args:
+            process: 子进程
+            timeout: 等待进程正常退出的时间（秒）
+        """
+        try:
+            if os.name == 'nt':
+                process.terminate()
+            else:
+                os.killpg(process.pid, signal.SIGTERM)
+            try:
+                process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                if os.name == 'nt':
+                    process.kill()
+                else:
+                    os.killpg(process.pid, signal.SIGKILL)
+        except OSError:
+            # 进程已经退出
+            pass
+    
+    def _register_cancel(self, process: subprocess.Popen,
+                         cancel_token: Optional[CancellationToken]) -> Callable[[], None]:
+        """
+        把子进程与取消令牌关联，取消时在后台线程中终止进程
+        
+        Returns:
+            Callable: 注销关联的函数
+        """
+        if cancel_token is None:
+            return lambda: None
+        
+        def on_cancel():
+            threading.Thread(target=self._kill_process, args=(process,), daemon=True).start()
+        
+        return cancel_token.register(on_cancel)
+    
+    @staticmethod
+    def _cancelled_result(output_path: str = "") -> ConversionResult:
+        """
+        删除未完成的输出文件并返回已取消的结果
+        
+        Args:
+            output_path: 已经开始写入的输出文件路径，尚未写入时为空
+            
+        Returns:
+            ConversionResult: 已取消的转换结果
+        """
+        try:
+            if output_path and os.path.isfile(output_path):
+                os.remove(output_path)
+        except OSError:
+            pass
+        return ConversionResult(False, cancelled=True, message="转换已取消")
+    
+    @staticmethod
+    def _start_stderr_reader(process: subprocess.Popen, lines: deque,
+                             line_callback: Callable[[str], Optional[bool]] = None) -> threading.Thread:
+        """
+        在后台线程中持续读取子进程的stderr，避免管道缓冲区写满导致FFmpeg阻塞
+        
+        Args:
+            process: 子进程
+            lines: 保存stderr输出的队列（通常设置maxlen只保留最后若干行）
+            line_callback: 每读到一行调用一次，用于解析showinfo等滤镜的输出；
+                           返回True表示该行已被消费，不再加入lines
+            
+        Returns:
+            threading.Thread: 读取线程
+        """
+        def read_stderr():
+            for line in process.stderr:
+                telemetry.sample_peak_rss(process)
+                if isinstance(line, bytes):
+                    line = line.decode("utf-8", "replace")
+                if line_callback and line_callback(line):
+                    continue
+                lines.append(line)
+        
+        thread = threading.Thread(target=read_stderr, daemon=True)
+        thread.start()
+        return thread
+    
+    def _get_clip_duration(self, input_path: str, start_time: float = 0, duration: float = 0,
+                           progress_callback: Callable[[float], None] = None) -> float:
+        """
+        获取本次转换要处理的媒体时长，用于计算进度
+        
+        没有进度回调时不需要时长，直接返回0以省去一次ffprobe调用
+        
+        Returns:
+            float: 处理时长（秒），未知时返回0
+        """
+        if not progress_callback:
+            return 0
+        
+        total = self.get_media_info(input_path).get("duration", 0) - start_time
+        if duration > 0 and (total <= 0 or duration < total):
+            total = duration
+        return max(0, total)
+    
+    def _run_ffmpeg(self, cmd: List[str], duration: float = 0,
+                    progress_callback: Callable[[float], None] = None,
+                    progress_range: Tuple[float, float] = (0.0, 1.0),
+                    cancel_token: Optional[CancellationToken] = None,
+                    stderr_callback: Callable[[str], Optional[bool]] = None) -> Tuple[int, str]:
+        """
+        运行FFmpeg命令，解析-progress输出报告实时进度
+        
+        FFmpeg通过-progress pipe:1把out_time_us、speed等键值对写到标准输出，
+        stderr由后台线程并发读取，长时间运行的任务不会因管道写满而死锁
+        
+        Args:
+            cmd: FFmpeg命令参数，第一个元素为FFmpeg路径
+            duration: 要处理的媒体时长（秒），用于把已处理时间换算为进度，0表示未知
+            progress_callback: 进度回调函数，参数为FFmpegProgress；每组进度信息都会调用一次，
+                               时长未知时进度保持在区间起点，FFmpeg退出后再以running=False调用一次
+            progress_range: 本次命令在总进度中占据的区间
+            cancel_token: 取消令牌，取消时立即终止FFmpeg进程组
+            stderr_callback: 每读到一行stderr调用一次（在读取线程中调用），
+                             返回True表示该行已被消费，不计入返回的stderr
+            
+        Returns:
+            tuple: (返回码, stderr最后若干行)
+        """
+        cmd = [cmd[0], "-progress", "pipe:1", "-nostats"] + list(cmd[1:])
+        process = self._popen(
+            cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            universal_newlines=True, encoding="utf-8", errors="replace"
+        )
+        unregister = self._register_cancel(process, cancel_token)
+        
+        stderr_lines = deque(maxlen=50)
+        stderr_thread = self._start_stderr_reader(process, stderr_lines, stderr_callback)
+        
+        start, end = progress_range
+        current = start
+        out_time = 0.0
+        speed = 0.0
+        try:
+            if progress_callback:
+                progress_callback(FFmpegProgress(start))
+            
+            for line in process.stdout:
+                telemetry.mark_first_output(process)
+                telemetry.sample_peak_rss(process)
+                key, _, value = line.strip().partition("=")
+                
+                if key == "out_time_us":
+                    try:
+                        out_time = max(0.0, int(value) / 1000000)
+                    except ValueError:
+                        pass
+                elif key == "speed":
+                    try:
+                        speed = float(value.rstrip("x"))
+                    except ValueError:
+                        speed = 0.0
+                elif key == "progress" and progress_callback:
+                    # 每组进度信息以progress=continue/end结尾，时长未知时也报告，作为心跳
+                    eta = None
+                    if duration > 0:
+                        current = start + (end - start) * min(1.0, out_time / duration)
+                        eta = max(0.0, duration - out_time) / speed if speed > 0 else None
+                    progress_callback(FFmpegProgress(current, speed=speed, eta=eta, out_time=out_time))
+            
+            if progress_callback:
+                progress_callback(FFmpegProgress(current, speed=speed, out_time=out_time, running=False))
+        except BaseException:
+            # 回调出错（例如界面控件已经销毁）时终止FFmpeg，否则进程继续运行且管道无人读取
+            self._kill_process(process)
+            raise
+        finally:
+            telemetry.wait_process(process)
+            stderr_thread.join()
+            process.stdout.close()
+            unregister()
+        return process.returncode, "".join(stderr_lines)
+    
+    @instrumented
+    def convert_video_format(self, input_path: str, output_path: str,
+                           video_codec: str = "", audio_codec: str = "",
+                           video_bitrate: str = "", audio_bitrate: str = "",
+                           resolution: str = "", fps: int = 0,
+                           progress_callback: Callable[[float], None] = None,
+                           cancel_token: Optional[CancellationToken] = None,
+                           allow_stream_copy: bool = True,
+                           profile: str = "", threads: int = 0,
+                           parallel_segments: int = 0) -> ConversionResult:
+        """
+        转换视频格式
+        
+        参数没有要求改变编码、分辨率、帧率和比特率，且源编码可以放入输出容器时，
+        直接复制流（-c copy）而不重新编码，只需要读写文件的时间
+        
+        Args:
+            input_path: 输入视频文件路径
+            output_path: 输出视频文件路径
+            video_codec: 视频编码器，默认使用输出格式的默认编码器
+            audio_codec: 音频编码器，默认使用输出格式的默认编码器
+            video_bitrate: 视频比特率，例如"1M"
+            audio_bitrate: 音频比特率，例如"128k"
+            resolution: 分辨率，格式为"宽x高"，例如"1280x720"
+            fps: 帧率，默认0表示保持原帧率
+            progress_callback: 进度回调函数
+            cancel_token: 取消令牌，取消后终止FFmpeg进程并删除未完成的输出
+            allow_stream_copy: 是否允许直接复制流，False时总是重新编码
+            profile: 编码性能档位，见VIDEO_PROFILES，留空使用编码器默认参数；
+                     指定档位时视频流总是重新编码
+            threads: 本任务最多使用的线程数（解码、滤镜和编码），0表示由FFmpeg决定；
+                     同时运行多个任务时按核心数分配，避免互相争抢CPU
+            parallel_segments: 分段并行转换的进程数，大于1时在关键帧处把视频切成多段，
+                               由多个FFmpeg进程同时编码后无损拼接，音频单独编码一次；
+                               视频太短或不适合分段时自动使用普通转换
+            
+        Returns:
+            ConversionResult: 转换结果，成功时为真值，被取消时cancelled为True；
+                              details["strategy"]为实际使用的策略，见VIDEO_STRATEGIES，
+                              使用分段并行转换时details["segments"]为分段数
+        """
+        if not self.is_ffmpeg_available():
+            print("错误：未找到FFmpeg。请确保FFmpeg已安装并添加到系统路径。")
+            return ConversionResult(False)
+        
+        if not os.path.isfile(input_path):
+            print(f"错误：输入文件 {input_path} 不存在。")
+            return ConversionResult(False)
+        
+        if profile and profile not in self.VIDEO_PROFILES:
+            print(f"错误：不支持的编码档位 {profile}。")
+            return ConversionResult(False)
+        
+        try:
+            copy_video, copy_audio = False, False
+            if allow_stream_copy:
+                copy_video, copy_audio = self._plan_stream_copy(
+                    input_path, output_path, video_codec, audio_codec,
+                    video_bitrate, audio_bitrate, resolution, fps, profile
+                )
+            
+            encoder = self._resolve_video_encoder(output_path, video_codec) if profile else video_codec
+            
+            def video_args(copy_video, threads):
+                if copy_video:
+                    return ["-c:v", "copy"]
+                
+                # 添加视频编码参数
+                args = ["-c:v", encoder] if encoder else []
+                
+                # 添加编码档位和线程参数
+                args.extend(self._get_encoder_args(encoder, profile, threads, bool(video_bitrate)))
+                
+                # 添加视频比特率
+                if video_bitrate:
+                    args.extend(["-b:v", video_bitrate])
+                
+                # 添加分辨率和帧率滤镜
+                filters = []
+                if resolution:
+                    filters.append(f"scale={resolution.replace('x', ':')}")
+                if fps > 0:
+                    filters.append(f"fps={fps}")
+                
+                if filters:
+                    args.extend(["-vf", ",".join(filters)])
+                return args
+            
+            def audio_args(copy_audio):
+                if copy_audio:
+                    return ["-c:a", "copy"]
+                
+                # 添加音频编码参数
+                args = ["-c:a", audio_codec] if audio_codec else []
+                
+                # 添加音频比特率
+                if audio_bitrate:
+                    args.extend(["-b:a", audio_bitrate])
+                return args
+            
+            def build_command(copy_video, copy_audio):
+                # 构建FFmpeg命令参数，线程数放在-i之前同时限制解码线程
+                cmd = [self.ffmpeg_path, "-y"] + self._get_input_thread_args(threads) + ["-i", input_path]
+                cmd.extend(video_args(copy_video, threads))
+                cmd.extend(audio_args(copy_audio))
+                
+                # 输出文件
+                cmd.append(output_path)
+                return cmd
+            
+            segments = 0
+            if parallel_segments > 1 and not copy_video:
+                try:
+                    segmented = self._convert_video_segmented(
+                        input_path, output_path, lambda segment_threads: video_args(False, segment_threads),
+                        audio_args(copy_audio), parallel_segments, threads, progress_callback, cancel_token
+                    )
+                except Exception as e:
+                    segmented = (1, str(e), 0)
+                if segmented is not None:
+                    returncode, stderr, segments = segmented
+                    if returncode != 0 and not (cancel_token and cancel_token.is_cancelled):
+                        # 任一分段、音频编码或拼接失败时改用普通转换
+                        print(f"分段并行转换失败，改为普通转换: {stderr[-200:]}")
+                        segments = 0
+            
+            if not segments:
+                duration = self._get_clip_duration(input_path, 0, 0, progress_callback)
+                
+                # 执行FFmpeg
+                returncode, stderr = self._run_ffmpeg(
+                    build_command(copy_video, copy_audio), duration, progress_callback,
+                    cancel_token=cancel_token
+                )
+            
+            if returncode != 0 and (copy_video or copy_audio) and not (cancel_token and cancel_token.is_cancelled):
+                # 复制流失败（例如时间戳不兼容）时退回到重新编码
+                print(f"直接复制流失败，改为重新编码: {stderr[-200:]}")
+                copy_video, copy_audio = video_codec == "copy", audio_codec == "copy"
+                duration = self._get_clip_duration(input_path, 0, 0, progress_callback)
+                returncode, stderr = self._run_ffmpeg(
+                    build_command(copy_video, copy_audio), duration, progress_callback,
+                    cancel_token=cancel_token
+                )
+            
+            if cancel_token and cancel_token.is_cancelled:
+                return self._cancelled_result(output_path)
+            
+            if returncode != 0:
+                print(f"FFmpeg错误: {stderr}")
+                return ConversionResult(False)
+            
+            # 完成
+            if progress_callback:
+                progress_callback(1.0)
+            
+            strategy = self._get_video_strategy(copy_video, copy_audio)
+            details = {"strategy": strategy}
+            if segments:
+                details["segments"] = segments
+            return ConversionResult(True, message={
+                "copy": "已直接复制音视频流，未重新编码",
+                "copy_video": "已直接复制视频流，只重新编码音频",
+                "copy_audio": "已直接复制音频流，只重新编码视频",
+            }.get(strategy, ""), details=details)
+            
+        except Exception as e:
+            print(f"视频格式转换出错: {str(e)}")
+            return ConversionResult(False)
+    
+    @staticmethod
+    def _get_video_strategy(copy_video: bool, copy_audio: bool) -> str:
+        """根据是否复制视频流和音频流得到策略名称，见VIDEO_STRATEGIES"""
+        if copy_video and copy_audio:
+            return "copy"
+        if copy_video:
+            return "copy_video"
+        if copy_audio:
+            return "copy_audio"
+        return "transcode"
+    
+    def _plan_stream_copy(self, input_path: str, output_path: str,
+                          video_codec: str, audio_codec: str,
+                          video_bitrate: str, audio_bitrate: str,
+                          resolution: str, fps: int, profile: str = "") -> Tuple[bool, bool]:
+        """
+        判断视频流和音频流能否直接复制
+        
+        请求的编码未指定或与源编码相同，未指定比特率，分辨率和帧率未指定或与源相同，
+        且源编码可以放入输出容器时，该流可以直接复制；指定了编码档位时视频流不复制；
+        输入中没有的流跟随另一个流的结果
+        
+        Returns:
+            tuple: (视频流能否复制, 音频流能否复制)
+        """
+        forced = (video_codec == "copy", audio_codec == "copy")
+        containers = self.CONTAINER_CODECS.get(os.path.splitext(output_path)[1].lower())
+        if containers is None:
+            return forced
+        video_codecs, audio_codecs = containers
+        
+        media_info = self.get_media_info(input_path)
+        if not media_info:
+            return forced
+        streams = media_info.get("streams", [])
+        
+        def codec_matches(requested, source_codec, allowed_codecs):
+            if requested == "copy":
+                return True
+            if requested and self.ENCODER_CODECS.get(requested, requested) != source_codec:
+                return False
+            return allowed_codecs is None or source_codec in allowed_codecs
+        
+        copy_video = None
+        video_stream = self._get_video_stream(media_info)
+        if video_stream is not None:
+            source_width, source_height = self._get_display_size(video_stream)
+            copy_video = (
+                not video_bitrate and not profile
+                and codec_matches(video_codec, video_stream.get("codec", ""), video_codecs)
+                and (not resolution or resolution == f"{source_width}x{source_height}")
+                and (fps <= 0 or abs(fps - video_stream.get("frame_rate", 0)) < 0.01)
+            )
+        
+        copy_audio = None
+        audio_streams = [stream for stream in streams if stream.get("type") == "audio"]
+        if audio_streams:
+            copy_audio = not audio_bitrate and all(
+                codec_matches(audio_codec, stream.get("codec", ""), audio_codecs)
+                for stream in audio_streams
+            )
+        
+        if copy_video is None:
+            copy_video = bool(copy_audio)
+        if copy_audio is None:
+            copy_audio = copy_video
+        return copy_video, copy_audio
+    
+    @staticmethod
+    def _get_input_thread_args(threads: int) -> List[str]:
+        """生成放在-i之前的线程参数，限制解码和滤镜线程数，0表示不限制"""
+        if threads <= 0:
+            return []
+        return ["-threads", str(threads), "-filter_threads", str(threads)]
+    
+    def get_keyframe_times(self, video_path: str) -> List[float]:
+        """
+        获取视频流中所有关键帧的时间
+        
+        只读取数据包的标志位，不解码画面；结果和媒体信息一样按文件缓存
+        
+        Args:
+            video_path: 视频文件路径
+            
+        Returns:
+            list: 升序排列的关键帧时间（秒，与ffprobe一致为绝对时间，起始时间不为0的输入需要减去
+                  媒体信息中的start_time），出错则返回空列表
+        """
+        if self.probe_cache is not None:
+            cached = self.probe_cache.get(video_path, tag="keyframes")
+            if cached is not None:
+                return cached["times"]
+        
+        ffprobe_path = self.ffmpeg_path.replace("ffmpeg", "ffprobe")
+        if not os.path.isfile(ffprobe_path):
+            print("错误：未找到FFprobe。")
+            return []
+        
+        cmd = [
+            ffprobe_path, "-v", "error",
+            "-select_streams", "v:0",
+            "-show_entries", "packet=pts_time,flags",
+            "-of", "csv=p=0",
+            video_path
+        ]
+        process = self._popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                              universal_newlines=True, encoding="utf-8", errors="replace")
+        times = []
+        for line in process.stdout:
+            pts_time, _, flags = line.strip().partition(",")
+            if "K" in flags:
+                try:
+                    times.append(float(pts_time))
+                except ValueError:
+                    pass
+        telemetry.wait_process(process)
+        if process.returncode != 0:
+            return []
+        
+        times.sort()
+        if self.probe_cache is not None:
+            self.probe_cache.put(video_path, {"times": times}, tag="keyframes")
+        return times
+    
+    def _plan_segments(self, input_path: str, duration: float, workers: int,
+                       start_time: float = 0) -> List[float]:
+        """
+        选择分段并行转换的切分点
+        
+        分段数取并发数的2倍以平衡各段长度不一造成的空闲，每段不短于SEGMENT_MIN_SECONDS，
+        切分点取最接近等分位置的关键帧
+        
+        Args:
+            input_path: 输入视频文件路径
+            duration: 视频时长（秒）
+            workers: 同时编码的进程数
+            start_time: 输入的起始时间（秒），例如.ts文件通常不为0；ffprobe返回的关键帧时间是
+                        绝对时间，而分段复用器看到的时间戳从0开始，需要减去起始时间
+        
+        Returns:
+            list: 升序的切分时间（秒，从0开始计算），不适合分段时返回空列表
+        """
+        count = min(workers * 2, int(duration // self.SEGMENT_MIN_SECONDS))
+        if count < 2:
+            return []
+        
+        keyframes = [t - start_time for t in self.get_keyframe_times(input_path)]
+        if len(keyframes) < 2:
+            return []
+        
+        split_times = []
+        min_gap = self.SEGMENT_MIN_SECONDS / 2
+        for i in range(1, count):
+            target = duration * i / count
+            nearest = min(keyframes, key=lambda t: abs(t - target))
+            previous = split_times[-1] if split_times else 0.0
+            if nearest - previous >= min_gap and duration - nearest >= min_gap:
+                split_times.append(nearest)
+        return split_times
+    
+    def _convert_video_segmented(self, input_path: str, output_path: str,
+                                 video_args: Callable[[int], List[str]], audio_args: List[str],
+                                 workers: int, threads: int,
+                                 progress_callback: Callable[[float], None] = None,
+                                 cancel_token: Optional[CancellationToken] = None) -> Optional[Tuple[int, str, int]]:
+        """
+        分段并行转换视频
+        
+        先用流复制在关键帧处把视频流切成若干段（每段都从关键帧开始，切分无损），
+        多个FFmpeg进程同时编码各段，音频从原文件单独编码一次，
+        最后用concat分离器以流复制方式拼接视频段并合并音频
+        
+        Args:
+            input_path: 输入视频文件路径
+            output_path: 输出视频文件路径
+            video_args: 根据线程数生成视频编码参数的函数
+            audio_args: 音频编码参数
+            workers: 同时编码的进程数
+            threads: 整个任务的线程预算，0表示使用全部核心
+            progress_callback: 进度回调函数
+            cancel_token: 取消令牌
+            
+        Returns:
+            tuple: (返回码, stderr最后若干行, 分段数)，不适合分段时返回None，由调用方使用普通转换
+        """
+        extension = os.path.splitext(output_path)[1].lower()
+        if extension not in self.CONTAINER_CODECS:
+            return None
+        
+        media_info = self.get_media_info(input_path)
+        video_stream = self._get_video_stream(media_info)
+        duration = media_info.get("duration", 0)
+        if video_stream is None or video_stream.get("rotation", 0):
+            return None
+        # 只处理音视频流，带字幕等其他流的文件用普通转换以保持输出的流结构
+        if any(stream.get("type") not in ("video", "audio") for stream in media_info.get("streams", [])):
+            return None
+        has_audio = any(stream.get("type") == "audio" for stream in media_info.get("streams", []))
+        
+        split_times = self._plan_segments(input_path, duration, workers, media_info.get("start_time", 0))
+        if not split_times:
+            return None
+        
+        # 任一分段失败时只终止本任务的其他进程，不影响调用方的取消令牌
+        segment_token = CancellationToken()
+        unregister = cancel_token.register(segment_token.cancel) if cancel_token else (lambda: None)
+        work_dir = tempfile.mkdtemp(prefix="segments_", dir=self.temp_dir)
+        try:
+            # 1. 在关键帧处无损切分视频流，切分时间略早于关键帧，避免浮点误差跳到下一个关键帧
+            returncode, stderr = self._run_ffmpeg([
+                self.ffmpeg_path, "-y", "-i", input_path,
+                "-map", "0:v:0", "-c", "copy",
+                "-f", "segment", "-segment_format", "matroska",
+                "-segment_times", ",".join(f"{max(0.0, t - 0.001):.6f}" for t in split_times),
+                "-reset_timestamps", "1",
+                os.path.join(work_dir, "part_%04d.mkv")
+            ], duration, progress_callback, progress_range=(0.0, 0.05), cancel_token=cancel_token)
+            if returncode != 0 or (cancel_token and cancel_token.is_cancelled):
+                return returncode or 1, stderr, len(split_times) + 1
+            
+            parts = sorted(f for f in os.listdir(work_dir) if f.startswith("part_"))
+            bounds = [0.0] + split_times + [duration]
+            segment_durations = [max(0.0, bounds[i + 1] - bounds[i]) for i in range(len(bounds) - 1)]
+            if len(parts) != len(segment_durations):
+                # 切分结果与计划不一致时按段数平均估算进度
+                segment_durations = [duration / max(1, len(parts))] * len(parts)
+            
+            if progress_callback:
+                progress_callback(FFmpegProgress(0.05))
+            
+            # 2. 并行编码各段，线程预算平均分给各进程
+            workers = min(workers, len(parts))
+            segment_threads = max(1, (threads or os.cpu_count() or 1) // workers)
+            encoded = [os.path.join(work_dir, f"encoded_{i:04d}{extension}") for i in range(len(parts))]
+            done_times = [0.0] * len(parts)
+            # 各段和音频（最后一项）的FFmpeg是否仍在运行，任一进程在运行时报告的进度都是心跳
+            running = [False] * (len(parts) + 1)
+            lock = threading.Lock()
+            
+            def report(index, progress):
+                with lock:
+                    running[index] = getattr(progress, "running", False)
+                    if index < len(parts):
+                        done_times[index] = getattr(progress, "out_time", 0.0) or segment_durations[index] * progress
+                    fraction = min(1.0, sum(done_times) / duration) if duration > 0 else 0.0
+                    progress_callback(FFmpegProgress(0.05 + 0.85 * fraction, running=any(running)))
+            
+            def encode(index):
+                if segment_token.is_cancelled:
+                    return 1, ""
+                cmd = [self.ffmpeg_path, "-y"] + self._get_input_thread_args(segment_threads)
+                cmd.extend(["-i", os.path.join(work_dir, parts[index]), "-an"])
+                cmd.extend(video_args(segment_threads))
+                cmd.append(encoded[index])
+                return self._run_ffmpeg(
+                    cmd, segment_durations[index],
+                    (lambda progress: report(index, progress)) if progress_callback else None,
+                    cancel_token=segment_token
+                )
+            
+            def encode_audio():
+                cmd = [self.ffmpeg_path, "-y", "-i", input_path, "-vn"] + audio_args
+                cmd.append(os.path.join(work_dir, f"audio{extension}"))
+                return self._run_ffmpeg(
+                    cmd, progress_callback=(lambda progress: report(len(parts), progress)) if progress_callback else None,
+                    cancel_token=segment_token
+                )
+            
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                # 各段的FFmpeg进程在线程池中启动，同样记录到本次转换
+                encode = telemetry.bind(encode)
+                futures = [executor.submit(encode, i) for i in range(len(parts))]
+                # 音频编码很快，排在视频段之后
+                if has_audio:
+                    futures.append(executor.submit(telemetry.bind(encode_audio)))
+                for future in futures:
+                    returncode, stderr = future.result()
+                    if returncode != 0:
+                        segment_token.cancel()
+                        return returncode, stderr, len(parts)
+            
+            # 3. 拼接视频段并合并音频，全部流复制
+            list_path = os.path.join(work_dir, "concat.txt")
+            with open(list_path, "w", encoding="utf-8") as f:
+                for path in encoded:
+                    f.write(f"file '{os.path.basename(path)}'\n")
+            
+            cmd = [self.ffmpeg_path, "-y", "-f", "concat", "-safe", "0", "-i", list_path]
+            if has_audio:
+                cmd.extend(["-i", os.path.join(work_dir, f"audio{extension}"), "-map", "0:v", "-map", "1:a"])
+            cmd.extend(["-c", "copy", output_path])
+            returncode, stderr = self._run_ffmpeg(cmd, duration, progress_callback, progress_range=(0.9, 1.0),
+                                                  cancel_token=cancel_token)
+            return returncode, stderr, len(parts)
+        finally:
+            unregister()
+            shutil.rmtree(work_dir, ignore_errors=True)
+    
+    def _resolve_video_encoder(self, output_path: str, video_codec: str) -> str:
+        """
+        获取实际使用的视频编码器，未指定时按输出容器选择可以应用编码档位的编码器
+        
+        Returns:
+            str: 编码器名称，无法确定时返回空字符串（使用FFmpeg默认编码器）
+        """
+        if video_codec:
+            return video_codec
+        
+        extension = os.path.splitext(output_path)[1].lower()
+        if extension == ".webm":
+            return "libvpx-vp9"
+        video_codecs = self.CONTAINER_CODECS.get(extension, (set(), set()))[0]
+        if video_codecs is None or "h264" in video_codecs:
+            return "libx264"
+        return ""
+    
+    def _get_encoder_args(self, encoder: str, profile: str, threads: int, has_bitrate: bool) -> List[str]:
+        """
+        生成编码档位和线程相关的编码器参数
+        
+        Args:
+            encoder: 视频编码器名称
+            profile: 编码性能档位，留空不添加速度和质量参数
+            threads: 线程数，0表示使用全部核心
+            has_bitrate: 是否已指定视频比特率，指定时不再添加CRF
+        
+        Returns:
+            list: FFmpeg参数
+        """
+        args = []
+        if profile and encoder in self.PROFILE_SPEED_ARGS:
+            args.extend(self.PROFILE_SPEED_ARGS[encoder][profile])
+            if not has_bitrate and encoder in self.PROFILE_CRF:
+                args.extend(["-crf", str(self.PROFILE_CRF[encoder])])
+                if encoder == "libvpx-vp9":
+                    # VP9只有在比特率为0时才是恒定质量模式
+                    args.extend(["-b:v", "0"])
+        
+        if encoder == "libx265":
+            # x265使用自己的线程池，-threads对它无效
+            if threads > 0:
+                args.extend(["-x265-params", f"pools={threads}"])
+        elif encoder == "libvpx-vp9":
+            # VP9默认只用一个线程，需要开启行级多线程并按线程数划分列块
+            thread_count = threads if threads > 0 else (os.cpu_count() or 1)
+            args.extend([
+                "-threads", str(thread_count), "-row-mt", "1",
+                "-tile-columns", str(min(6, thread_count.bit_length() - 1))
+            ])
+        elif encoder == "libvpx":
+            args.extend(["-threads", str(threads if threads > 0 else (os.cpu_count() or 1))])
+        elif threads > 0:
+            args.extend(["-threads", str(threads)])
+        return args
+    
+    @instrumented
+    def convert_audio_format(self, input_path: str, output_path: str,
+                           audio_codec: str = "", audio_bitrate: str = "",
+                           sample_rate: int = 0, channels: int = 0,
+                           progress_callback: Callable[[float], None] = None,
+                           cancel_token: Optional[CancellationToken] = None,
+                           normalize_loudness: bool = False) -> ConversionResult:
+        """
+        转换音频格式
+        
+        Args:
+            input_path: 输入音频文件路径
+            output_path: 输出音频文件路径
+            audio_codec: 音频编码器，默认使用输出格式的默认编码器
+            audio_bitrate: 音频比特率，例如"128k"
+            sample_rate: 采样率，例如44100
+            channels: 声道数，例如2表示立体声
+            progress_callback: 进度回调函数
+            cancel_token: 取消令牌，取消后终止FFmpeg进程并删除未完成的输出
+            normalize_loudness: 是否按LOUDNORM_TARGET做两遍loudnorm响度标准化，
+                                测量结果会被缓存，同一文件再次导出时只需要一遍
+            
+        Returns:
+            ConversionResult: 转换结果，成功时为真值，被取消时cancelled为True
+        """
+        if not self.is_ffmpeg_available():
+            print("错误：未找到FFmpeg。请确保FFmpeg已安装并添加到系统路径。")
+            return ConversionResult(False)
+        
+        if not os.path.isfile(input_path):
+            print(f"错误：输入文件 {input_path} 不存在。")
+            return ConversionResult(False)
+        
+        try:
+            duration = self._get_clip_duration(input_path, 0, 0, progress_callback)
+            
+            # 构建FFmpeg命令参数
+            cmd = [self.ffmpeg_path, "-y", "-i", input_path]
+            
+            # 响度标准化，需要时先运行测量
+            progress_range = (0.0, 1.0)
+            if normalize_loudness:
+                loudnorm_args, progress_range = self._get_loudnorm_args(
+                    input_path, duration, sample_rate, progress_callback, cancel_token
+                )
+                if cancel_token and cancel_token.is_cancelled:
+                    return self._cancelled_result()
+                if loudnorm_args is None:
+                    return ConversionResult(False, message="响度测量失败")
+                cmd.extend(loudnorm_args)
+            
+            # 添加音频编码参数
+            if audio_codec:
+                cmd.extend(["-c:a", audio_codec])
+            
+            # 添加音频比特率
+            if audio_bitrate:
+                cmd.extend(["-b:a", audio_bitrate])
+            
+            # 添加采样率
+            if sample_rate > 0:
+                cmd.extend(["-ar", str(sample_rate)])
+            
+            # 添加声道数
+            if channels > 0:
+                cmd.extend(["-ac", str(channels)])
+            
+            # 输出文件
+            cmd.append(output_path)
+            
+            # 执行FFmpeg
+            returncode, stderr = self._run_ffmpeg(
+                cmd, duration, progress_callback, progress_range, cancel_token=cancel_token
+            )
+            
+            if cancel_token and cancel_token.is_cancelled:
+                return self._cancelled_result(output_path)
+            
+            if returncode != 0:
+                print(f"FFmpeg错误: {stderr}")
+                return ConversionResult(False)
+            
+            # 完成
+            if progress_callback:
+                progress_callback(1.0)
+            
+            return ConversionResult(True)
             
         except Exception as e:
             print(f"音频格式转换出错: {str(e)}")
-            return False
+            return ConversionResult(False)
     
+    @instrumented
     def convert_image_format(self, input_path: str, output_path: str,
                            quality: int = 90, resize: Optional[Tuple[int, int]] = None,
                            rotate: int = 0, flip: bool = False, mirror: bool = False,
-                           progress_callback: Callable[[float], None] = None) -> bool:
+                           progress_callback: Callable[[float], None] = None,
+                           cancel_token: Optional[CancellationToken] = None,
+                           target_size: int = 0) -> ConversionResult:
         """
         转换图片格式
         
+        缩小JPEG时在解码阶段就按DCT缩放（Image.draft），其他格式先按整数倍reduce再精确缩放；
+        90度倍数的旋转与翻转、镜像合并为一次transpose
+        
         Args:
             input_path: 输入图片文件路径
             output_path: 输出图片文件路径
@@ -387,66 +1936,453 @@ class FormatConverter:
             flip: 是否上下翻转
             mirror: 是否左右镜像
             progress_callback: 进度回调函数
+            cancel_token: 取消令牌，在各处理步骤之间检查
+            target_size: 输出文件的目标字节数，只支持JPEG和WebP；大于0时在quality以内
+                         搜索不超过目标大小的最高质量，quality不再是固定值
             
         Returns:
-            bool: 转换成功返回True，失败返回False
+            ConversionResult: 转换结果，成功时为真值，被取消时cancelled为True；
+                              指定target_size时details包括实际使用的quality和bytes
         """
         if not os.path.isfile(input_path):
             print(f"错误：输入文件 {input_path} 不存在。")
-            return False
+            return ConversionResult(False)
+        
+        if target_size and not output_path.lower().endswith(self.IMAGE_TARGET_SIZE_FORMATS):
+            print("错误：目标文件大小只支持JPEG和WebP格式。")
+            return ConversionResult(False, message="目标文件大小只支持JPEG和WebP格式")
         
         try:
             if progress_callback:
                 progress_callback(0.1)
             
-            # 打开图片
+            # 打开图片（此时只读取文件头，像素数据在第一次使用时才解码）
             img = Image.open(input_path)
             
+            # 缩小JPEG时让解码器直接输出1/2、1/4或1/8尺寸，减少解码时间和内存
+            if resize and resize[0] < img.width and resize[1] < img.height:
+                img.draft(img.mode, (int(resize[0] * self.IMAGE_DRAFT_GAP), int(resize[1] * self.IMAGE_DRAFT_GAP)))
+            
+            # 解码像素数据（不调用时会在第一次使用时解码，提前调用只是为了分开统计耗时）
+            with telemetry.phase("decode"):
+                img.load()
+            
             if progress_callback:
                 progress_callback(0.3)
             
+            if cancel_token and cancel_token.is_cancelled:
+                return self._cancelled_result()
+            
             # 调整大小
             if resize:
-                img = img.resize(resize, Image.LANCZOS)
+                with telemetry.phase("resize"):
+                    img = img.resize(resize, Image.LANCZOS, reducing_gap=self.IMAGE_REDUCING_GAP)
             
             if progress_callback:
                 progress_callback(0.5)
             
-            # 旋转
-            if rotate:
-                img = img.rotate(-rotate, expand=True)
+            if cancel_token and cancel_token.is_cancelled:
+                return self._cancelled_result()
             
-            # 翻转和镜像
-            if flip:
-                img = img.transpose(Image.FLIP_TOP_BOTTOM)
-            if mirror:
-                img = img.transpose(Image.FLIP_LEFT_RIGHT)
+            # 旋转、翻转和镜像，能合并时只做一次transpose
+            mergeable, method = _merge_transposes(rotate, flip, mirror)
+            if mergeable:
+                if method is not None:
+                    img = img.transpose(method)
+            else:
+                img = img.rotate(-rotate, expand=True)
+                if flip:
+                    img = img.transpose(Image.FLIP_TOP_BOTTOM)
+                if mirror:
+                    img = img.transpose(Image.FLIP_LEFT_RIGHT)
             
             if progress_callback:
                 progress_callback(0.7)
             
+            if cancel_token and cancel_token.is_cancelled:
+                return self._cancelled_result()
+            
+            # 按目标大小搜索质量时只在内存中编码，最后把选中的结果写入文件
+            if target_size:
+                with telemetry.phase("encode"):
+                    found = self._encode_to_size(img, os.path.splitext(output_path)[1], target_size,
+                                                 quality, cancel_token)
+                if found is None:
+                    return self._cancelled_result()
+                quality, data = found
+                with open(output_path, "wb") as f:
+                    f.write(data)
+                
+                if progress_callback:
+                    progress_callback(1.0)
+                
+                details = {"quality": quality, "bytes": len(data)}
+                if len(data) > target_size:
+                    return ConversionResult(True, message=f"最低质量{quality}仍超过目标大小", details=details)
+                return ConversionResult(True, details=details)
+            
             # 保存图片
-            if output_path.lower().endswith(('.jpg', '.jpeg')):
-                img.save(output_path, quality=quality, optimize=True)
-            elif output_path.lower().endswith('.png'):
-                img.save(output_path, optimize=True)
-            elif output_path.lower().endswith('.webp'):
-                img.save(output_path, quality=quality)
+            with telemetry.phase("encode"):
+                self._save_image(img, output_path, quality)
+            
+            if progress_callback:
+                progress_callback(1.0)
+            
+            return ConversionResult(True)
+            
+        except Exception as e:
+            print(f"图片格式转换出错: {str(e)}")
+            return ConversionResult(False)
+    
+    @staticmethod
+    def _save_image(img: Image.Image, output: Union[str, io.BytesIO], quality: int = 90, ext: str = ""):
+        """
+        按输出扩展名保存图片
+        
+        Args:
+            img: 图片
+            output: 输出文件路径或内存缓冲区
+            quality: 图片质量，用于JPEG和WebP
+            ext: 输出扩展名，output为缓冲区时必须指定，默认取自输出路径
+        """
+        ext = (ext or os.path.splitext(output)[1]).lower()
+        image_format = {".jpg": "JPEG", ".jpeg": "JPEG", ".png": "PNG", ".webp": "WEBP"}.get(ext)
+        if image_format == "JPEG":
+            # JPEG不支持透明通道和调色板
+            if img.mode not in ("RGB", "L", "CMYK"):
+                img = img.convert("RGB")
+            img.save(output, image_format, quality=quality, optimize=True)
+        elif image_format == "PNG":
+            img.save(output, image_format, optimize=True)
+        elif image_format == "WEBP":
+            img.save(output, image_format, quality=quality)
+        else:
+            img.save(output)
+    
+    def _encode_to_size(self, img: Image.Image, ext: str, target_size: int, max_quality: int,
+                        cancel_token: Optional[CancellationToken] = None) -> Optional[Tuple[int, bytes]]:
+        """
+        搜索编码结果不超过目标大小的最高质量
+        
+        每轮在当前质量区间内取若干个点同时编码到内存（编码时释放GIL），
+        按结果缩小区间；只有一个CPU时退化为二分查找。第一轮总会尝试max_quality，
+        原图已足够小时只需编码一次
+        
+        Args:
+            img: 已处理好的图片
+            ext: 输出扩展名
+            target_size: 目标字节数
+            max_quality: 允许的最高质量
+            cancel_token: 取消令牌，在每轮之间检查
+        
+        Returns:
+            tuple: (质量, 编码后的数据)；最低质量仍超过目标时返回最低质量的结果，被取消时返回None
+        """
+        if ext.lower() in (".jpg", ".jpeg") and img.mode not in ("RGB", "L", "CMYK"):
+            img = img.convert("RGB")
+        
+        probes = max(1, min(self.IMAGE_TARGET_SIZE_PROBES, os.cpu_count() or 1))
+        # 保存时会在图片对象上记录编码参数，同时编码的每个点各用一个副本
+        images = [img] + [img.copy() for _ in range(probes - 1)]
+        
+        def encode(image, quality):
+            buffer = io.BytesIO()
+            self._save_image(image, buffer, quality, ext)
+            return buffer.getvalue()
+        
+        low, high = self.IMAGE_TARGET_MIN_QUALITY, max(self.IMAGE_TARGET_MIN_QUALITY, max_quality)
+        best = None
+        smallest = None
+        first_round = True
+        with ThreadPoolExecutor(max_workers=probes) as executor:
+            while low <= high:
+                if cancel_token and cancel_token.is_cancelled:
+                    return None
+                
+                if first_round:
+                    points = [low + (high - low) * (i + 1) // probes for i in range(probes - 1)] + [high]
+                    first_round = False
+                else:
+                    points = [low + (high - low) * (i + 1) // (probes + 1) for i in range(probes)]
+                points = sorted(set(points))
+                
+                encoded = zip(points, executor.map(encode, images, points))
+                for quality, data in encoded:
+                    if len(data) <= target_size:
+                        if best is None or quality > best[0]:
+                            best = (quality, data)
+                        low = max(low, quality + 1)
+                    else:
+                        if smallest is None or quality < smallest[0]:
+                            smallest = (quality, data)
+                        high = min(high, quality - 1)
+        
+        if best is not None:
+            return best
+        if smallest[0] != self.IMAGE_TARGET_MIN_QUALITY:
+            smallest = (self.IMAGE_TARGET_MIN_QUALITY, encode(img, self.IMAGE_TARGET_MIN_QUALITY))
+        return smallest
+    
+    @instrumented
+    def convert_image_sizes(self, input_path: str, output_dir: str,
+                            widths: Iterable[int] = (320, 640, 1280),
+                            formats: Iterable[str] = (".webp", ".jpg"),
+                            quality: int = 90, name_template: str = "{name}_{width}{ext}",
+                            workers: int = 0,
+                            progress_callback: Callable[[float], None] = None,
+                            cancel_token: Optional[CancellationToken] = None) -> ConversionResult:
+        """
+        把一张图片输出为多个宽度和格式，用于网页的响应式图片
+        
+        源图片只解码一次，从最大的宽度开始逐级缩小，每一级都由上一级缩放得到；
+        每个尺寸缩放完成后立即交给线程池编码，编码与下一级的缩放同时进行
+        
+        Args:
+            input_path: 输入图片文件路径
+            output_dir: 输出目录
+            widths: 输出宽度列表，高度按比例计算；大于原图宽度的不放大，全部大于时输出原图宽度
+            formats: 输出扩展名列表，例如(".webp", ".jpg")
+            quality: 图片质量，用于JPEG和WebP
+            name_template: 输出文件名模板，可用{name}（输入文件名）、{width}、{height}、{ext}
+            workers: 编码线程数，0表示按输出数量和CPU核心数自动选择
+            progress_callback: 进度回调函数
+            cancel_token: 取消令牌，取消后不再开始新的缩放和编码
+        
+        Returns:
+            ConversionResult: 转换结果，details["outputs"]为生成文件的列表，
+                              每项包括path、width、height、format和bytes
+        """
+        if not os.path.isfile(input_path):
+            print(f"错误：输入文件 {input_path} 不存在。")
+            return ConversionResult(False)
+        
+        formats = [ext if ext.startswith(".") else "." + ext for ext in formats]
+        if not formats:
+            return ConversionResult(False, message="没有指定输出格式")
+        
+        try:
+            img = Image.open(input_path)
+            source_width, source_height = img.size
+            targets = sorted({w for w in widths if 0 < w <= source_width}, reverse=True) or [source_width]
+            sizes = [(w, max(1, round(w * source_height / source_width))) for w in targets]
+            
+            # 最大的尺寸也小于原图时，JPEG可以直接按DCT缩放解码
+            largest = sizes[0]
+            if largest[0] < source_width and largest[1] < source_height:
+                img.draft(img.mode, (int(largest[0] * self.IMAGE_DRAFT_GAP), int(largest[1] * self.IMAGE_DRAFT_GAP)))
+            img.load()
+            # 调色板图片缩放时只能取最近邻，先转为真彩色
+            if img.mode in ("P", "1"):
+                img = img.convert("RGBA" if "transparency" in img.info else "RGB")
+            
+            os.makedirs(output_dir, exist_ok=True)
+            name = os.path.splitext(os.path.basename(input_path))[0]
+            total = len(sizes) * len(formats)
+            done = [0]
+            lock = threading.Lock()
+            
+            def encode(image, width, height, ext):
+                output_path = os.path.join(
+                    output_dir, name_template.format(name=name, width=width, height=height, ext=ext)
+                )
+                self._save_image(image, output_path, quality)
+                entry = {
+                    "path": output_path,
+                    "width": width,
+                    "height": height,
+                    "format": ext,
+                    "bytes": os.path.getsize(output_path),
+                }
+                with lock:
+                    done[0] += 1
+                    if progress_callback:
+                        progress_callback(done[0] / total)
+                return entry
+            
+            workers = workers or min(total, os.cpu_count() or 1)
+            futures = []
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                current = img
+                for width, height in sizes:
+                    if cancel_token and cancel_token.is_cancelled:
+                        break
+                    if current.size != (width, height):
+                        current = current.resize((width, height), Image.LANCZOS, reducing_gap=self.IMAGE_REDUCING_GAP)
+                    # 保存时会在图片对象上记录编码参数，同一尺寸的多个格式各用一个副本
+                    for index, ext in enumerate(formats):
+                        image = current if index == 0 else current.copy()
+                        futures.append(executor.submit(encode, image, width, height, ext))
+            
+            outputs = [future.result() for future in futures]
+            if cancel_token and cancel_token.is_cancelled:
+                result = self._cancelled_result()
+                result.details = {"outputs": outputs}
+                return result
+            return ConversionResult(True, details={"outputs": outputs})
+            
+        except Exception as e:
+            print(f"多尺寸图片输出出错: {str(e)}")
+            return ConversionResult(False, message=str(e))
+    
+    def convert_images(self, paths: Iterable[str], output_dir: str, output_ext: str = "",
+                       workers: int = 0, chunk_size: int = 0,
+                       cancel_token: Optional[CancellationToken] = None,
+                       worker_stats: Optional[Dict[int, Dict[str, float]]] = None,
+                       **options) -> Iterator[Dict[str, Any]]:
+        """
+        批量转换图片，在多个子进程中并行执行convert_image_format
+        
+        输出文件名与输入相同（扩展名改为output_ext），重名时依次加上"_1"、"_2"等后缀
+        
+        Args:
+            paths: 输入图片路径，可以是生成器
+            output_dir: 输出目录
+            output_ext: 输出扩展名，例如".webp"，为空时保持原格式
+            workers: 进程数，0表示使用CPU核心数
+            chunk_size: 每个子进程任务包含的图片数，0表示自动选择
+            cancel_token: 取消令牌，取消后不再启动新的任务块
+            worker_stats: 传入字典时按进程号记录各进程的吞吐量，见convert_image_jobs
+            **options: 传给convert_image_format的参数，例如quality、resize
+        
+        Returns:
+            Iterator[dict]: 按完成顺序逐个产生的结果项
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        if output_ext and not output_ext.startswith("."):
+            output_ext = "." + output_ext
+        
+        def iter_jobs():
+            used_names = set()
+            for input_path in paths:
+                name, ext = os.path.splitext(os.path.basename(input_path))
+                ext = output_ext or ext
+                candidate, index = name + ext, 0
+                while candidate.lower() in used_names:
+                    index += 1
+                    candidate = f"{name}_{index}{ext}"
+                used_names.add(candidate.lower())
+                yield input_path, os.path.join(output_dir, candidate)
+        
+        if hasattr(paths, "__len__"):
+            jobs = list(iter_jobs())
+        else:
+            jobs = iter_jobs()
+        return self.convert_image_jobs(jobs, options, workers, chunk_size, cancel_token, worker_stats)
+    
+    def convert_image_jobs(self, jobs: Iterable[Tuple[str, str]], options: Optional[Dict[str, Any]] = None,
+                           workers: int = 0, chunk_size: int = 0,
+                           cancel_token: Optional[CancellationToken] = None,
+                           worker_stats: Optional[Dict[int, Dict[str, float]]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        在进程池中执行一组图片转换任务
+        
+        任务按块提交给子进程，每个子进程复用一个转换器实例；同时在途的任务块数量有上限，
+        输入为生成器时不会一次性读入全部任务
+        
+        Args:
+            jobs: (输入路径, 输出路径)列表，输出目录需要已经存在
+            options: 传给convert_image_format的参数
+            workers: 进程数，0表示使用CPU核心数
+            chunk_size: 每个任务块包含的图片数，0表示按任务数和进程数自动选择
+            cancel_token: 取消令牌，取消后不再启动新的任务块，未完成的任务记为取消
+            worker_stats: 传入字典时按进程号记录各进程的统计，每项包括files（文件数）、
+                          busy（转换耗时秒数）、bytes（输入字节数）、files_per_second和mb_per_second
+        
+        Returns:
+            Iterator[dict]: 结果项，包括input、output、success、cancelled、skipped、message、
+                            elapsed、size和worker（执行转换的进程号）
+        """
+        options = dict(options or {})
+        workers = workers or os.cpu_count() or 1
+        if not chunk_size:
+            if hasattr(jobs, "__len__"):
+                # 每个进程至少分到4块，任务结束前各进程的负载比较均衡
+                chunk_size = max(1, min(self.IMAGE_CHUNK_MAX, len(jobs) // (workers * 4)))
             else:
-                img.save(output_path)
-            
-            if progress_callback:
-                progress_callback(1.0)
-            
+                chunk_size = self.IMAGE_CHUNK_MAX // 4
+        
+        def make_item(input_path, output_path, success, cancelled, message, elapsed, size, worker):
+            return {
+                "input": input_path,
+                "output": output_path,
+                "success": success,
+                "cancelled": cancelled,
+                "skipped": False,
+                "message": message,
+                "elapsed": elapsed,
+                "size": size,
+                "worker": worker,
+            }
+        
+        job_iter = iter(jobs)
+        pending = {}
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_image_worker)
+        
+        def submit_next():
+            chunk = list(itertools.islice(job_iter, chunk_size))
+            if not chunk:
+                return False
+            pending[executor.submit(_convert_image_chunk, chunk, options)] = chunk
             return True
+        
+        def is_cancelled():
+            return bool(cancel_token and cancel_token.is_cancelled)
+        
+        try:
+            # 每个进程最多有两个任务块在途，一块在转换时下一块已在队列中等待
+            while not is_cancelled() and len(pending) < workers * 2 and submit_next():
+                pass
+            
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    chunk = pending.pop(future)
+                    worker = None
+                    if future.cancelled():
+                        results = [(False, True, "转换已取消", 0.0, 0)] * len(chunk)
+                    else:
+                        try:
+                            worker, results = future.result()
+                        except Exception as e:
+                            results = [(False, False, str(e), 0.0, 0)] * len(chunk)
+                    
+                    if worker is not None and worker_stats is not None:
+                        stats = worker_stats.setdefault(worker, {"files": 0, "busy": 0.0, "bytes": 0})
+                        stats["files"] += len(results)
+                        stats["busy"] += sum(r[3] for r in results)
+                        stats["bytes"] += sum(r[4] for r in results)
+                        busy = max(stats["busy"], 1e-6)
+                        stats["files_per_second"] = stats["files"] / busy
+                        stats["mb_per_second"] = stats["bytes"] / (1024 * 1024) / busy
+                    
+                    for (input_path, output_path), result in zip(chunk, results):
+                        item = make_item(input_path, output_path, *result, worker)
+                        if self.telemetry_sinks:
+                            telemetry.record_item(self.telemetry_sinks, "convert_image_format", item, worker)
+                        yield item
+                
+                if is_cancelled():
+                    for future in pending:
+                        future.cancel()
+                else:
+                    while len(pending) < workers * 2 and submit_next():
+                        pass
             
-        except Exception as e:
-            print(f"图片格式转换出错: {str(e)}")
-            return False
+            # 取消后剩余的任务没有提交，同样记为取消
+            for input_path, output_path in job_iter:
+                yield make_item(input_path, output_path, False, True, "转换已取消", 0.0, 0, None)
+        finally:
+            # 调用方提前停止迭代时不再启动排队中的任务块
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
     
+    @instrumented
     def extract_audio_from_video(self, input_path: str, output_path: str,
                                audio_codec: str = "", audio_bitrate: str = "",
-                               progress_callback: Callable[[float], None] = None) -> bool:
+                               progress_callback: Callable[[float], None] = None,
+                               cancel_token: Optional[CancellationToken] = None,
+                               normalize_loudness: bool = False) -> ConversionResult:
         """
         从视频中提取音频
         
@@ -456,22 +2392,38 @@ class FormatConverter:
             audio_codec: 音频编码器，默认使用输出格式的默认编码器
             audio_bitrate: 音频比特率，例如"128k"
             progress_callback: 进度回调函数
+            cancel_token: 取消令牌，取消后终止FFmpeg进程并删除未完成的输出
+            normalize_loudness: 是否做两遍loudnorm响度标准化，见convert_audio_format
             
         Returns:
-            bool: 转换成功返回True，失败返回False
+            ConversionResult: 转换结果，成功时为真值，被取消时cancelled为True
         """
         if not self.is_ffmpeg_available():
             print("错误：未找到FFmpeg。请确保FFmpeg已安装并添加到系统路径。")
-            return False
+            return ConversionResult(False)
         
         if not os.path.isfile(input_path):
             print(f"错误：输入文件 {input_path} 不存在。")
-            return False
+            return ConversionResult(False)
         
         try:
+            duration = self._get_clip_duration(input_path, 0, 0, progress_callback)
+            
             # 构建FFmpeg命令参数
             cmd = [self.ffmpeg_path, "-y", "-i", input_path, "-vn"]  # -vn表示无视频
             
+            # 响度标准化，需要时先运行测量
+            progress_range = (0.0, 1.0)
+            if normalize_loudness:
+                loudnorm_args, progress_range = self._get_loudnorm_args(
+                    input_path, duration, 0, progress_callback, cancel_token
+                )
+                if cancel_token and cancel_token.is_cancelled:
+                    return self._cancelled_result()
+                if loudnorm_args is None:
+                    return ConversionResult(False, message="响度测量失败")
+                cmd.extend(loudnorm_args)
+            
             # 添加音频编码参数
             if audio_codec:
                 cmd.extend(["-c:a", audio_codec])
@@ -484,36 +2436,159 @@ class FormatConverter:
             cmd.append(output_path)
             
             # 执行FFmpeg
-            process = subprocess.Popen(
-                cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True
+            returncode, stderr = self._run_ffmpeg(
+                cmd, duration, progress_callback, progress_range, cancel_token=cancel_token
             )
             
-            # 读取输出以更新进度
-            if progress_callback:
-                progress_callback(0.1)  # 初始进度10%
+            if cancel_token and cancel_token.is_cancelled:
+                return self._cancelled_result(output_path)
             
-            # 等待命令完成
-            process.wait()
+            if returncode != 0:
+                print(f"FFmpeg错误: {stderr}")
+                return ConversionResult(False)
             
             # 完成
             if progress_callback:
                 progress_callback(1.0)
             
-            if process.returncode != 0:
-                stderr = process.stderr.read()
-                print(f"FFmpeg错误: {stderr}")
-                return False
-            
-            return True
+            return ConversionResult(True)
             
         except Exception as e:
             print(f"从视频提取音频出错: {str(e)}")
-            return False
+            return ConversionResult(False)
+    
+    @instrumented
+    def measure_loudness(self, input_path: str,
+                         progress_callback: Callable[[float], None] = None,
+                         cancel_token: Optional[CancellationToken] = None) -> Dict[str, float]:
+        """
+        用loudnorm滤镜测量音频响度（两遍标准化的第一遍）
+        
+        测量结果按文件和LOUDNORM_TARGET缓存，文件未变化时不再解码整个音频
+        
+        Args:
+            input_path: 输入音视频文件路径
+            progress_callback: 进度回调函数
+            cancel_token: 取消令牌，取消后终止FFmpeg进程
+        
+        Returns:
+            dict: input_i、input_tp、input_lra、input_thresh和target_offset，出错或被取消时返回空字典
+        """
+        duration = self._get_clip_duration(input_path, 0, 0, progress_callback)
+        return self._measure_loudness(input_path, duration, progress_callback, (0.0, 1.0), cancel_token)
+    
+    def _get_loudness_cache_tag(self) -> str:
+        """测量结果的缓存标签，target_offset与目标有关，因此目标也是缓存键的一部分"""
+        return "loudnorm:" + ":".join(f"{k}={v}" for k, v in sorted(self.LOUDNORM_TARGET.items()))
+    
+    def _measure_loudness(self, input_path: str, duration: float,
+                          progress_callback: Callable[[float], None] = None,
+                          progress_range: Tuple[float, float] = (0.0, 1.0),
+                          cancel_token: Optional[CancellationToken] = None) -> Dict[str, float]:
+        """
+        测量音频响度，优先使用缓存
+        
+        Args:
+            input_path: 输入音视频文件路径
+            duration: 媒体时长（秒），用于计算进度
+            progress_callback: 进度回调函数
+            progress_range: 测量在总进度中占据的区间
+            cancel_token: 取消令牌
+        
+        Returns:
+            dict: 测量结果，出错或被取消时返回空字典
+        """
+        tag = self._get_loudness_cache_tag()
+        if self.probe_cache is not None:
+            cached = self.probe_cache.get(input_path, tag=tag)
+            if cached is not None:
+                return cached
+        
+        target = ":".join(f"{k}={v}" for k, v in self.LOUDNORM_TARGET.items())
+        cmd = [
+            self.ffmpeg_path, "-hide_banner", "-i", input_path,
+            "-vn", "-sn", "-dn",
+            "-af", f"loudnorm={target}:print_format=json",
+            "-f", "null", "-"
+        ]
+        returncode, stderr = self._run_ffmpeg(cmd, duration, progress_callback, progress_range,
+                                              cancel_token=cancel_token)
+        if cancel_token and cancel_token.is_cancelled:
+            return {}
+        if returncode != 0:
+            print(f"FFmpeg错误: {stderr}")
+            return {}
+        
+        # 测量结果是stderr末尾的一段JSON
+        try:
+            data = json.loads(stderr[stderr.rindex("{"):stderr.rindex("}") + 1])
+            measured = {key: float(data[key]) for key in self.LOUDNORM_MEASURED_KEYS}
+        except (ValueError, KeyError) as e:
+            print(f"解析响度测量结果出错: {str(e)}")
+            return {}
+        
+        # 静音的输入测得-inf，无法标准化
+        if any(value != value or value in (float("inf"), float("-inf")) for value in measured.values()):
+            print("错误：输入音频为静音，无法进行响度标准化。")
+            return {}
+        
+        if self.probe_cache is not None:
+            self.probe_cache.put(input_path, measured, tag=tag)
+        return measured
+    
+    def _get_loudnorm_args(self, input_path: str, duration: float, sample_rate: int,
+                           progress_callback: Callable[[float], None] = None,
+                           cancel_token: Optional[CancellationToken] = None
+                           ) -> Tuple[Optional[List[str]], Tuple[float, float]]:
+        """
+        生成第二遍（线性）loudnorm的FFmpeg参数
+        
+        没有缓存的测量结果时先运行测量，占用前一半进度
+        
+        Args:
+            input_path: 输入音视频文件路径
+            duration: 媒体时长（秒）
+            sample_rate: 用户指定的输出采样率，0表示保持输入的采样率
+            progress_callback: 进度回调函数
+            cancel_token: 取消令牌
+        
+        Returns:
+            tuple: (FFmpeg参数, 编码在总进度中占据的区间)，测量失败或被取消时参数为None
+        """
+        progress_range = (0.0, 1.0)
+        tag = self._get_loudness_cache_tag()
+        if self.probe_cache is None or self.probe_cache.get(input_path, tag=tag) is None:
+            progress_range = (0.5, 1.0)
+        
+        measured = self._measure_loudness(input_path, duration, progress_callback, (0.0, 0.5), cancel_token)
+        if not measured:
+            return None, progress_range
+        
+        target = ":".join(f"{k}={v}" for k, v in self.LOUDNORM_TARGET.items())
+        loudnorm = (
+            f"loudnorm={target}"
+            f":measured_I={measured['input_i']}:measured_TP={measured['input_tp']}"
+            f":measured_LRA={measured['input_lra']}:measured_thresh={measured['input_thresh']}"
+            f":offset={measured['target_offset']}:linear=true"
+        )
+        args = ["-af", loudnorm]
+        
+        # loudnorm内部以192kHz处理，输出时恢复输入的采样率
+        if sample_rate <= 0:
+            audio_streams = [
+                stream for stream in self.get_media_info(input_path).get("streams", [])
+                if stream["type"] == "audio" and stream.get("sample_rate")
+            ]
+            args.extend(["-ar", str(audio_streams[0]["sample_rate"] if audio_streams else 48000)])
+        return args, progress_range
     
+    @instrumented
     def get_media_info(self, file_path: str) -> Dict[str, Any]:
         """
         获取媒体文件信息
         
+        结果按文件路径、大小和修改时间缓存，文件未变化时不再调用ffprobe
+        
         Args:
             file_path: 媒体文件路径
             
@@ -528,6 +2603,27 @@ class FormatConverter:
             print(f"错误：文件 {file_path} 不存在。")
             return {}
         
+        if self.probe_cache is not None:
+            cached = self.probe_cache.get(file_path)
+            # 没有start_time的是旧版本写入的缓存，重新探测
+            if cached is not None and "start_time" in cached:
+                return cached
+        
+        media_info = self._probe_media(file_path)
+        if media_info and self.probe_cache is not None:
+            self.probe_cache.put(file_path, media_info)
+        return media_info
+    
+    def _probe_media(self, file_path: str) -> Dict[str, Any]:
+        """
+        调用ffprobe获取媒体文件信息
+        
+        Args:
+            file_path: 媒体文件路径
+            
+        Returns:
+            dict: 包含媒体信息的字典，出错则返回空字典
+        """
         try:
             # 使用FFprobe获取媒体信息
             ffprobe_path = self.ffmpeg_path.replace("ffmpeg", "ffprobe")
@@ -544,18 +2640,18 @@ class FormatConverter:
                 file_path
             ]
             
-            result = subprocess.run(cmd, capture_output=True, text=True)
+            result = self._run_process(cmd)
             if result.returncode != 0:
                 print(f"FFprobe错误: {result.stderr}")
                 return {}
             
-            import json
             info = json.loads(result.stdout)
             
             # 提取常用信息
             media_info = {
                 "format": info.get("format", {}).get("format_name", ""),
                 "duration": float(info.get("format", {}).get("duration", 0)),
+                "start_time": float(info.get("format", {}).get("start_time", 0)),
                 "size": int(info.get("format", {}).get("size", 0)),
                 "bit_rate": int(info.get("format", {}).get("bit_rate", 0)),
                 "streams": []
@@ -571,8 +2667,9 @@ class FormatConverter:
                         "codec": stream.get("codec_name", ""),
                         "width": stream.get("width", 0),
                         "height": stream.get("height", 0),
-                        "frame_rate": eval(stream.get("r_frame_rate", "0/1")),
-                        "bit_rate": int(stream.get("bit_rate", 0))
+                        "frame_rate": self._parse_rational(stream.get("r_frame_rate", "0/1")),
+                        "bit_rate": int(stream.get("bit_rate", 0)),
+                        "rotation": self._get_stream_rotation(stream)
                     }
                 elif stream_type == "audio":
                     stream_info = {
@@ -596,6 +2693,118 @@ class FormatConverter:
             print(f"获取媒体信息出错: {str(e)}")
             return {}
     
+    def get_media_info_many(self, paths: Iterable[str],
+                            max_workers: int = 0) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        并发获取多个媒体文件的信息，按完成顺序逐个返回
+        
+        已缓存的文件立即返回，其余文件由有限数量的ffprobe进程并发探测；
+        同时排队的任务数有上限，输入可以是很长的生成器
+        
+        Args:
+            paths: 媒体文件路径
+            max_workers: 同时运行的ffprobe进程数，0表示CPU核心数的2倍（最多16个）
+            
+        Yields:
+            tuple: (文件路径, 媒体信息字典)，出错的文件对应空字典
+        """
+        max_workers = max_workers or min(16, (os.cpu_count() or 1) * 2)
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        pending = {}
+        
+        try:
+            for path in paths:
+                if self.probe_cache is not None:
+                    cached = self.probe_cache.get(path)
+                    if cached is not None and "start_time" in cached:
+                        yield path, cached
+                        continue
+                
+                pending[executor.submit(self.get_media_info, path)] = path
+                
+                # 排队任务达到上限时，先返回已完成的结果
+                if len(pending) >= max_workers * 2:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield pending.pop(future), future.result()
+            
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield pending.pop(future), future.result()
+        finally:
+            # 提前结束迭代时取消尚未开始的探测（cancel_futures参数需要Python 3.9，这里逐个取消）
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
+    
+    @staticmethod
+    def _parse_rational(value: str) -> float:
+        """
+        解析ffprobe输出的分数形式的数值，例如"30000/1001"
+        
+        Args:
+            value: 分数或数字字符串
+            
+        Returns:
+            float: 数值，无法解析或分母为0时返回0
+        """
+        try:
+            numerator, _, denominator = str(value).partition("/")
+            if not denominator:
+                return float(numerator)
+            denominator = float(denominator)
+            return float(numerator) / denominator if denominator else 0.0
+        except ValueError:
+            return 0.0
+    
+    @staticmethod
+    def _get_stream_rotation(stream: Dict[str, Any]) -> int:
+        """
+        获取视频流的旋转角度（ffprobe的tags或side_data中的旋转信息）
+        
+        Args:
+            stream: ffprobe输出的流信息
+            
+        Returns:
+            int: 旋转角度，0/90/180/270
+        """
+        rotation = stream.get("tags", {}).get("rotate")
+        if rotation is None:
+            for side_data in stream.get("side_data_list", []):
+                if "rotation" in side_data:
+                    rotation = side_data["rotation"]
+                    break
+        try:
+            return int(float(rotation or 0)) % 360
+        except (TypeError, ValueError):
+            return 0
+    
+    @staticmethod
+    def _get_video_stream(media_info: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """返回媒体信息中的第一个视频流，没有则返回None"""
+        for stream in media_info.get("streams", []):
+            if stream.get("type") == "video":
+                return stream
+        return None
+    
+    @staticmethod
+    def _get_display_size(video_stream: Dict[str, Any]) -> Tuple[int, int]:
+        """
+        获取视频的显示尺寸，FFmpeg默认会按旋转信息自动旋转画面
+        
+        Args:
+            video_stream: get_media_info返回的视频流信息
+            
+        Returns:
+            tuple: (宽, 高)
+        """
+        width = video_stream.get("width", 0)
+        height = video_stream.get("height", 0)
+        if video_stream.get("rotation", 0) in (90, 270):
+            return height, width
+        return width, height
+    
     @staticmethod
     def get_supported_video_formats() -> List[str]:
         """
@@ -635,6 +2844,38 @@ class FormatConverter:
             ".ico", ".svg", ".raw", ".heic", ".heif"
         ]
 
+# 批量图片转换在子进程中执行，每个进程复用一个转换器实例
+_image_worker_converter = None
+
+def _init_image_worker():
+    """图片转换子进程初始化"""
+    global _image_worker_converter
+    _image_worker_converter = FormatConverter(use_probe_cache=False)
+
+def _convert_image_chunk(jobs: List[Tuple[str, str]],
+                         options: Dict[str, Any]) -> Tuple[int, List[Tuple[bool, bool, str, float, int]]]:
+    """
+    在子进程中依次转换一组图片
+    
+    Args:
+        jobs: (输入路径, 输出路径)列表
+        options: 传给convert_image_format的参数
+    
+    Returns:
+        tuple: (进程号, [(是否成功, 是否取消, 说明, 耗时, 输入字节数), ...])
+    """
+    results = []
+    for input_path, output_path in jobs:
+        start = time.time()
+        result = _image_worker_converter.convert_image_format(input_path, output_path, **options)
+        elapsed = time.time() - start
+        try:
+            size = os.path.getsize(input_path)
+        except OSError:
+            size = 0
+        results.append((bool(result), result.cancelled, result.message, elapsed, size))
+    return os.getpid(), results
+
 class VideoTimestampExtractor:
     """从视频中提取指定时间点的帧"""
     
@@ -647,6 +2888,7 @@ class VideoTimestampExtractor:
         """
         self.converter = converter
     
+    @instrumented
     def extract_frame(self, video_path: str, output_path: str, timestamp: float) -> bool:
         """
         从视频中提取指定时间点的帧
@@ -680,7 +2922,7 @@ class VideoTimestampExtractor:
             ]
             
             # 执行FFmpeg
-            process = subprocess.run(cmd, capture_output=True, text=True)
+            process = self.converter._run_process(cmd)
             
             if process.returncode != 0:
                 print(f"FFmpeg错误: {process.stderr}")
@@ -692,6 +2934,336 @@ class VideoTimestampExtractor:
             print(f"从视频提取帧出错: {str(e)}")
             return False
     
+    @staticmethod
+    def _select_filter(targets: List[float]) -> str:
+        """
+        生成按时间表选帧的select滤镜
+        
+        每个时间点选中时间不早于它的第一帧：该帧时间>=Ti且上一个选中帧的时间<Ti；
+        表达式放在引号中，其中的逗号不会被当作滤镜分隔符
+        
+        Args:
+            targets: 升序的时间点（秒，相对滤镜中的起始时间）
+            
+        Returns:
+            str: select滤镜
+        """
+        terms = [f"gte(t,{t:.6f})*(isnan(prev_selected_t)+lt(prev_selected_t,{t:.6f}))" for t in targets]
+        return f"select='{'+'.join(terms)}'"
+    
+    @staticmethod
+    def _match_targets(targets: List[float], frame_time: float, start: int) -> int:
+        """
+        把select滤镜选出的帧对应回时间点
+        
+        选出的帧对应所有落在(上一个选出帧的时间, 本帧时间]区间内的时间点
+        
+        Args:
+            targets: 升序的时间点
+            frame_time: 本帧时间
+            start: 上一帧匹配结束的位置
+            
+        Returns:
+            int: 本帧匹配结束的位置，targets[start:返回值]为本帧对应的时间点
+        """
+        while start < len(targets) and targets[start] <= frame_time + 1e-6:
+            start += 1
+        return start
+    
+    @instrumented
+    def extract_frames_at(self, video_path: str, timestamps: Iterable[float], output_dir: str,
+                          output_format: str = "jpg", name_prefix: str = "frame",
+                          progress_callback: Callable[[float], None] = None,
+                          cancel_token: Optional[CancellationToken] = None) -> Dict[float, str]:
+        """
+        在一次解码中提取多个时间点的帧
+        
+        先快速定位到最早的时间点，再用select滤镜按排好序的时间表选出每个时间点之后的第一帧，
+        showinfo滤镜输出的pts_time用于把输出的帧对应回请求的时间点
+        
+        Args:
+            video_path: 视频文件路径
+            timestamps: 时间点列表（秒），顺序和重复不影响结果
+            output_dir: 输出目录路径
+            output_format: 输出图片格式，默认jpg
+            name_prefix: 文件名前缀，文件名为"前缀_毫秒数.格式"，例如frame_0000012500.jpg
+            progress_callback: 进度回调函数
+            cancel_token: 取消令牌
+            
+        Returns:
+            dict: 时间点到输出图片路径的映射，超出视频长度的时间点不在其中；
+                  多个时间点落在同一帧时共用一个文件；出错则返回空字典
+        """
+        if not self.converter.is_ffmpeg_available():
+            print("错误：未找到FFmpeg。请确保FFmpeg已安装并添加到系统路径。")
+            return {}
+        
+        if not os.path.isfile(video_path):
+            print(f"错误：视频文件 {video_path} 不存在。")
+            return {}
+        
+        # 时间点会遍历两次（生成时间表和返回结果），生成器需要先转成列表
+        timestamps = list(timestamps)
+        schedule = sorted(set(max(0.0, float(t)) for t in timestamps))
+        if not schedule:
+            return {}
+        
+        os.makedirs(output_dir, exist_ok=True)
+        work_dir = tempfile.mkdtemp(prefix="frames_at_", dir=output_dir)
+        
+        try:
+            # 定位到最早的时间点，滤镜中的时间从这里开始计算
+            offset = schedule[0]
+            targets = [t - offset for t in schedule]
+            
+            cmd = [self.converter.ffmpeg_path, "-y"]
+            if offset > 0:
+                cmd.extend(["-ss", f"{offset:.6f}"])
+            # 最后一个时间点之后不再读取输入
+            cmd.extend(["-t", f"{targets[-1] + 2:.6f}", "-i", video_path])
+            cmd.extend([
+                "-vf", f"{self._select_filter(targets)},showinfo",
+                "-vsync", "0",
+                "-q:v", "2",
+                os.path.join(work_dir, f"%06d.{output_format}")
+            ])
+            
+            frame_times = []
+            
+            def parse_showinfo(line):
+                if "Parsed_showinfo" in line and " n:" in line:
+                    _, _, rest = line.partition("pts_time:")
+                    try:
+                        frame_times.append(float(rest.split()[0]))
+                    except (ValueError, IndexError):
+                        pass
+            
+            returncode, stderr = self.converter._run_ffmpeg(
+                cmd, targets[-1], progress_callback,
+                cancel_token=cancel_token, stderr_callback=parse_showinfo
+            )
+            
+            if cancel_token and cancel_token.is_cancelled:
+                return {}
+            
+            if returncode != 0:
+                print(f"FFmpeg错误: {stderr}")
+                return {}
+            
+            result = {}
+            index = 0
+            for number, frame_time in enumerate(frame_times, 1):
+                frame_path = os.path.join(work_dir, f"{number:06d}.{output_format}")
+                if not os.path.isfile(frame_path):
+                    continue
+                
+                next_index = self._match_targets(targets, frame_time, index)
+                matched = schedule[index:next_index]
+                index = next_index
+                if not matched:
+                    continue
+                
+                output_path = os.path.join(
+                    output_dir, f"{name_prefix}_{int(round(matched[0] * 1000)):010d}.{output_format}"
+                )
+                os.replace(frame_path, output_path)
+                for timestamp in matched:
+                    result[timestamp] = output_path
+            
+            if progress_callback:
+                progress_callback(1.0)
+            
+            # 按调用方传入的时间点返回
+            return {t: result[max(0.0, float(t))] for t in timestamps if max(0.0, float(t)) in result}
+            
+        except Exception as e:
+            print(f"从视频批量提取帧出错: {str(e)}")
+            return {}
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    
+    def iter_frames(self, video_path: str, start_time: float = 0, duration: float = 0,
+                    fps: float = 0, scale: float = 1.0, size: Tuple[int, int] = None,
+                    pixel_format: str = "rgb24",
+                    cancel_token: Optional[CancellationToken] = None) -> Iterator[VideoFrame]:
+        """
+        不经过磁盘，直接从FFmpeg的rawvideo管道逐帧读取解码后的画面
+        
+        Args:
+            video_path: 视频文件路径
+            start_time: 开始时间（秒）
+            duration: 持续时间（秒），0表示到视频结束
+            fps: 输出帧率，0表示保留源视频的每一帧
+            scale: 缩放比例，指定size时忽略
+            size: 输出尺寸(宽, 高)，由FFmpeg缩放
+            pixel_format: 像素格式，见RAWVIDEO_PIXEL_FORMATS；rgba和gray格式的to_image()不复制数据
+            cancel_token: 取消令牌，取消后终止FFmpeg并结束迭代
+            
+        Yields:
+            VideoFrame: 带时间戳（秒，相对视频开头）的视频帧；
+                        所有帧共用一个缓冲区，帧数据在下一次迭代时被覆盖
+        """
+        if not self.converter.is_ffmpeg_available():
+            print("错误：未找到FFmpeg。请确保FFmpeg已安装并添加到系统路径。")
+            return
+        
+        if not os.path.isfile(video_path):
+            print(f"错误：视频文件 {video_path} 不存在。")
+            return
+        
+        if pixel_format not in RAWVIDEO_PIXEL_FORMATS:
+            print(f"错误：不支持的像素格式 {pixel_format}。")
+            return
+        
+        video_stream = self.converter._get_video_stream(self.converter.get_media_info(video_path))
+        if not video_stream:
+            print(f"错误：无法读取 {video_path} 的视频流信息。")
+            return
+        
+        # rawvideo没有帧头，必须预先确定输出尺寸
+        if size:
+            width, height = size
+        else:
+            source_width, source_height = self.converter._get_display_size(video_stream)
+            width = max(1, int(source_width * scale))
+            height = max(1, int(source_height * scale))
+        
+        filters = []
+        if fps > 0:
+            filters.append(f"fps={fps}")
+        filters.append(f"scale={width}:{height}")
+        filters.append("showinfo")
+        
+        # showinfo以info级别输出，不能使用-v error
+        cmd = [self.converter.ffmpeg_path, "-hide_banner", "-nostats"]
+        if start_time > 0:
+            cmd.extend(["-ss", str(start_time)])
+        cmd.extend(["-i", video_path])
+        if duration > 0:
+            cmd.extend(["-t", str(duration)])
+        cmd.extend([
+            "-vf", ",".join(filters),
+            "-an", "-sn", "-vsync", "0",
+            "-f", "rawvideo", "-pix_fmt", pixel_format, "pipe:1"
+        ])
+        
+        yield from self.converter._iter_rawvideo_frames(
+            cmd, width, height, cancel_token, pixel_format=pixel_format,
+            frame_rate=fps or video_stream.get("frame_rate", 0), start_time=start_time, showinfo=True
+        )
+    
+    @instrumented
+    def create_contact_sheet(self, video_path: str, output_path: str,
+                             columns: int = 4, rows: int = 4, thumb_width: int = 320,
+                             padding: int = 4, background: str = "black",
+                             keyframes_only: bool = False, quality: int = 85,
+                             progress_callback: Callable[[float], None] = None,
+                             cancel_token: Optional[CancellationToken] = None) -> ConversionResult:
+        """
+        生成视频缩略图（按时间均匀分布的columns x rows帧拼成一张图片）
+        
+        只解码一次视频，select滤镜选出各时间点的帧并由FFmpeg缩小到缩略图尺寸，
+        通过rawvideo管道读入后直接贴到预先分配的画布上
+        
+        Args:
+            video_path: 视频文件路径
+            output_path: 输出图片路径
+            columns: 每行缩略图数
+            rows: 行数
+            thumb_width: 单个缩略图宽度，高度按视频宽高比计算
+            padding: 缩略图之间和四周的间距（像素）
+            background: 背景颜色
+            keyframes_only: 只解码关键帧，速度快得多，但每格显示的是时间点之后的第一个关键帧
+            quality: JPEG/WebP输出质量
+            progress_callback: 进度回调函数
+            cancel_token: 取消令牌
+            
+        Returns:
+            ConversionResult: 转换结果，成功时为真值，被取消时cancelled为True
+        """
+        if not self.converter.is_ffmpeg_available():
+            print("错误：未找到FFmpeg。请确保FFmpeg已安装并添加到系统路径。")
+            return ConversionResult(False)
+        
+        if not os.path.isfile(video_path):
+            print(f"错误：视频文件 {video_path} 不存在。")
+            return ConversionResult(False)
+        
+        try:
+            media_info = self.converter.get_media_info(video_path)
+            video_stream = self.converter._get_video_stream(media_info)
+            duration = media_info.get("duration", 0)
+            if not video_stream or duration <= 0:
+                print(f"错误：无法读取 {video_path} 的视频流信息。")
+                return ConversionResult(False)
+            
+            source_width, source_height = self.converter._get_display_size(video_stream)
+            thumb_height = max(1, round(thumb_width * source_height / max(1, source_width)))
+            
+            # 时间点取各等分区间的中点，避开片头和片尾的黑场
+            count = columns * rows
+            schedule = [duration * (i + 0.5) / count for i in range(count)]
+            offset = schedule[0]
+            targets = [t - offset for t in schedule]
+            
+            cmd = [self.converter.ffmpeg_path, "-hide_banner", "-nostats"]
+            if keyframes_only:
+                cmd.extend(["-skip_frame", "nokey"])
+            cmd.extend(["-ss", f"{offset:.6f}", "-t", f"{targets[-1] + 2:.6f}", "-i", video_path])
+            cmd.extend([
+                "-vf", f"{self._select_filter(targets)},scale={thumb_width}:{thumb_height},showinfo",
+                "-an", "-sn", "-vsync", "0",
+                "-f", "rawvideo", "-pix_fmt", "rgb24", "pipe:1"
+            ])
+            
+            canvas = Image.new(
+                "RGB",
+                (columns * thumb_width + (columns + 1) * padding, rows * thumb_height + (rows + 1) * padding),
+                background
+            )
+            
+            index = 0
+            for frame in self.converter._iter_rawvideo_frames(
+                    cmd, thumb_width, thumb_height, cancel_token, showinfo=True):
+                if frame.timestamp is None:
+                    next_index = index + 1
+                else:
+                    next_index = max(index + 1, self._match_targets(targets, frame.timestamp, index))
+                
+                image = frame.to_image()
+                for cell in range(index, min(next_index, count)):
+                    row, column = divmod(cell, columns)
+                    canvas.paste(image, (
+                        padding + column * (thumb_width + padding),
+                        padding + row * (thumb_height + padding)
+                    ))
+                index = next_index
+                
+                if progress_callback:
+                    progress_callback(min(0.99, index / count))
+                if index >= count:
+                    break
+            
+            if cancel_token and cancel_token.is_cancelled:
+                return self.converter._cancelled_result()
+            
+            if index == 0:
+                print("错误：未能读取到视频帧。")
+                return ConversionResult(False)
+            
+            os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+            canvas.save(output_path, quality=quality)
+            
+            if progress_callback:
+                progress_callback(1.0)
+            
+            return ConversionResult(True)
+            
+        except Exception as e:
+            print(f"生成视频缩略图出错: {str(e)}")
+            return ConversionResult(False)
+    
+    @instrumented
     def extract_frames_sequence(self, video_path: str, output_dir: str,
                                start_time: float = 0, duration: float = 0,
                                fps: int = 1, output_format: str = "jpg") -> List[str]:
@@ -743,7 +3315,7 @@ class VideoTimestampExtractor:
             cmd.append(output_pattern)
             
             # 执行FFmpeg
-            process = subprocess.run(cmd, capture_output=True, text=True)
+            process = self.converter._run_process(cmd)
             
             if process.returncode != 0:
                 print(f"FFmpeg错误: {process.stderr}")